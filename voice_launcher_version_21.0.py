@@ -6,14 +6,46 @@ import subprocess
 import webbrowser
 import datetime
 import psutil
-from fuzzywuzzy import process
+from fuzzywuzzy import fuzz, process
 import requests
 import google.generativeai as genai
 import time # Import time for sleep
 import json # Import json module for structured memory
 import threading # For non-blocking operations like playsound
+import hashlib # For content-hash keys in the summary cache
+import concurrent.futures # For concurrent map-stage summarization
+import csv # For bulk note import/export
+import re # For parsing the legacy memory text format
+import argparse # For command-line maintenance entry points (import/export, benchmarks)
+import tempfile # For benchmark scratch files
+import sys # For string interning of note categories
+import tracemalloc # For memory benchmarks
+import heapq # For the alarm/timer scheduler's queue of pending triggers
+import itertools # For scheduler tie-breaking sequence numbers
+import bisect # For range queries on the time-sorted calendar index
+import gzip # For the compressed calendar archive
+import random # For the generated date/time parser benchmark corpus
+import contextlib # For the store lock context manager
+import ctypes # For inotify store change notifications (Linux)
+import ctypes.util
+import select # For waiting on inotify events
+import struct # For decoding inotify events
+import colorsys # For Hue hue/saturation <-> xy colour conversion
+import http.server # For the fake Hue Bridge used by the client benchmark
+import uuid # For fake Hue Bridge v2 resource ids
+import math # For sunrise/sunset times in automation rules
+import collections # For counting scheduler events in the automation simulation
+import urllib.parse # For the fake device hub's query strings
 
 # --- NEW IMPORTS FOR ENHANCED FEATURES ---
+# For cross-process locking of the memory and calendar files (not available on Windows)
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    print("Warning: 'fcntl' is not available on this platform. Memory and calendar files will not be locked against other processes.")
+    FCNTL_AVAILABLE = False
+
 # For General Music Playback (basic local file playback)
 try:
     from playsound import playsound
@@ -58,6 +90,19 @@ except Exception as e:
     print(f"Error importing pycaw: {e}. Windows volume control commands may not work.")
     PYCAW_AVAILABLE = False
 
+# For in-process PulseAudio volume control on Linux (optional - without it, one long-lived 'pactl subscribe' is used)
+# You'll need to install it: pip install pulsectl
+try:
+    if platform.system() == "Linux":
+        import pulsectl
+        PULSECTL_AVAILABLE = True
+    else:
+        PULSECTL_AVAILABLE = False
+except ImportError:
+    print("Warning: 'pulsectl' not installed. Linux volume control will use pactl.")
+    print("To install: pip install pulsectl")
+    PULSECTL_AVAILABLE = False
+
 # For Spotify Control (Requires 'spotipy')
 # You'll need to install it: pip install spotipy
 try:
@@ -72,6 +117,17 @@ except Exception as e:
     print(f"Error importing spotipy: {e}. Spotify control commands may not work.")
     SPOTIPY_AVAILABLE = False
 
+# For pooled, retrying connections to the Hue Bridge (urllib3 is installed with requests)
+try:
+    import urllib3
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+    URLLIB3_AVAILABLE = True
+except ImportError:
+    print("Warning: 'urllib3' not available. Hue Bridge requests will not be retried on errors.")
+    print("To install: pip install urllib3")
+    URLLIB3_AVAILABLE = False
+
 # For Advanced NLP (NLTK for sentiment analysis)
 try:
     import nltk
@@ -98,9 +154,25 @@ GLOBAL_CONFIG = {
     "SPEECH_RATE": 170, # Words per minute (adjust as desired)
     "MEMORY_FILE": "jarvis_memory.json", # Changed to JSON file for structured memory
     "CALENDAR_FILE": "jarvis_calendar.json", # File to store calendar events/reminders
+    "CALENDAR_ARCHIVE_FILE": "jarvis_calendar_archive.jsonl.gz", # Compressed archive of finished calendar entries
+    "CALENDAR_ARCHIVE_AFTER_HOURS": 24, # Completed/fired entries older than this move to the archive
+    "CALENDAR_HISTORY_DAYS": 30, # How far back "show reminder history" looks
+    "CALENDAR_IMPORT_BATCH_SIZE": 5000, # Events written per batch during .ics imports
+    "PERSIST_FLUSH_DELAY_SECONDS": 1.0, # Saves are coalesced and written at most this long after a change
+    "DEFAULT_EVENT_DURATION_MINUTES": 60, # Used when no length is given for a new event
+    "FREE_TIME_DAY_START_HOUR": 8, # "When am I free" searches between these hours
+    "FREE_TIME_DAY_END_HOUR": 20,
+    "SUMMARY_CACHE_FILE": "jarvis_summary_cache.json", # Cached Gemini summaries, keyed by content hash
+    "MEMORY_SUMMARY_TOKEN_BUDGET": 3000, # Max (approximate) tokens of notes included in a memory summary
+    "MEMORY_SUMMARY_CHUNK_TOKENS": 750, # Approximate tokens per chunk in the map stage of summarization
+    "MEMORY_SUMMARY_WORKERS": 4, # Concurrent Gemini calls during the map stage
+    "MEMORY_SUMMARY_MAX_ROUNDS": 4, # Map/reduce rounds before the remaining partial summaries are truncated to one prompt
+    "MEMORY_IMPORT_BATCH_SIZE": 5000, # Notes buffered per write during bulk import
     "JARVIS_NAME": "Jarvis", # Define Jarvis's name
     "FUZZY_MATCH_THRESHOLD": 75, # Confidence score for command recognition (0-100)
     "HOTWORD": "hey jarvis", # The hotword to listen for
+    "CLOSE_GRACE_SECONDS": 3, # "Close <app>": how long all its processes get to exit before being killed
+    "CLOSE_KILL_WAIT_SECONDS": 2, # How long to wait for killed processes to disappear
     # Spotify API Configuration (Requires Spotify Developer Account & App Setup)
     # UNCOMMENT AND FILL THESE FOR SPOTIFY FUNCTIONALITY:
     "SPOTIFY_CLIENT_ID": "YOUR_SPOTIFY_CLIENT_ID", # Replace with your Spotify App Client ID
@@ -109,11 +181,67 @@ GLOBAL_CONFIG = {
     "SPOTIPY_SCOPE": "user-read-playback-state user-modify-playback-state", # Required permissions for playback control
     # Path to your local music directory for general music playback
     "LOCAL_MUSIC_DIRECTORY": os.path.join(os.path.expanduser("~"), "Music"), # Example: C:\Users\YourUser\Music or /home/YourUser/Music
-    # Philips Hue Smart Home Integration (Simulated)
+    "VOLUME_RAMP_SECONDS": 0.4, # Linux: volume commands glide to the new level over this long instead of jumping
+    "VOLUME_TICK_MS": 20, # Step interval of volume fades
+    "VOLUME_CONFIRM_SECONDS": 2.0, # Linux: how long a volume command waits for the sound server to confirm the change
+    "DUCKING_ENABLED": True, # Linux: lower other apps' audio while Jarvis listens or speaks
+    "DUCK_LEVEL_PERCENT": 30, # Ducked apps play at this share of their own volume
+    "DUCK_FADE_SECONDS": 0.15, # How quickly other audio ducks
+    "DUCK_RESTORE_SECONDS": 0.6, # How gently it comes back afterwards
+    "DUCK_EXCLUDE_APPS": ["espeak", "speech-dispatcher", "aplay"], # Playback streams never ducked (Jarvis's own voice)
+    # Philips Hue Smart Home Integration (simulated unless HUE_MODE is "bridge")
     # For a REAL implementation, you would need to find your Hue Bridge IP and generate a username.
     # See README.md for instructions.
     "HUE_BRIDGE_IP": "192.168.1.100", # Replace with your actual Hue Bridge IP address
-    "HUE_USERNAME": "your_hue_username" # Replace with your generated Hue username
+    "HUE_USERNAME": "your_hue_username", # Replace with your generated Hue username
+    "HUE_MODE": "simulated", # "simulated" (no hardware) or "bridge" (talk to HUE_BRIDGE_IP)
+    "HUE_API_VERSION": 1, # 1 for the classic /api/<username> API, 2 for CLIP v2 (/clip/v2, HTTPS)
+    "HUE_REQUEST_TIMEOUT_SECONDS": 3.0, # Per-request connect/read timeout for the bridge
+    "HUE_REQUEST_RETRIES": 2, # Retries for connection errors and 5xx answers from the bridge
+    "HUE_COMMANDS_PER_SECOND": 10, # The bridge's sustained command rate; batched light updates are held to it
+    "HUE_COMMAND_BURST": 2, # Commands that may go out back to back before the rate limit applies
+    "HUE_MAX_PARALLEL_REQUESTS": 4, # Concurrent requests to the bridge when fanning out per-light updates
+    "HUE_STATE_CACHE_TTL_SECONDS": 30, # How long cached light state answers questions and suppresses no-op writes
+    "HUE_CATALOG_CACHE_TTL_SECONDS": 300, # How long cached room and scene lists are used for name lookups
+    "HUE_NAME_ALIASES": {"reading lamp": "Desk Light", "lounge": "Living Room"}, # Extra spoken names -> light, room or scene name
+    # Thermostats and locks, through a device hub (simulated unless DEVICE_HUB_MODE is "hub")
+    "DEVICE_HUB_MODE": "simulated", # "simulated" (no hardware) or "hub" (an HTTP device hub at DEVICE_HUB_URL, see README.md)
+    "DEVICE_HUB_URL": "http://192.168.1.101:8080",
+    "DEVICE_BATCH_WINDOW_MS": 20, # Device commands issued within this window go to the hub in one request
+    "DEVICE_COMMAND_TIMEOUT_SECONDS": 5.0, # How long to wait for a device to acknowledge a command
+    "THERMOSTAT_RANGE_CELSIUS": [10, 30], # Set points outside this range are refused
+    # Routines: say the name to run every step. Steps run in parallel unless "after" lists steps they must wait for.
+    # Actions: lights (target, on, brightness, color), scene (scene), volume (level/mute/unmute),
+    # spotify (command: play/pause/next/previous), music (command: stop_playback, ...), thermostat (temperature),
+    # locks (locked, default true), wait (seconds)
+    "ROUTINES": {
+        "movie mode": [
+            {"id": "living room", "action": "lights", "target": "living room", "brightness": 20},
+            {"id": "kitchen", "action": "lights", "target": "kitchen", "on": False},
+            {"id": "volume", "action": "volume", "level": 30},
+            {"id": "spotify", "action": "spotify", "command": "pause"},
+        ],
+        "good night": [
+            {"id": "music", "action": "music", "command": "stop_playback"},
+            {"id": "lights", "action": "lights", "target": "all lights", "on": False},
+            {"id": "nightlight", "action": "scene", "scene": "nightlight", "after": ["lights"]},
+            {"id": "doors", "action": "locks", "locked": True},
+        ],
+    },
+    # Automation rules: "when" holds one trigger, "do" lists steps run in order (any routine action, plus
+    # say (text), routine (routine) and command (a smart-home voice command, e.g. "turn on the desk light")).
+    # Triggers: {"at": "07:00", "recurrence": RRULE (default daily)}, {"sun": "sunset", "offset_minutes": -15},
+    # {"metric": "cpu_percent"/"memory_percent"/"disk_percent", "above" or "below": N, "for_seconds": N},
+    # {"calendar": "alarm"/"timer"/"any", "text": "words in the entry"}. Say text can use {value} and {text}.
+    "LATITUDE": -33.87, # Used for sunrise/sunset rules
+    "LONGITUDE": 151.21,
+    "AUTOMATION_METRIC_SAMPLE_SECONDS": 10, # How often metric rules read CPU/memory/disk (only when a rule uses them)
+    "AUTOMATION_RULES": [
+        {"name": "lamp at sunset", "when": {"sun": "sunset"}, "do": [{"action": "lights", "target": "living room lamp", "on": True}]},
+        {"name": "high cpu", "when": {"metric": "cpu_percent", "above": 90, "for_seconds": 60},
+         "do": [{"action": "say", "text": "CPU usage has been over 90 percent for a minute. It's at {value:.0f} percent."}]},
+        {"name": "wake-up light", "when": {"calendar": "alarm", "text": "wake"}, "do": [{"action": "command", "command": "turn on the bedroom light"}]},
+    ]
 }
 # --- END GLOBAL CONFIGURATION ---
 
@@ -300,6 +428,7 @@ COMMANDS = {
     "read my notes": {"type": "memory_command", "action": "read_all"},
     "show my notes": {"type": "memory_command", "action": "read_all"},
     "summarize my memories": {"type": "memory_command", "action": "summarize"},
+    "summarize notes in category": {"type": "memory_command", "action": "summarize_category"},
     "forget note": {"type": "memory_command", "action": "delete"},
     "delete note": {"type": "memory_command", "action": "delete"},
     "clear all notes": {"type": "memory_command", "action": "clear_all"},
@@ -350,10 +479,15 @@ COMMANDS = {
     "mark event complete": {"type": "calendar_reminder", "action": "mark_complete"}, # New
     "set a timer for": {"type": "calendar_reminder", "action": "set_timer"}, # New
     "set an alarm for": {"type": "calendar_reminder", "action": "set_alarm"}, # New
+    "set a repeating alarm for": {"type": "calendar_reminder", "action": "set_repeating_alarm"},
+    "add repeating reminder": {"type": "calendar_reminder", "action": "add_repeating_reminder"},
     "show timers": {"type": "calendar_reminder", "action": "show_timers"}, # New
     "show alarms": {"type": "calendar_reminder", "action": "show_alarms"}, # New
     "cancel timer": {"type": "calendar_reminder", "action": "cancel_timer"}, # New
     "cancel alarm": {"type": "calendar_reminder", "action": "cancel_alarm"}, # New
+    "show reminder history": {"type": "calendar_reminder", "action": "show_history"},
+    "show completed reminders": {"type": "calendar_reminder", "action": "show_history"},
+    "when am i free": {"type": "calendar_reminder", "action": "find_free_time"},
 
 
     # Smart Home Integration (Simulated Philips Hue)
@@ -370,6 +504,12 @@ COMMANDS = {
     "lock doors": {"type": "smart_home_control", "action": "lock_doors"},
     "unlock doors": {"type": "smart_home_control", "action": "unlock_doors"},
     "get light status": {"type": "smart_home_control", "action": "get_light_status_specific"}, # New for specific light
+    "activate scene": {"type": "smart_home_control", "action": "activate_scene"}, # Recalls a Hue scene in one group action
+    "set the scene to": {"type": "smart_home_control", "action": "activate_scene"},
+
+    # Routines (defined in GLOBAL_CONFIG["ROUTINES"]; each routine's name is a command too)
+    "run routine": {"type": "routine", "action": "run"},
+    "list routines": {"type": "routine", "action": "list"},
 
     # Music Playback Control (General - now includes basic local file playback)
     "play local music": {"type": "general_music_control", "action": "play_local"},
@@ -379,12 +519,17 @@ COMMANDS = {
 }
 
 # --- Speech Functions ---
+_speech_local = threading.local() # Per-thread speech settings; 'muted' skips the TTS engine (used by simulations)
+
 def speak(text):
     """Converts text to speech using the initialized engine."""
     print(f"[{GLOBAL_CONFIG['JARVIS_NAME']}]: {text}")
+    if getattr(_speech_local, "muted", False):
+        return
     try:
-        engine.say(text)
-        engine.runAndWait()
+        with volume_automation.ducked("speak"):
+            engine.say(text)
+            engine.runAndWait()
     except Exception as e:
         print(f"[Speech Error] Could not synthesize speech: {e}")
 
@@ -400,7 +545,8 @@ def listen_command(prompt="Listening...", timeout_seconds=5, phrase_time_limit_s
         r.energy_threshold = 4000 # Adjust this value if it's too sensitive or not sensitive enough
         r.dynamic_energy_threshold = True
         try:
-            audio = r.listen(source, timeout=timeout_seconds, phrase_time_limit=phrase_time_limit_seconds)
+            with volume_automation.ducked("listen"):
+                audio = r.listen(source, timeout=timeout_seconds, phrase_time_limit=phrase_time_limit_seconds)
         except sr.WaitTimeoutError:
             print("[Speech Recognition] No speech detected within timeout.")
             return ""
@@ -523,52 +669,73 @@ def open_application(app_target, feedback_name, fallback_exe=None):
         print(f"[Error] Unexpected error opening {app_target}: {e}")
 
 
-def close_application(process_name_to_close, feedback_name):
+def _process_snapshot():
+    """One pass over the process table: lowercase process name -> [psutil.Process]. Jarvis itself is left out."""
+    snapshot = collections.defaultdict(list)
+    own_pid = os.getpid()
+    for proc in psutil.process_iter(['name']):
+        name = proc.info['name']
+        if name and proc.pid != own_pid:
+            snapshot[name.lower()].append(proc)
+    return snapshot
+
+def _stop_processes(procs, grace_seconds=None):
     """
-    Closes applications more robustly on Windows by first sending a WM_CLOSE message
-    for graphical applications, then by terminating/killing processes.
+    Terminates all of `procs` at once and waits for them together, returning as soon as the last one
+    exits (at most `grace_seconds`). Survivors are then killed in one batch.
+    Returns (stopped, still_running, access_denied) lists of processes.
     """
-    if platform.system() != "Windows":
-        speak("This close command is optimized for Windows and may not work as expected on this operating system.")
-        print("[Info] Note: close_application is primarily for Windows.")
-        found_and_attempted = False
-        for proc in psutil.process_iter(['name', 'pid']):
+    if grace_seconds is None:
+        grace_seconds = GLOBAL_CONFIG["CLOSE_GRACE_SECONDS"]
+    signalled, denied = [], []
+    for proc in procs:
+        try:
+            proc.terminate()
+            signalled.append(proc)
+        except psutil.NoSuchProcess:
+            signalled.append(proc) # Already gone; wait_procs reports it as stopped
+        except psutil.AccessDenied:
+            denied.append(proc)
+    stopped, alive = psutil.wait_procs(signalled, timeout=grace_seconds)
+    if alive:
+        print(f"[Action] {len(alive)} process(es) ignored the termination request. Killing them.")
+        for proc in alive:
             try:
-                if proc.info['name'].lower() == process_name_to_close.lower():
-                    speak(f"{GLOBAL_CONFIG['JARVIS_NAME']} is attempting to terminate {feedback_name} (PID: {proc.pid}).")
-                    proc.terminate()
-                    proc.wait(timeout=3)
-                    if proc.is_running():
-                        proc.kill()
-                    found_and_attempted = True
-                    break
-            except (psutil.NoSuchProcess, psutil.AccessDenied) as e:
-                print(f"[Error] Access or process error during close attempt for {process_name_to_close}: {e}")
-                pass # Continue searching
-        if found_and_attempted:
-            speak(f"{feedback_name} close attempt completed by {GLOBAL_CONFIG['JARVIS_NAME']}.")
-        else:
-            speak(f"{GLOBAL_CONFIG['JARVIS_NAME']} could not find any running instances of {feedback_name} to close.")
+                proc.kill()
+            except psutil.NoSuchProcess:
+                pass
+            except psutil.AccessDenied:
+                denied.append(proc)
+        killed, alive = psutil.wait_procs(alive, timeout=GLOBAL_CONFIG["CLOSE_KILL_WAIT_SECONDS"])
+        stopped += killed
+    return stopped, alive, denied
+
+def close_application(process_name_to_close, feedback_name, grace_seconds=None):
+    """
+    Closes every running instance of an application, found in a single snapshot of the process table.
+    On Windows, graphical instances are first asked to close (WM_CLOSE); whatever is still running after
+    the grace period is terminated, and then killed, all at once rather than one process at a time.
+    """
+    if grace_seconds is None:
+        grace_seconds = GLOBAL_CONFIG["CLOSE_GRACE_SECONDS"]
+    process_name_to_close_lower = process_name_to_close.lower()
+    procs = _process_snapshot().get(process_name_to_close_lower, [])
+    if not procs:
+        speak(f"{GLOBAL_CONFIG['JARVIS_NAME']} could not find any running instances of {feedback_name} to close.")
+        print(f"[Info] No running instances found for: {process_name_to_close}")
         return
 
     speak(f"{GLOBAL_CONFIG['JARVIS_NAME']} is attempting to close {feedback_name}...")
-    closed_any = False
-    process_name_to_close_lower = process_name_to_close.lower()
-    
-    if WINDOWS_GUI_AVAILABLE:
+    print(f"[Action] Closing {len(procs)} instance(s) of {process_name_to_close}.")
+    if platform.system() == "Windows" and WINDOWS_GUI_AVAILABLE:
+        pids = {proc.pid for proc in procs}
+        asked = set()
         def enum_windows_callback(hwnd, extra):
-            try:
-                pid = win32process.GetWindowThreadProcessId(hwnd)[1]
-                proc_info = psutil.Process(pid)
-                if proc_info.name().lower() == process_name_to_close_lower:
-                    if win32gui.IsWindowVisible(hwnd) and win32gui.IsWindowEnabled(hwnd):
-                        print(f"[Action] Found window for {proc_info.name()} (PID: {pid}). Sending WM_CLOSE.")
-                        win32gui.SendMessage(hwnd, win32con.WM_CLOSE, 0, 0)
-                        nonlocal closed_any
-                        closed_any = True
-            except (psutil.NoSuchProcess, psutil.AccessDenied) as e:
-                print(f"[Error] Window enumeration error: {e}")
-                pass
+            pid = win32process.GetWindowThreadProcessId(hwnd)[1]
+            if pid in pids and win32gui.IsWindowVisible(hwnd) and win32gui.IsWindowEnabled(hwnd):
+                print(f"[Action] Found window for {process_name_to_close} (PID: {pid}). Sending WM_CLOSE.")
+                win32gui.PostMessage(hwnd, win32con.WM_CLOSE, 0, 0) # Posted, so one hung window doesn't hold up the rest
+                asked.add(pid)
 
         try:
             win32gui.EnumWindows(enum_windows_callback, None)
@@ -576,53 +743,86 @@ def close_application(process_name_to_close, feedback_name):
             print(f"[Error] Error during EnumWindows call: {e}")
             speak(f"An error occurred while {GLOBAL_CONFIG['JARVIS_NAME']} was trying to find windows to close.")
 
-        if closed_any:
-            time.sleep(2) # Give some time for graceful close
+        if asked:
+            # Returns as soon as the last asked window's process exits, instead of a fixed pause
+            _, still_open = psutil.wait_procs([proc for proc in procs if proc.pid in asked], timeout=grace_seconds)
+            procs = [proc for proc in procs if proc.pid not in asked] + still_open
+
+    _, still_running, denied = _stop_processes(procs, grace_seconds)
+    if denied:
+        speak(f"Access denied to close {feedback_name}. Please try running {GLOBAL_CONFIG['JARVIS_NAME']} as administrator for this command.")
+        print(f"[Error] AccessDenied: Could not terminate {process_name_to_close} (PIDs: {', '.join(str(proc.pid) for proc in denied)}).")
+    if still_running or denied:
+        speak(f"Some instances of {feedback_name} might still be running.")
+        print(f"[Info] {len(still_running) + len(denied)} instance(s) of {process_name_to_close} might still be running.")
+    else:
+        speak(f"{feedback_name} closed successfully.")
+        print(f"[Action] Successfully closed: {process_name_to_close}")
 
-    still_running_pids = []
-    for proc in psutil.process_iter(['name', 'pid']):
-        try:
-            if proc.info['name'].lower() == process_name_to_close_lower:
-                if proc.is_running():
-                    still_running_pids.append(proc.info['pid'])
-                    
-                    speak(f"Found {proc.info['name']} (PID: {proc.pid}). {GLOBAL_CONFIG['JARVIS_NAME']} is attempting graceful termination...")
+def benchmark_close_application(helper_count=20, stubborn_count=4, grace_seconds=0.5):
+    """
+    Starts `helper_count` helper processes under one name (`stubborn_count` of them ignore termination,
+    like a hung helper) and closes them, first the old way (one process_iter walk, terminate and wait for
+    each process in turn, then kill) and then with close_application. Checks nothing is left running.
+    """
+    helper_name = "jarvis-helper"
+    helper_code = ("import signal, sys, time\n"
+                   "if sys.argv[1] == 'stubborn': signal.signal(signal.SIGTERM, signal.SIG_IGN)\n"
+                   "print('ready', flush=True)\n"
+                   "time.sleep(60)\n")
+    with tempfile.TemporaryDirectory(prefix="jarvis-close-") as scratch:
+        helper = os.path.join(scratch, helper_name)
+        os.symlink(sys.executable, helper) # The process takes the link's name, so it can be found by name
+        def start_helpers():
+            children = [subprocess.Popen([helper, "-c", helper_code, "stubborn" if i < stubborn_count else "polite"],
+                                         stdout=subprocess.PIPE, text=True) for i in range(helper_count)]
+            for child in children:
+                child.stdout.readline()
+            return children
+        def leftovers(children):
+            for child in children:
+                try:
+                    child.wait(timeout=1)
+                except subprocess.TimeoutExpired:
+                    pass
+                child.stdout.close()
+            running = [child for child in children if child.returncode is None]
+            for child in running:
+                child.kill()
+                child.wait()
+            return len(running)
+
+        children = start_helpers()
+        started = time.perf_counter()
+        for proc in psutil.process_iter(['name', 'pid']):
+            try:
+                if proc.info['name'] and proc.info['name'].lower() == helper_name:
                     proc.terminate()
-                    proc.wait(timeout=3)
-                    
+                    try:
+                        proc.wait(timeout=grace_seconds)
+                    except psutil.TimeoutExpired:
+                        pass
                     if proc.is_running():
                         proc.kill()
-                    
-                    closed_any = True
-
-        except psutil.NoSuchProcess:
-            pass
-        except psutil.AccessDenied:
-            speak(f"Access denied to close {proc.info['name']}. Please try running {GLOBAL_CONFIG['JARVIS_NAME']} as administrator for this command.")
-            print(f"[Error] AccessDenied: Could not terminate process {proc.info['name']} (PID: {proc.pid}).")
-            closed_any = True
-            continue
-        except Exception as e:
-            print(f"[Error] Error while {GLOBAL_CONFIG['JARVIS_NAME']} was trying to close {proc.info['name']} (PID: {proc.pid}): {e}")
-            continue
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                pass
+        old_seconds = time.perf_counter() - started
+        old_left = leftovers(children)
 
-    if closed_any:
-        speak(f"{feedback_name} close attempt completed by {GLOBAL_CONFIG['JARVIS_NAME']}.")
-        final_check_running = False
-        for proc in psutil.process_iter(['name']):
-            if proc.info['name'].lower() == process_name_to_close_lower:
-                final_check_running = True
-                break
-        
-        if final_check_running:
-            speak(f"Some instances of {feedback_name} might still be running.")
-            print(f"[Info] Some instances of {process_name_to_close} might still be running.")
-        else:
-            speak(f"{feedback_name} closed successfully.")
-            print(f"[Action] Successfully closed: {process_name_to_close}")
-    else:
-        speak(f"{GLOBAL_CONFIG['JARVIS_NAME']} could not find any running instances of {feedback_name} to close, or it's a non-closable system process.")
-        print(f"[Info] No running instances found or not closable for: {process_name_to_close}")
+        children = start_helpers()
+        _speech_local.muted = True
+        try:
+            started = time.perf_counter()
+            close_application(helper_name, "the helpers", grace_seconds=grace_seconds)
+            new_seconds = time.perf_counter() - started
+        finally:
+            _speech_local.muted = False
+        new_left = leftovers(children)
+
+    print(f"[Close Benchmark] {helper_count} processes ({stubborn_count} ignoring termination), {grace_seconds:.1f} s grace period.")
+    print(f"[Close Benchmark] One at a time: {old_seconds:.2f} s, {old_left} left running.")
+    print(f"[Close Benchmark] All at once:   {new_seconds:.2f} s, {new_left} left running ({old_seconds / new_seconds:.1f}x faster).")
+    return old_left == 0 and new_left == 0 and new_seconds < old_seconds
 
 def close_active_window():
     """Closes the currently active window on Windows."""
@@ -692,16 +892,490 @@ def set_system_volume_windows(level=None, change_by=None, mute=False, unmute=Fal
         return False # Indicate failure
 
 # --- Cross-Platform Volume Control (Enhanced Implementation) ---
+# --- Linux Volume Backends (cached sink state instead of a pactl call per change) ---
+_PACTL_ENV = dict(os.environ, LC_ALL="C") # pactl's output is parsed, so keep it unlocalized
+
+class PactlVolumeBackend:
+    """
+    Volume and mute of the default PulseAudio/PipeWire sink and of each playback stream, kept in a
+    cache that one long-lived 'pactl subscribe' process keeps current, so reading the volume never
+    spawns a process. Writes
+    update the cache at once and are handed to a background thread, which sends only the latest
+    value when several arrive while a pactl call is running (as during a fade), so a fade reaches the
+    server in as many steps as pactl calls fit into it, not one per tick. A failed sink write is
+    remembered until the next write of the same setting succeeds, so flush() can report it.
+    """
+    def __init__(self, pactl="pactl"):
+        self.pactl = pactl
+        self.spawn_count = 0 # pactl processes started, for the benchmark
+        self.on_applied = None # Optional on_applied(key, value, applied_at) hook, called once the server has a value
+        self._cond = threading.Condition()
+        self._volume, self._muted = self._read()
+        self._wanted = {} # "volume"/"mute"/("stream", id) -> value still to be written
+        self._failed = {} # "volume"/"mute" -> error of its last write, if that failed
+        self._busy = False
+        self._stale = False
+        self._streams = None # Playback streams, read on demand: {id: (volume percent, application name)}
+        self._running = True
+        self._subscriber = subprocess.Popen([pactl, "subscribe"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, env=_PACTL_ENV)
+        threading.Thread(target=self._watch, name="pactl-subscribe", daemon=True).start()
+        threading.Thread(target=self._write_loop, name="pactl-writer", daemon=True).start()
+
+    def _run(self, *args):
+        self.spawn_count += 1
+        return subprocess.run([self.pactl, *args], capture_output=True, text=True, check=True, env=_PACTL_ENV).stdout
+
+    def _read(self):
+        """Asks the server for the default sink's volume and mute state. Raises ValueError if the output can't be parsed."""
+        volume = re.search(r"(\d+)%", self._run("get-sink-volume", "@DEFAULT_SINK@"))
+        mute = re.search(r"Mute:\s*(yes|no)", self._run("get-sink-mute", "@DEFAULT_SINK@"))
+        if not volume or not mute:
+            raise ValueError("unexpected pactl output")
+        return int(volume.group(1)), mute.group(1) == "yes"
+
+    def get(self):
+        """(volume percent, muted) from the cache."""
+        with self._cond:
+            return self._volume, self._muted
+
+    def set_volume(self, level):
+        with self._cond:
+            self._volume = self._wanted["volume"] = max(0, min(100, int(round(level))))
+            self._cond.notify_all()
+
+    def set_mute(self, muted):
+        with self._cond:
+            self._muted = self._wanted["mute"] = bool(muted)
+            self._cond.notify_all()
+
+    def media_streams(self):
+        """{stream id: (volume percent, application name)} for every playback stream, re-read only after the server reports a stream change."""
+        with self._cond:
+            if self._streams is not None:
+                return dict(self._streams)
+        streams = {}
+        for block in self._run("list", "sink-inputs").split("Sink Input #")[1:]:
+            volume = re.search(r"Volume:.*?(\d+)%", block)
+            app = re.search(r'application\.name = "([^"]*)"', block)
+            if volume:
+                streams[int(block.split(None, 1)[0])] = (int(volume.group(1)), app.group(1) if app else "")
+        with self._cond:
+            for key, value in self._wanted.items(): # Changes not yet sent win over what was read
+                if key[0] == "stream" and key[1] in streams:
+                    streams[key[1]] = (value, streams[key[1]][1])
+            self._streams = streams
+            return dict(streams)
+
+    def set_stream_volume(self, stream_id, level):
+        with self._cond:
+            level = self._wanted[("stream", stream_id)] = max(0, min(100, int(round(level))))
+            if self._streams is not None and stream_id in self._streams:
+                self._streams[stream_id] = (level, self._streams[stream_id][1])
+            self._cond.notify_all()
+
+    def flush(self, timeout=5.0, keys=("volume", "mute")):
+        """
+        Waits until every requested change has been sent. Returns False on timeout, or if the last
+        write of one of `keys` ("volume", "mute") failed (see write_error).
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while (self._wanted or self._busy) and time.monotonic() < deadline:
+                self._cond.wait(deadline - time.monotonic())
+            return not (self._wanted or self._busy or any(key in self._failed for key in keys))
+
+    def write_error(self, key):
+        """Why the last write of the sink's "volume" or "mute" failed, or None if it went through."""
+        with self._cond:
+            return self._failed.get(key)
+
+    def _watch(self):
+        for line in self._subscriber.stdout:
+            if " on sink #" in line or " on server" in line: # Volume/mute change, or a new default sink
+                with self._cond:
+                    self._stale = True
+                    self._cond.notify_all()
+            elif " on sink-input #" in line: # A stream started, stopped or changed; re-read when next asked
+                with self._cond:
+                    self._streams = None
+
+    def _write_loop(self):
+        while True:
+            with self._cond:
+                while self._running and not self._wanted and not self._stale:
+                    self._cond.wait()
+                if not self._running:
+                    return
+                wanted, self._wanted = self._wanted, {}
+                refresh = not wanted # Writes first; re-read only once things are quiet
+                if refresh:
+                    self._stale = False
+                self._busy = True
+            state, errors = None, {} # key -> error of its write, None if it went through
+            for key, value in wanted.items():
+                try:
+                    if key == "volume":
+                        self._run("set-sink-volume", "@DEFAULT_SINK@", f"{value}%")
+                    elif key == "mute":
+                        self._run("set-sink-mute", "@DEFAULT_SINK@", "1" if value else "0")
+                    else:
+                        self._run("set-sink-input-volume", str(key[1]), f"{value}%")
+                    errors[key] = None
+                    if self.on_applied:
+                        self.on_applied(key, value, time.monotonic())
+                except (OSError, subprocess.CalledProcessError) as e:
+                    print(f"[Volume Error] pactl failed: {e}") # e.g. the stream ended meanwhile
+                    errors[key] = str(e)
+            if refresh:
+                try:
+                    state = self._read()
+                except (OSError, subprocess.CalledProcessError, ValueError) as e:
+                    print(f"[Volume Error] pactl failed: {e}")
+            with self._cond:
+                if state is not None and not self._wanted: # A newer local change wins over what was read
+                    self._volume, self._muted = state
+                for key, error in errors.items():
+                    if key in ("volume", "mute") and error:
+                        self._failed[key] = error
+                    elif key in ("volume", "mute"):
+                        self._failed.pop(key, None)
+                self._busy = False
+                self._cond.notify_all()
+
+    def close(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        self._subscriber.terminate()
+        self._subscriber.wait()
+
+class PulsectlVolumeBackend:
+    """
+    Volume and mute of the default sink over a persistent PulseAudio connection (pulsectl). A second
+    connection listens for sink and server events on a background thread and refreshes the cache,
+    so reading the volume never talks to the server and a change is one round trip, with no process.
+    """
+    def __init__(self):
+        self._pulse = pulsectl.Pulse("jarvis-volume")
+        self._events = pulsectl.Pulse("jarvis-volume-events")
+        self._lock = threading.Lock()
+        self._inputs = {} # Playback streams from the last media_streams(), by index
+        self._failed = {} # "volume"/"mute" -> error of its last write, if that failed
+        self.on_applied = None # Optional on_applied(key, value, applied_at) hook, called once the server has a value
+        self._event_seen = False
+        self._running = True
+        self._refresh(self._pulse)
+        self._events.event_mask_set("sink", "server")
+        self._events.event_callback_set(self._on_event)
+        threading.Thread(target=self._listen, name="pulse-events", daemon=True).start()
+
+    def _refresh(self, pulse):
+        sink = pulse.get_sink_by_name(pulse.server_info().default_sink_name)
+        with self._lock:
+            self._sink, self._volume, self._muted = sink, int(round(sink.volume.value_flat * 100)), bool(sink.mute)
+
+    def _on_event(self, event):
+        self._event_seen = True
+        raise pulsectl.PulseLoopStop # Leave event_listen so the listener can query the server
+
+    def _listen(self):
+        while self._running:
+            try:
+                self._events.event_listen(timeout=1.0)
+                if self._event_seen and self._running:
+                    self._event_seen = False
+                    self._refresh(self._events)
+            except pulsectl.PulseError as e:
+                print(f"[Volume Error] PulseAudio event listener failed: {e}")
+                time.sleep(1.0)
+
+    def get(self):
+        """(volume percent, muted) from the cache."""
+        with self._lock:
+            return self._volume, self._muted
+
+    def set_volume(self, level):
+        level = max(0, min(100, int(round(level))))
+        with self._lock: # pulsectl connections aren't thread-safe
+            self._write("volume", self._pulse.volume_set_all_chans, self._sink, level / 100.0)
+            self._volume = level
+        if self.on_applied:
+            self.on_applied("volume", level, time.monotonic())
+
+    def set_mute(self, muted):
+        with self._lock:
+            self._write("mute", self._pulse.mute, self._sink, bool(muted))
+            self._muted = bool(muted)
+        if self.on_applied:
+            self.on_applied("mute", bool(muted), time.monotonic())
+
+    def _write(self, key, method, *args):
+        """Calls `method`, remembering a failure for flush(). Caller holds the lock."""
+        try:
+            method(*args)
+        except pulsectl.PulseError as e:
+            self._failed[key] = str(e)
+            raise
+        self._failed.pop(key, None)
+
+    def media_streams(self):
+        """{stream id: (volume percent, application name)} for every playback stream (one round trip)."""
+        with self._lock:
+            self._inputs = {sink_input.index: sink_input for sink_input in self._pulse.sink_input_list()}
+            return {index: (int(round(sink_input.volume.value_flat * 100)), sink_input.proplist.get("application.name", ""))
+                    for index, sink_input in self._inputs.items()}
+
+    def set_stream_volume(self, stream_id, level):
+        with self._lock:
+            sink_input = self._inputs.get(stream_id)
+            if sink_input is not None:
+                try:
+                    self._pulse.volume_set_all_chans(sink_input, max(0, min(100, int(round(level)))) / 100.0)
+                except pulsectl.PulseOperationFailed:
+                    pass # The stream ended meanwhile
+
+    def flush(self, timeout=5.0, keys=("volume", "mute")):
+        """Changes are sent synchronously; returns False if the last write of one of `keys` failed."""
+        with self._lock:
+            return not any(key in self._failed for key in keys)
+
+    def write_error(self, key):
+        """Why the last write of the sink's "volume" or "mute" failed, or None if it went through."""
+        with self._lock:
+            return self._failed.get(key)
+
+    def close(self):
+        self._running = False
+        self._events.event_listen_stop()
+        self._pulse.close()
+        self._events.close()
+
+_volume_backend = None
+_volume_backend_lock = threading.Lock()
+
+def get_volume_backend():
+    """The Linux volume backend, created on first use: pulsectl if installed and reachable, else 'pactl subscribe'."""
+    global _volume_backend
+    with _volume_backend_lock:
+        if _volume_backend is None and PULSECTL_AVAILABLE:
+            try:
+                _volume_backend = PulsectlVolumeBackend()
+            except Exception as e:
+                print(f"[Volume] Could not connect to PulseAudio with pulsectl ({e}); using pactl.")
+        if _volume_backend is None:
+            _volume_backend = PactlVolumeBackend()
+        return _volume_backend
+
+def use_volume_backend(backend):
+    """Replaces the Linux volume backend (e.g. with one on a fake sound server). Returns the previous one."""
+    global _volume_backend
+    with _volume_backend_lock:
+        previous, _volume_backend = _volume_backend, backend
+    return previous
+
+# --- Volume Automation (fades and ducking on one background tick) ---
+class VolumeAutomation:
+    """
+    Runs volume fades on one background tick thread, so "increase volume" glides instead of jumping,
+    and ducks other applications' playback streams while Jarvis listens or speaks, fading them back
+    afterwards. Streams in DUCK_EXCLUDE_APPS (Jarvis's own voice) are left alone. Starting levels
+    come from the volume backend's cache, and the thread sleeps whenever nothing is fading.
+    """
+    def __init__(self, backend=None, tick_seconds=None):
+        self._backend = backend # None: whatever get_volume_backend() returns
+        self.tick_seconds = tick_seconds or GLOBAL_CONFIG["VOLUME_TICK_MS"] / 1000.0
+        self.available = platform.system() == "Linux" or backend is not None
+        self.trace = None # Optional trace(kind, key, value, scheduled, actual) hook, used by the ramp benchmark
+        self._fades = {} # "sink" or ("stream", id) -> {"from", "to", "began", "ends", "value", "done"}
+        self._duck_reasons = collections.Counter() # "listen"/"speak" -> nesting depth
+        self._ducked = False # Whether streams are (being) ducked; only the tick thread changes it
+        self._saved = {} # stream id -> level before ducking
+        self._cond = threading.Condition()
+        self._thread = None
+        self._running = True
+
+    def _get_backend(self):
+        return self._backend or get_volume_backend()
+
+    def _ensure_thread_locked(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="volume-automation", daemon=True)
+            self._thread.start()
+
+    def level(self, key="sink"):
+        """Where the sink or a stream is heading: a running fade's target, else its cached level."""
+        with self._cond:
+            if key in self._fades:
+                return self._fades[key]["to"]
+        backend = self._get_backend()
+        return backend.get()[0] if key == "sink" else backend.media_streams()[key[1]][0]
+
+    def fade(self, key, target, seconds, start=None):
+        """
+        Fades the sink ("sink") or a playback stream (("stream", id)) to `target` percent over `seconds`,
+        from wherever it is now (mid-fade included). Returns a threading.Event that is set when it ends.
+        """
+        with self._cond:
+            running = self._fades.get(key)
+        if running is not None:
+            start = running["value"]
+        elif start is None:
+            backend = self._get_backend()
+            start = backend.get()[0] if key == "sink" else backend.media_streams()[key[1]][0]
+        done = threading.Event()
+        began = time.monotonic()
+        with self._cond:
+            previous = self._fades.get(key)
+            self._fades[key] = {"from": start, "to": max(0, min(100, int(round(target)))), "began": began,
+                                "ends": began + max(0.0, seconds), "value": start, "done": done}
+            self._ensure_thread_locked()
+            self._cond.notify_all()
+        if previous is not None:
+            previous["done"].set() # Superseded
+        return done
+
+    def duck(self, reason):
+        with self._cond:
+            self._duck_reasons[reason] += 1
+            self._ensure_thread_locked()
+            self._cond.notify_all()
+
+    def restore(self, reason):
+        with self._cond:
+            self._duck_reasons[reason] -= 1
+            if self._duck_reasons[reason] <= 0:
+                del self._duck_reasons[reason]
+            self._cond.notify_all()
+
+    @contextlib.contextmanager
+    def ducked(self, reason):
+        """Ducks other applications' audio for the duration of the block (no-op when ducking is off or unavailable)."""
+        if not (GLOBAL_CONFIG["DUCKING_ENABLED"] and self.available):
+            yield
+            return
+        self.duck(reason)
+        try:
+            yield
+        finally:
+            self.restore(reason)
+
+    def wait_idle(self, timeout=5.0):
+        """Waits until no fade is running and ducking matches the current reasons. Returns False on timeout."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while (self._fades or self._ducked != bool(self._duck_reasons)) and time.monotonic() < deadline:
+                self._cond.wait(deadline - time.monotonic())
+            return not self._fades and self._ducked == bool(self._duck_reasons)
+
+    def _apply_ducking(self, duck):
+        """Starts the fades that duck or restore other applications' streams. Runs on the tick thread."""
+        streams = self._get_backend().media_streams() # If this fails, the sound server can't be reached at all
+        if duck:
+            excluded = [name.lower() for name in GLOBAL_CONFIG["DUCK_EXCLUDE_APPS"]]
+            for stream_id, (volume, app) in streams.items():
+                if any(name in app.lower() for name in excluded):
+                    continue
+                key = ("stream", stream_id)
+                with self._cond:
+                    saved = self._saved.setdefault(stream_id, self._fades[key]["to"] if key in self._fades else volume)
+                self.fade(key, saved * GLOBAL_CONFIG["DUCK_LEVEL_PERCENT"] / 100.0, GLOBAL_CONFIG["DUCK_FADE_SECONDS"], start=volume)
+        else:
+            with self._cond:
+                saved, self._saved = self._saved, {}
+            for stream_id, level in saved.items():
+                key = ("stream", stream_id)
+                if stream_id not in streams: # Ended while ducked (next track, closed tab)
+                    with self._cond:
+                        fade = self._fades.pop(key, None)
+                    if fade is not None:
+                        fade["done"].set()
+                    continue
+                try:
+                    self.fade(key, level, GLOBAL_CONFIG["DUCK_RESTORE_SECONDS"], start=streams[stream_id][0])
+                except Exception as e:
+                    print(f"[Volume Error] Could not restore stream {stream_id}: {e}")
+
+    def _write(self, key, value):
+        backend = self._get_backend()
+        if key == "sink":
+            backend.set_volume(value)
+        else:
+            backend.set_stream_volume(key[1], value)
+
+    def _run(self):
+        next_tick = time.monotonic()
+        while True:
+            with self._cond:
+                while self._running and not self._fades and self._ducked == bool(self._duck_reasons):
+                    self._cond.wait()
+                    next_tick = time.monotonic()
+                if not self._running:
+                    return
+                duck = bool(self._duck_reasons)
+            if duck != self._ducked:
+                try:
+                    self._apply_ducking(duck)
+                except Exception as e: # Only listing the streams can get here: no sound server to talk to
+                    self.available = False # Don't retry on every listen/speak
+                    print(f"[Volume Error] Could not duck other audio, ducking disabled: {e}")
+                with self._cond:
+                    self._ducked = duck
+                    self._cond.notify_all()
+
+            scheduled, now = next_tick, time.monotonic()
+            writes, finished = [], []
+            with self._cond:
+                for key, fade in list(self._fades.items()):
+                    ended = now >= fade["ends"]
+                    progress = 1.0 if ended else (now - fade["began"]) / (fade["ends"] - fade["began"])
+                    value = int(round(fade["from"] + (fade["to"] - fade["from"]) * progress))
+                    if value != fade["value"] or ended:
+                        writes.append((key, value, "end" if ended else "tick", fade["ends"] if ended else scheduled))
+                        fade["value"] = value
+                    if ended:
+                        del self._fades[key]
+                        finished.append(fade["done"])
+            for key, value, kind, due in writes:
+                try:
+                    self._write(key, value)
+                except Exception as e:
+                    print(f"[Volume Error] Could not set {key} to {value}%: {e}")
+                if self.trace:
+                    self.trace(kind, key, value, due, now)
+            for done in finished:
+                done.set()
+
+            with self._cond:
+                if finished:
+                    self._cond.notify_all()
+                now = time.monotonic()
+                next_tick += self.tick_seconds
+                if next_tick < now:
+                    next_tick = now + self.tick_seconds # Fell behind; skip the missed ticks rather than burst
+                ends = [fade["ends"] for fade in self._fades.values()]
+                wake = min([next_tick] + [end for end in ends if end > now])
+                if self._fades and wake > now:
+                    self._cond.wait(wake - now)
+                if ends and wake < next_tick:
+                    next_tick = wake # Fade ends are honoured exactly, not rounded up to a tick
+
+    def close(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+
+volume_automation = VolumeAutomation()
+
 def set_cross_platform_volume(level=None, change_by=None, mute=False, unmute=False):
     """
-    Controls system volume across platforms (Windows, macOS, Linux).
+    Controls system volume across platforms (Windows, macOS, Linux). Returns True if the change was made.
     """
     current_os = platform.system()
     try:
         if current_os == "Windows":
             # Delegate to existing Windows-specific pycaw function
             if set_system_volume_windows(level=level, change_by=change_by, mute=mute, unmute=unmute):
-                return # If Windows specific function handled it, we are done
+                return True # If Windows specific function handled it, we are done
             else:
                 # If pycaw failed, try generic method (less reliable)
                 print("[Info] pycaw failed or not available, attempting generic Windows volume control.")
@@ -713,24 +1387,24 @@ def set_cross_platform_volume(level=None, change_by=None, mute=False, unmute=Fal
                         subprocess.run(['nircmd', 'setsysvolume', str(int(level * 655.35))]) # 0-65535 range
                         speak(f"Volume set to {level} percent using generic method.")
                         print(f"[Action] Generic Windows volume set to {level}%.")
-                        return
+                        return True
                     except FileNotFoundError:
                         print("[Error] nircmd not found. Generic Windows volume control failed.")
                     except Exception as e:
                         print(f"[Error] Generic Windows volume control error: {e}")
                 speak("Windows volume control failed. Please check pycaw installation or try manually.")
-                return
+                return False
 
         elif current_os == "Darwin": # macOS
             if mute:
-                subprocess.run(['osascript', '-e', 'set volume with output muted'])
+                subprocess.run(['osascript', '-e', 'set volume with output muted'], check=True)
                 speak("Volume muted on macOS.")
             elif unmute:
-                subprocess.run(['osascript', '-e', 'set volume without output muted'])
+                subprocess.run(['osascript', '-e', 'set volume without output muted'], check=True)
                 speak("Volume unmuted on macOS.")
             elif level is not None:
                 # macOS volume is 0-100, so direct mapping is fine
-                subprocess.run(['osascript', '-e', f'set volume output volume {level}'])
+                subprocess.run(['osascript', '-e', f'set volume output volume {level}'], check=True)
                 speak(f"Volume set to {level} percent on macOS.")
             elif change_by is not None:
                 # To implement relative change, you need to get the current volume first.
@@ -745,64 +1419,322 @@ def set_cross_platform_volume(level=None, change_by=None, mute=False, unmute=Fal
                 except FileNotFoundError:
                     speak("osascript command not found. Cannot adjust volume on macOS.")
                     print("[Error] osascript not found for macOS volume control.")
+                    return False
                 except subprocess.CalledProcessError as e:
                     speak(f"Error adjusting volume on macOS: {e}. Check permissions or system settings.")
                     print(f"[Error] osascript error: {e}")
+                    return False
                 except ValueError:
                     speak("Could not parse current volume on macOS. Please try setting a specific level.")
                     print("[Error] Could not parse macOS volume output.")
+                    return False
             print(f"[Action] macOS volume control attempted.")
+            return True
 
         elif current_os == "Linux":
-            # Assumes PulseAudio is in use (most common modern Linux setup)
-            # For ALSA directly, 'amixer set Master 50%' might work without '-D pulse'
+            # PulseAudio or PipeWire's pulse server; the backend caches the sink state, so only changes reach the server
+            backend = get_volume_backend()
+            confirm_seconds = GLOBAL_CONFIG["VOLUME_CONFIRM_SECONDS"]
+            message, key = None, "mute" if mute or unmute else "volume"
             if mute:
-                subprocess.run(['pactl', 'set-sink-mute', '@DEFAULT_SINK@', '1'])
-                speak("Volume muted on Linux.")
+                backend.set_mute(True)
+                message = "Volume muted on Linux."
             elif unmute:
-                subprocess.run(['pactl', 'set-sink-mute', '@DEFAULT_SINK@', '0'])
-                speak("Volume unmuted on Linux.")
+                backend.set_mute(False)
+                message = "Volume unmuted on Linux."
             elif level is not None:
-                subprocess.run(['pactl', 'set-sink-volume', '@DEFAULT_SINK@', f'{level}%'])
-                speak(f"Volume set to {level} percent on Linux.")
+                volume_automation.fade("sink", level, GLOBAL_CONFIG["VOLUME_RAMP_SECONDS"]).wait(GLOBAL_CONFIG["VOLUME_RAMP_SECONDS"] + confirm_seconds)
+                message = f"Volume set to {level} percent on Linux."
             elif change_by is not None:
-                # To implement relative change, you need to get the current volume first.
-                # This is a conceptual implementation of getting current volume and setting.
-                try:
-                    result = subprocess.run(['pactl', 'get-sink-volume', '@DEFAULT_SINK@'], capture_output=True, text=True, check=True)
-                    output_lines = result.stdout.splitlines()
-                    current_volume_line = [line for line in output_lines if "Volume:" in line and "%" in line]
-                    if current_volume_line:
-                        current_volume_str = current_volume_line[0].split('/')[-2].strip().replace('%', '')
-                        current_volume = int(current_volume_str)
-                        new_volume = max(0, min(100, current_volume + change_by))
-                        subprocess.run(['pactl', 'set-sink-volume', '@DEFAULT_SINK@', f'{new_volume}%'], check=True)
-                        speak(f"Volume adjusted by {change_by} percent on Linux. Current volume is now {new_volume} percent.")
-                        print(f"[Action] Linux volume changed by {change_by}%. Current: {new_volume}%.")
-                    else:
-                        speak("Could not parse current volume on Linux. Please try setting a specific level.")
-                        print("[Error] Could not parse Linux volume output.")
-                except FileNotFoundError:
-                    speak("pactl command not found. Cannot adjust volume on Linux.")
-                    print("[Error] pactl not found for Linux volume control.")
-                except subprocess.CalledProcessError as e:
-                    speak(f"Error adjusting volume on Linux: {e}. Check permissions or system settings.")
-                    print(f"[Error] pactl error: {e}")
-                except ValueError:
-                    speak("Could not parse current volume on Linux. Please try setting a specific level.")
-                    print("[Error] Could not parse Linux volume output.")
+                current_volume = volume_automation.level("sink") # A running fade's target, so repeated commands add up
+                new_volume = max(0, min(100, current_volume + change_by))
+                volume_automation.fade("sink", new_volume, GLOBAL_CONFIG["VOLUME_RAMP_SECONDS"]).wait(GLOBAL_CONFIG["VOLUME_RAMP_SECONDS"] + confirm_seconds)
+                message = f"Volume adjusted by {change_by} percent on Linux. Current volume is now {new_volume} percent."
+                print(f"[Action] Linux volume changed by {change_by}%. Current: {new_volume}%.")
+            # Writes go out in the background, so only the server's answer says whether the change was made
+            if message and not backend.flush(confirm_seconds, keys=(key,)):
+                speak("The sound server did not accept the volume change.")
+                print(f"[Error] Linux volume control failed: {backend.write_error(key) or 'no answer from the sound server'}")
+                return False
+            if message:
+                speak(message)
             print(f"[Action] Linux volume control attempted.")
+            return True
         else:
             speak(f"Cross-platform volume control is not implemented for your operating system ({current_os}).")
             print(f"[Info] Unsupported OS for cross-platform volume: {current_os}")
+            return False
 
     except FileNotFoundError:
         speak(f"System command for volume control not found on {current_os}. Please ensure necessary audio utilities are installed (e.g., 'osascript' on macOS, 'pactl' or 'amixer' on Linux).")
         print(f"[Error] Volume control command not found for {current_os}.")
+        return False
     except Exception as e:
         speak(f"An error occurred during cross-platform volume control: {e}.")
         print(f"[Error] Cross-platform volume control error: {e}")
+        return False
+
 
+# --- Fake Sound Server and Volume Benchmark ---
+_FAKE_PACTL_SCRIPT = """#!{python}
+import json, os, re, sys, time
+STATE, EVENTS = {state!r}, {events!r}
+
+def load():
+    with open(STATE) as f:
+        return json.load(f)
+
+def save(sink, facility="sink #0"):
+    with open(STATE + ".tmp", "w") as f:
+        json.dump(sink, f)
+    os.replace(STATE + ".tmp", STATE)
+    with open(EVENTS, "a") as f:
+        f.write(f"Event 'change' on {{facility}}\\n")
+
+def volume_line(volume):
+    raw = round(volume * 65536 / 100)
+    return f"Volume: front-left: {{raw}} / {{volume:>3}}% / 0.00 dB,   front-right: {{raw}} / {{volume:>3}}% / 0.00 dB"
+
+def new_volume(current, text):
+    amount = int(re.sub(r"[^0-9]", "", text))
+    return max(0, min(150, current + amount if text[0] == "+" else current - amount if text[0] == "-" else amount))
+
+command, args = sys.argv[1], sys.argv[2:]
+if command == "get-sink-volume":
+    print(volume_line(load()["volume"]))
+    print("        balance 0.00")
+elif command == "get-sink-mute":
+    print("Mute: " + ("yes" if load()["muted"] else "no"))
+elif command == "set-sink-volume":
+    sink = load()
+    sink["volume"] = new_volume(sink["volume"], args[1])
+    save(sink)
+elif command == "list" and args == ["sink-inputs"]:
+    for stream_id, stream in load()["inputs"].items():
+        print(f"Sink Input #{{stream_id}}")
+        print("\\tDriver: protocol-native.c")
+        print("\\t" + volume_line(stream["volume"]))
+        print("\\tProperties:")
+        print(f'\\t\\tapplication.name = "{{stream["name"]}}"')
+        print()
+elif command == "set-sink-input-volume":
+    sink = load()
+    if args[0] not in sink["inputs"]:
+        sys.exit(f"fake pactl: no sink input {{args[0]}}")
+    sink["inputs"][args[0]]["volume"] = new_volume(sink["inputs"][args[0]]["volume"], args[1])
+    save(sink, f"sink-input #{{args[0]}}")
+elif command == "set-sink-mute":
+    sink = load()
+    sink["muted"] = not sink["muted"] if args[1] == "toggle" else args[1] in ("1", "yes", "true")
+    save(sink)
+elif command == "subscribe":
+    with open(EVENTS) as f:
+        f.seek(0, 2)
+        while True:
+            line = f.readline()
+            if line:
+                sys.stdout.write(line)
+                sys.stdout.flush()
+            else:
+                time.sleep(0.005)
+else:
+    sys.exit(f"fake pactl: unsupported command {{command}}")
+"""
+
+class FakeSoundServer:
+    """
+    Stand-in for a PulseAudio server, for exercising the pactl backend without audio hardware.
+    start() writes a 'pactl' script into a scratch directory that handles get/set-sink-volume,
+    get/set-sink-mute, list sink-inputs, set-sink-input-volume and subscribe, keeping the default
+    sink and its playback streams in a JSON file. Every change is appended to an event log that
+    'subscribe' follows, like the server's event stream.
+    """
+    def __init__(self, volume=50, muted=False):
+        self._initial = {"volume": volume, "muted": muted, "inputs": {}}
+        self._dir = None
+
+    def start(self):
+        """Creates the scratch server and returns the path of its pactl."""
+        self._dir = tempfile.TemporaryDirectory(prefix="fake-pulse-")
+        self._state = os.path.join(self._dir.name, "sink.json")
+        self._events = os.path.join(self._dir.name, "events.log")
+        with open(self._state, "w") as f:
+            json.dump(self._initial, f)
+        open(self._events, "w").close()
+        pactl = os.path.join(self._dir.name, "pactl")
+        with open(pactl, "w") as f:
+            f.write(_FAKE_PACTL_SCRIPT.format(python=sys.executable, state=self._state, events=self._events))
+        os.chmod(pactl, 0o755)
+        return pactl
+
+    def state(self):
+        with open(self._state) as f:
+            return json.load(f)
+
+    def _save(self, sink, event):
+        with open(self._state + ".tmp", "w") as f:
+            json.dump(sink, f)
+        os.replace(self._state + ".tmp", self._state)
+        with open(self._events, "a") as f:
+            f.write(event + "\n")
+
+    def set_external(self, volume=None, muted=None):
+        """Changes the sink as another application would, with the matching event."""
+        sink = self.state()
+        if volume is not None:
+            sink["volume"] = volume
+        if muted is not None:
+            sink["muted"] = muted
+        self._save(sink, "Event 'change' on sink #0")
+
+    def add_stream(self, name, volume=100):
+        """Starts a playback stream for application `name`. Returns its id."""
+        sink = self.state()
+        stream_id = max((int(key) for key in sink["inputs"]), default=0) + 1
+        sink["inputs"][str(stream_id)] = {"volume": volume, "name": name}
+        self._save(sink, f"Event 'new' on sink-input #{stream_id}")
+        return stream_id
+
+    def remove_stream(self, stream_id):
+        """Ends a playback stream, as when a track ends or a browser tab is closed."""
+        sink = self.state()
+        del sink["inputs"][str(stream_id)]
+        self._save(sink, f"Event 'remove' on sink-input #{stream_id}")
+
+    def stop(self):
+        if self._dir:
+            self._dir.cleanup()
+            self._dir = None
+
+def benchmark_volume_backend(change_count=50):
+    """
+    Makes `change_count` relative volume changes against a fake sound server, first the old way
+    (pactl get-sink-volume, parse, pactl set-sink-volume) and then through PactlVolumeBackend's cache.
+    Checks the server ends at the right volume and that a change made by another application reaches
+    the cache through the subscribe stream.
+    """
+    server = FakeSoundServer(volume=50)
+    pactl = server.start()
+    try:
+        samples = []
+        for i in range(change_count):
+            change_by = 1 if i % 2 == 0 else -1
+            started = time.perf_counter()
+            output = subprocess.run([pactl, "get-sink-volume", "@DEFAULT_SINK@"], capture_output=True, text=True, check=True).stdout
+            current_volume = int([line for line in output.splitlines() if "Volume:" in line][0].split('/')[-2].strip().replace('%', ''))
+            subprocess.run([pactl, "set-sink-volume", "@DEFAULT_SINK@", f"{max(0, min(100, current_volume + change_by))}%"], check=True)
+            samples.append(time.perf_counter() - started)
+        old_mean_ms, old_p95_ms = _latency_summary(samples)
+        old_ok = server.state()["volume"] == 50
+
+        backend = PactlVolumeBackend(pactl)
+        try:
+            spawns_before = backend.spawn_count
+            samples = []
+            for i in range(change_count):
+                started = time.perf_counter()
+                current_volume, _ = backend.get()
+                backend.set_volume(current_volume + 5)
+                samples.append(time.perf_counter() - started)
+            flushed = backend.flush()
+            new_mean_ms, new_p95_ms = _latency_summary(samples)
+            new_ok = flushed and server.state()["volume"] == 100 and backend.get()[0] == 100
+            spawns = backend.spawn_count - spawns_before
+
+            server.set_external(volume=35, muted=True)
+            started = time.perf_counter()
+            while backend.get() != (35, True) and time.perf_counter() - started < 5:
+                time.sleep(0.001)
+            event_ms = (time.perf_counter() - started) * 1000
+            event_ok = backend.get() == (35, True)
+        finally:
+            backend.close()
+    finally:
+        server.stop()
+
+    print(f"[Volume Benchmark] pactl per change: mean {old_mean_ms:.2f} ms, p95 {old_p95_ms:.2f} ms, {2 * change_count} processes.")
+    print(f"[Volume Benchmark]     cached:       mean {new_mean_ms:.4f} ms, p95 {new_p95_ms:.4f} ms, {spawns} processes in the background "
+          f"(server {'at' if new_ok else 'NOT at'} the final volume).")
+    print(f"[Volume Benchmark] Outside change seen by the cache after {event_ms:.0f} ms ({'OK' if event_ok else 'MISSED'}).")
+    return old_ok and new_ok and event_ok and new_p95_ms < 1.0
+
+def benchmark_volume_ramp(fade_count=10):
+    """
+    Runs `fade_count` volume fades through VolumeAutomation against a fake sound server, measuring how
+    late each fade step and each fade's final step leave the tick thread relative to their schedule,
+    and how many of those steps, and how late, actually reach the server through the backend. Checks
+    that every fade moves one way and the server ends at the last target. Then ducks a music stream while
+    "listening" and restores it, checking that Jarvis's own speech stream is never touched and that a
+    stream ending while ducked doesn't keep the others from being restored.
+    """
+    server = FakeSoundServer(volume=20)
+    pactl = server.start()
+    backend = PactlVolumeBackend(pactl)
+    automation = VolumeAutomation(backend)
+    tick_lateness, end_lateness, server_lateness = [], [], []
+    scheduled_at, applied = {}, [] # This fade's sink values -> when due; (value, when the server got it)
+    def trace(kind, key, value, scheduled, actual):
+        (end_lateness if kind == "end" else tick_lateness).append(actual - scheduled)
+        if key == "sink":
+            scheduled_at[value] = scheduled
+    def on_applied(key, value, applied_at):
+        if key == "volume":
+            applied.append((value, applied_at))
+    automation.trace = trace
+    backend.on_applied = on_applied
+    try:
+        fade_seconds = GLOBAL_CONFIG["VOLUME_RAMP_SECONDS"]
+        monotonic_ok, target, server_steps = True, 20, 0
+        for i in range(fade_count):
+            scheduled_at.clear()
+            applied.clear()
+            target = 80 if i % 2 == 0 else 20
+            automation.fade("sink", target, fade_seconds).wait(fade_seconds + 5)
+            backend.flush() # The fade's last value may still be on its way to the server
+            values = list(scheduled_at)
+            server_values = [value for value, _ in applied]
+            monotonic_ok = (monotonic_ok and values == sorted(values, reverse=target == 20) and values[-1] == target
+                            and server_values == sorted(server_values, reverse=target == 20) and server_values[-1] == target)
+            server_lateness += [applied_at - scheduled_at[value] for value, applied_at in applied]
+            server_steps += len(server_values)
+        ramp_ok = backend.flush() and server.state()["volume"] == target and monotonic_ok
+        writes = len(tick_lateness) + len(end_lateness)
+        tick_mean_ms, tick_p95_ms = _latency_summary(tick_lateness)
+        end_mean_ms, end_p95_ms = _latency_summary(end_lateness)
+        server_mean_ms, server_p95_ms = _latency_summary(server_lateness)
+
+        music = server.add_stream("Spotify", 90)
+        voice = server.add_stream("aplay", 100)
+        browser = server.add_stream("Firefox", 80) # Closed while Jarvis is listening
+        with automation.ducked("listen"):
+            automation.wait_idle()
+            backend.flush()
+            ducked = server.state()["inputs"]
+            server.remove_stream(browser)
+            deadline = time.monotonic() + 5
+            while browser in backend.media_streams() and time.monotonic() < deadline: # Until the removal event reaches the cache
+                time.sleep(0.001)
+        automation.wait_idle()
+        backend.flush()
+        restored = server.state()["inputs"]
+        expected_duck = int(round(90 * GLOBAL_CONFIG["DUCK_LEVEL_PERCENT"] / 100.0))
+        duck_ok = (ducked[str(music)]["volume"] == expected_duck and restored[str(music)]["volume"] == 90
+                   and ducked[str(voice)]["volume"] == restored[str(voice)]["volume"] == 100 and automation.available)
+    finally:
+        automation.close()
+        backend.close()
+        server.stop()
+
+    print(f"[Volume Ramp Benchmark] {fade_count} fades of {fade_seconds * 1000:.0f} ms, {writes} steps from the tick thread, "
+          f"{server_steps} distinct values received by the server ({server_steps / fade_count:.1f} per fade; "
+          f"{'monotonic, server at the final target' if ramp_ok else 'WRONG values'}).")
+    print(f"[Volume Ramp Benchmark] Tick thread lateness: steps mean {tick_mean_ms:.2f} ms, p95 {tick_p95_ms:.2f} ms; "
+          f"fade ends mean {end_mean_ms:.2f} ms, p95 {end_p95_ms:.2f} ms.")
+    print(f"[Volume Ramp Benchmark] At the server ({type(backend).__name__}): values applied mean {server_mean_ms:.1f} ms, "
+          f"p95 {server_p95_ms:.1f} ms after they were due.")
+    print(f"[Volume Ramp Benchmark] Ducking: music {ducked[str(music)]['volume']}% while listening, back to {restored[str(music)]['volume']}%; "
+          f"a stream that ended meanwhile skipped; {'speech stream untouched' if duck_ok else 'FAILED'}.")
+    return ramp_ok and duck_ok and end_p95_ms < GLOBAL_CONFIG["VOLUME_TICK_MS"]
 
 def control_system_power(action):
     """Controls system power (shutdown, restart, sleep) with confirmation."""
@@ -1061,18 +1993,299 @@ def perform_dynamic_search(user_command_raw, search_engine_type):
         speak(f"An unexpected error occurred during the search operation.")
         print(f"[Error] Unexpected error during search for '{query}' on {search_engine_type}: {e}")
 
+# --- Cross-Process Store Locking and Change Feed ---
+# Several processes (a second assistant, the CLI import/export tools) may share the JSON stores. Writers take an
+# advisory lock, check that the file is still the version they last read, and merge by ID if it is not.
+def _file_signature(path):
+    """Cheap change marker for a file: (modification time, size), or None if missing."""
+    try:
+        stat = os.stat(path)
+        return (stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        return None
+
+@contextlib.contextmanager
+def _store_lock(path):
+    """Holds an exclusive advisory lock for `path` (on a side '.lock' file, since the store itself is replaced by rename)."""
+    if not FCNTL_AVAILABLE:
+        yield
+        return
+    with open(path + ".lock", "a") as lock_file:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+def _merge_entries_by_id(theirs, ours, base_ids, resolve):
+    """
+    Three-way merge of two versions of a store, where `base_ids` are the IDs this process last read from disk.
+    Their additions are kept, our deletions (base IDs we no longer have) and theirs (base IDs missing on disk)
+    are applied, `resolve(their_entry, our_entry)` settles entries both sides have, and when both sides added
+    different entries under the same new ID ours is renumbered.
+    """
+    ours_by_id = {entry['id']: entry for entry in ours}
+    merged = {}
+    for entry in theirs:
+        entry_id = entry['id']
+        if entry_id in ours_by_id:
+            merged[entry_id] = resolve(entry, ours_by_id[entry_id]) if entry_id in base_ids else entry
+        elif entry_id not in base_ids:
+            merged[entry_id] = entry # Added by the other process
+    next_id = max(itertools.chain(merged, ours_by_id), default=0) + 1
+    for entry_id, entry in ours_by_id.items():
+        if entry_id in base_ids:
+            continue # Already resolved, or deleted on disk
+        if entry_id in merged and merged[entry_id] != entry:
+            print(f"[Persistence] ID {entry_id} was added by two processes at once; renumbering ours to {next_id}.")
+            entry = dict(entry, id=next_id)
+            next_id += 1
+        merged[entry['id']] = entry
+    return [merged[entry_id] for entry_id in sorted(merged)]
+
+class StoreChangeWatcher:
+    """
+    Change feed for the JSON stores using Linux inotify (through ctypes, so no extra packages). Watches the
+    stores' directories and calls a file's callbacks as soon as it is rewritten. Where inotify isn't
+    available, start() returns False and stores keep comparing file signatures on access.
+    """
+    IN_CLOSE_WRITE = 0x008
+    IN_MOVED_TO = 0x080
+    IN_DELETE = 0x200
+    EVENT_HEADER = struct.Struct("iIII") # wd, mask, cookie, name length
+
+    def __init__(self):
+        self._callbacks = {} # absolute path -> list of callback(path)
+        self._directories = {} # watch descriptor -> directory
+        self._fd = None
+        self._wakeup = None
+        self._thread = None
+
+    def watch(self, path, callback):
+        self._callbacks.setdefault(os.path.abspath(path), []).append(callback)
+
+    def start(self):
+        if platform.system() != "Linux" or not self._callbacks or self._thread is not None:
+            return False
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            fd = libc.inotify_init1(os.O_CLOEXEC)
+            if fd < 0:
+                raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+            for directory in {os.path.dirname(path) for path in self._callbacks}:
+                wd = libc.inotify_add_watch(fd, directory.encode(), self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_DELETE)
+                if wd < 0:
+                    os.close(fd)
+                    raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for '{directory}'")
+                self._directories[wd] = directory
+        except (OSError, AttributeError) as e:
+            print(f"[Store Watcher] Change notifications unavailable ({e}). Falling back to checking files on access.")
+            return False
+        self._fd = fd
+        self._wakeup = os.pipe()
+        self._thread = threading.Thread(target=self._run, name="store-watcher", daemon=True)
+        self._thread.start()
+        print(f"[Store Watcher] Watching {len(self._callbacks)} store files for changes by other processes.")
+        return True
+
+    def _run(self):
+        while True:
+            readable, _, _ = select.select([self._fd, self._wakeup[0]], [], [])
+            if self._wakeup[0] in readable:
+                return
+            data = os.read(self._fd, 64 * 1024)
+            changed = set()
+            offset = 0
+            while offset < len(data):
+                wd, _, _, name_length = self.EVENT_HEADER.unpack_from(data, offset)
+                offset += self.EVENT_HEADER.size
+                name = data[offset:offset + name_length].rstrip(b"\0").decode("utf-8", "replace")
+                offset += name_length
+                changed.add(os.path.join(self._directories.get(wd, ""), name))
+            for path in changed: # One callback per file per batch of events
+                for callback in self._callbacks.get(path, ()):
+                    try:
+                        callback(path)
+                    except Exception as e:
+                        print(f"[Store Watcher Error] Change handler for '{path}' failed: {e}")
+
+    def stop(self):
+        if self._thread is None:
+            return
+        os.write(self._wakeup[1], b"x")
+        self._thread.join(2)
+        for fd in (self._fd, *self._wakeup):
+            os.close(fd)
+        self._thread = None
+
+
+store_watcher = StoreChangeWatcher()
+
+
+# --- Write-Behind Persistence (dirty tracking, coalesced atomic writes) ---
+def _atomic_write_text(path, text):
+    """Writes `text` to a temporary file, fsyncs it and renames it over `path`, so readers never see a partial file."""
+    temp_path = path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+class WriteBehindWriter:
+    """
+    Saves JSON stores off the caller's thread. save() records a snapshot as the file's pending state and
+    returns at once; a background thread writes each dirty file no later than `flush_delay_seconds` after
+    it first became dirty, so a burst of saves costs one write. Until then, loads are served from the
+    pending snapshot. flush() and close() drain everything to disk.
+
+    Writes are optimistic: under the store lock, the file's signature is compared with the one this
+    process last read or wrote. If another process changed it meanwhile, its entries are read back and
+    merged by ID (see _merge_entries_by_id) instead of being overwritten.
+    """
+    def __init__(self, flush_delay_seconds=1.0):
+        self.flush_delay_seconds = flush_delay_seconds
+        self._cond = threading.Condition()
+        self._dirty = {} # path -> [snapshot, store, dirty_since, coalesced_saves]
+        self._writing = {} # path -> snapshot being written right now (still served to loads)
+        self._synced = {} # path -> (signature, ids) of the version this process last read or wrote
+        self._thread = None
+        self._closing = False
+
+    def save(self, path, snapshot, store):
+        """
+        Marks `path` dirty with `snapshot`. `store` supplies serialize(entries), read(path) -> entries,
+        resolve(theirs, ours) for conflicting entries, and on_written(merged) once the file is on disk.
+        """
+        with self._cond:
+            previous = self._dirty.get(path)
+            dirty_since = previous[2] if previous else time.monotonic()
+            self._dirty[path] = [snapshot, store, dirty_since, (previous[3] + 1) if previous else 1]
+            if self._thread is None or not self._thread.is_alive():
+                self._closing = False
+                self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+
+    def pending_snapshot(self, path):
+        """The newest not-yet-written snapshot for `path`, or None when the file is up to date."""
+        with self._cond:
+            if path in self._dirty:
+                return self._dirty[path][0]
+            return self._writing.get(path)
+
+    def mark_synced(self, path, signature, entries):
+        """Records the version of `path` this process just read, as the base for later conflict checks."""
+        with self._cond:
+            self._synced[path] = (signature, {entry['id'] for entry in entries if 'id' in entry})
+
+    def is_own_version(self, path):
+        """
+        True if the file on disk is the version this process last read or wrote. Takes the store lock, so
+        a write of ours that has renamed the file but not yet recorded its signature is waited for
+        instead of being taken for another process's. Never call it while holding the store lock.
+        """
+        with _store_lock(path):
+            with self._cond:
+                synced = self._synced.get(path)
+            return synced is not None and synced[0] == _file_signature(path)
+
+    def _take_due_locked(self):
+        now = time.monotonic()
+        due = {path: item for path, item in self._dirty.items() if self._closing or now - item[2] >= self.flush_delay_seconds}
+        for path, item in due.items():
+            del self._dirty[path]
+            self._writing[path] = item[0]
+        return due
+
+    def _write(self, path, snapshot, store):
+        """Writes one snapshot under the store lock, merging first if another process changed the file. Returns True if merged."""
+        merged = False
+        with _store_lock(path):
+            with self._cond:
+                synced = self._synced.get(path)
+            signature = _file_signature(path)
+            if synced is not None and signature is not None and signature != synced[0]:
+                snapshot = _merge_entries_by_id(store["read"](path), snapshot, synced[1], store["resolve"])
+                merged = True
+            _atomic_write_text(path, store["serialize"](snapshot))
+            self.mark_synced(path, _file_signature(path), snapshot)
+        if merged:
+            with self._cond:
+                self._writing[path] = snapshot # on_written reloads; it must see the merged entries, not ours alone
+                newer = self._dirty.get(path)
+                if newer is not None: # Saved while we were merging: carry the other process's changes into it too
+                    newer[0] = _merge_entries_by_id(snapshot, newer[0], synced[1], store["resolve"])
+        return merged
+
+    def _run(self):
+        while True:
+            with self._cond:
+                due = self._take_due_locked()
+                while not due:
+                    if self._closing and not self._dirty:
+                        return
+                    oldest = min((item[2] for item in self._dirty.values()), default=None)
+                    self._cond.wait(None if oldest is None else max(0.0, oldest + self.flush_delay_seconds - time.monotonic()))
+                    due = self._take_due_locked()
+            for path, (snapshot, store, _, coalesced) in due.items():
+                try:
+                    merged = self._write(path, snapshot, store)
+                    store["on_written"](merged)
+                    print(f"[Persistence] Wrote '{path}' ({coalesced} save{'s' if coalesced > 1 else ''} coalesced{', merged with changes from another process' if merged else ''}).")
+                except Exception as e:
+                    print(f"[Persistence Error] Could not write '{path}': {e}. Will retry.")
+                    with self._cond:
+                        if path not in self._dirty: # A newer snapshot supersedes this one
+                            self._dirty[path] = [snapshot, store, time.monotonic(), coalesced]
+            with self._cond:
+                for path in due:
+                    self._writing.pop(path, None)
+                self._cond.notify_all()
+
+    def flush(self, timeout=10):
+        """Writes every pending snapshot now and waits for it. Returns False if that took longer than `timeout`."""
+        with self._cond:
+            for item in self._dirty.values():
+                item[2] = float("-inf") # Due immediately
+            self._cond.notify_all()
+            return self._cond.wait_for(lambda: not self._dirty and not self._writing, timeout)
+
+    def close(self, timeout=10):
+        """Flushes and stops the writer thread (on shutdown)."""
+        flushed = self.flush(timeout)
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        if not flushed:
+            print("[Persistence Error] Some changes could not be written before shutdown.")
+        return flushed
+
+
+persistence_writer = WriteBehindWriter(GLOBAL_CONFIG["PERSIST_FLUSH_DELAY_SECONDS"])
+
+
 # --- JSON Memory Functions ---
 def load_memory_data():
-    """Loads memory data from the JSON file."""
+    """
+    Loads memory data from the JSON file (or from a save that hasn't been written yet). A pending save
+    is returned as is, without copying it, so the result is read-only: callers copy the list or the
+    entries they change.
+    """
     memory_file = GLOBAL_CONFIG["MEMORY_FILE"]
+    pending = persistence_writer.pending_snapshot(memory_file)
+    if pending is not None:
+        return pending
     if not os.path.exists(memory_file) or os.stat(memory_file).st_size == 0:
         print(f"[Memory] Memory file '{memory_file}' not found or empty. Initializing empty memory.")
+        persistence_writer.mark_synced(memory_file, _file_signature(memory_file), [])
         return []
     try:
-        with open(memory_file, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            print(f"[Memory] Memory loaded successfully from '{memory_file}'.")
-            return data
+        data = _read_memory_file(memory_file)
+        print(f"[Memory] Memory loaded successfully from '{memory_file}'.")
+        return data
     except json.JSONDecodeError:
         print(f"[Memory Error] Warning: {GLOBAL_CONFIG['JARVIS_NAME']} detected corrupted or empty JSON in memory file. Starting with empty memory.")
         speak(f"My memory file seems corrupted. I'm starting with a fresh memory. Apologies for the inconvenience.")
@@ -1082,17 +2295,205 @@ def load_memory_data():
         speak(f"An error occurred while loading my memories. Some data might be inaccessible.")
         return []
 
-def save_memory_data(data):
-    """Saves memory data to the JSON file."""
+def _read_memory_file(path):
+    """Parses the memory file and records the version read as this process's base for conflict checks."""
+    with open(path, "r", encoding="utf-8") as f:
+        stat = os.fstat(f.fileno()) # The file that was actually read, even if it is replaced meanwhile
+        data = json.load(f)
+    persistence_writer.mark_synced(path, (stat.st_mtime_ns, stat.st_size), data)
+    return data
+
+def _resolve_memory_conflict(theirs, ours):
+    """Notes carry a version that edit_note bumps; the more edited copy wins."""
+    return theirs if theirs.get("version", 1) > ours.get("version", 1) else ours
+
+def _on_memory_file_written(merged):
+    """Once the memory file is written the index already reflects it, unless it was merged with another process's notes."""
+    global _memory_index_signature
+    _memory_index_signature = None if merged else _memory_file_signature()
+
+def _on_memory_file_changed(path):
+    """Store watcher callback: another process rewrote the memory file."""
+    global _memory_index_signature
+    if not persistence_writer.is_own_version(path):
+        _memory_index_signature = None # get_memory_index() reloads on next use
+        print("[Memory] Notes were changed by another process; reloading.")
+
+MEMORY_STORE = {"serialize": lambda entries: json.dumps(entries, indent=4), "read": _read_memory_file, "resolve": _resolve_memory_conflict, "on_written": _on_memory_file_written}
+
+def save_memory_data(data, changes=None):
+    """
+    Queues memory data to be written to the JSON file in the background. `changes` ({note id: new
+    entry, or None if it was deleted}) lets the compact index follow along without a rebuild; without
+    it the index is dropped and rebuilt on next use.
+    """
+    global _memory_index
     memory_file = GLOBAL_CONFIG["MEMORY_FILE"]
     try:
-        with open(memory_file, "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=4)
-        print(f"[Memory] Memory saved successfully to '{memory_file}'.")
+        persistence_writer.save(memory_file, [dict(entry) for entry in data], MEMORY_STORE)
+        # Keep the compact index in step with what was just saved, without re-reading the file
+        if changes is not None and _memory_index is not None and _memory_index_signature == _memory_file_signature():
+            _memory_index.apply(changes)
+        else:
+            _memory_index = None
     except Exception as e:
         speak(f"Sorry, {GLOBAL_CONFIG['JARVIS_NAME']} could not save the memory data due to an error.")
         print(f"[Memory Error] Error saving memory data: {e}")
 
+# --- Compact In-Memory Note Index ---
+class NoteRecord:
+    """A note held in memory: integer epoch timestamp and an interned category string."""
+    __slots__ = ("id", "epoch", "note", "category", "version")
+
+    def __init__(self, note_id, epoch, note, category, version=1):
+        self.id = note_id
+        self.epoch = epoch
+        self.note = note
+        self.category = category
+        self.version = version
+
+    @classmethod
+    def from_entry(cls, entry):
+        """Builds a record from a memory file entry (a dict)."""
+        try:
+            epoch = int(datetime.datetime.fromisoformat(entry["timestamp"]).timestamp())
+        except (KeyError, TypeError, ValueError):
+            epoch = 0
+        category = sys.intern(str(entry.get("category") or "uncategorized").lower())
+        return cls(entry.get("id"), epoch, entry.get("note", ""), category, entry.get("version", 1))
+
+    def to_entry(self):
+        """Converts the record back to the dict shape used by the memory file."""
+        timestamp = datetime.datetime.fromtimestamp(self.epoch).strftime("%Y-%m-%d %H:%M:%S") if self.epoch else ""
+        return {"id": self.id, "timestamp": timestamp, "note": self.note, "category": self.category, "version": self.version}
+
+
+class MemoryIndex:
+    """
+    Notes by ID plus a category -> note IDs index, so counting or listing one category
+    does not scan (and lowercase) every note. Per-category dicts act as insertion-ordered sets.
+    """
+    def __init__(self):
+        self.records = {}
+        self.by_category = {}
+
+    def __len__(self):
+        return len(self.records)
+
+    @classmethod
+    def build(cls, entries):
+        index = cls()
+        for entry in entries:
+            index.add(NoteRecord.from_entry(entry))
+        return index
+
+    def add(self, record):
+        if record.id in self.records:
+            self.remove(record.id)
+        self.records[record.id] = record
+        self.by_category.setdefault(record.category, {})[record.id] = None
+
+    def update(self, record):
+        """Replaces the note with the same ID, keeping its place in its category unless the category changed."""
+        previous = self.records.get(record.id)
+        if previous is None or previous.category != record.category:
+            self.add(record)
+        else:
+            self.records[record.id] = record
+
+    def remove(self, note_id):
+        record = self.records.pop(note_id, None)
+        if record is not None:
+            ids = self.by_category.get(record.category)
+            if ids is not None:
+                ids.pop(note_id, None)
+                if not ids:
+                    del self.by_category[record.category]
+        return record
+
+    def apply(self, changes):
+        """Applies {note id: new entry, or None if it was deleted} from a save."""
+        for note_id, entry in changes.items():
+            if entry is None:
+                self.remove(note_id)
+            else:
+                self.update(NoteRecord.from_entry(entry))
+
+    def category_ids(self, category):
+        return list(self.by_category.get(category.lower().strip(), ()))
+
+    def category_entries(self, category):
+        return [self.records[note_id].to_entry() for note_id in self.by_category.get(category.lower().strip(), ())]
+
+
+_memory_index = None
+_memory_index_signature = None
+
+def _memory_file_signature():
+    """Cheap change marker for the memory file: (modification time, size), or None if missing."""
+    return _file_signature(GLOBAL_CONFIG["MEMORY_FILE"])
+
+def get_memory_index():
+    """Returns the compact note index, rebuilding it only when the memory file has changed."""
+    global _memory_index, _memory_index_signature
+    signature = _memory_file_signature()
+    if _memory_index is None or signature != _memory_index_signature:
+        _memory_index = MemoryIndex.build(load_memory_data())
+        _memory_index_signature = signature
+    return _memory_index
+
+def benchmark_memory_index(note_count=1_000_000, category="task"):
+    """
+    Compares memory use and category-listing latency of plain dicts vs. the compact index. Both are
+    measured from a freshly loaded memory file, the index after the dicts it was built from are
+    dropped, so the note text it keeps is counted against it. Then times adding a note to the index.
+    """
+    categories = ["task", "idea", "shopping list", "personal"]
+    entries = [
+        {"id": i, "timestamp": "2025-01-01 09:00:00", "note": f"Benchmark note number {i}", "category": categories[i % len(categories)], "version": 1}
+        for i in range(1, note_count + 1)
+    ]
+    with tempfile.TemporaryDirectory(prefix="jarvis-memory-bench-") as scratch:
+        memory_file = os.path.join(scratch, "memory.json")
+        with open(memory_file, "w", encoding="utf-8") as f:
+            json.dump(entries, f)
+        del entries
+
+        tracemalloc.start()
+        with open(memory_file, encoding="utf-8") as f:
+            entries = json.load(f)
+        dict_bytes = tracemalloc.get_traced_memory()[0]
+        del entries
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        with open(memory_file, encoding="utf-8") as f:
+            index = MemoryIndex.build(json.load(f))
+        index_bytes = tracemalloc.get_traced_memory()[0] - baseline
+        tracemalloc.stop()
+
+        with open(memory_file, encoding="utf-8") as f:
+            entries = json.load(f)
+
+    start = time.perf_counter()
+    scanned = [e for e in entries if e.get("category", "uncategorized").lower() == category]
+    scan_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    listed_ids = index.category_ids(category)
+    list_seconds = time.perf_counter() - start
+
+    new_entry = {"id": note_count + 1, "timestamp": "2025-01-02 09:00:00", "note": "One more note", "category": category, "version": 1}
+    start = time.perf_counter()
+    index.apply({new_entry["id"]: new_entry})
+    add_seconds = time.perf_counter() - start
+
+    assert len(scanned) == len(listed_ids) == len(index.category_ids(category)) - 1
+    print(f"[Benchmark] {note_count} notes. Dict list: {dict_bytes / 2**20:.1f} MiB, compact index: {index_bytes / 2**20:.1f} MiB.")
+    print(f"[Benchmark] Category '{category}' ({len(listed_ids)} notes): linear scan {scan_seconds * 1000:.1f} ms, indexed id list {list_seconds * 1000:.1f} ms; "
+          f"adding a note to the index {add_seconds * 1e6:.1f} us.")
+    return {"dict_bytes": dict_bytes, "index_bytes": index_bytes, "scan_seconds": scan_seconds, "list_seconds": list_seconds, "add_seconds": add_seconds}
+
+
 def add_to_memory(note, category=None):
     """Adds a timestamped and categorized note to the memory file."""
     memory_data = load_memory_data()
@@ -1120,16 +2521,21 @@ def add_to_memory(note, category=None):
         "id": new_id,
         "timestamp": timestamp,
         "note": note,
-        "category": category
+        "category": category,
+        "version": 1 # Bumped on every edit; used to key cached summaries
     }
-    memory_data.append(new_entry)
-    save_memory_data(memory_data)
+    save_memory_data(memory_data + [new_entry], {new_id: new_entry})
     speak(f"Understood. {GLOBAL_CONFIG['JARVIS_NAME']} has remembered that as a '{category}' note with ID {new_id}.")
     print(f"[Memory Action] Added to memory (ID {new_id}, Category '{category}'): {note}")
 
 def read_memory(category=None, summarize=False, search_query=None):
     """Reads and speaks the contents of the memory file, optionally by category, summarized, or searched."""
-    memory_data = load_memory_data()
+    if category:
+        # Category lookups go through the compact index instead of scanning every note
+        memory_index = get_memory_index()
+        memory_data = memory_index.records
+    else:
+        memory_data = load_memory_data()
 
     if not memory_data:
         speak(f"{GLOBAL_CONFIG['JARVIS_NAME']} doesn't have anything in memory yet.")
@@ -1138,15 +2544,13 @@ def read_memory(category=None, summarize=False, search_query=None):
 
     filtered_notes = []
     if category:
-        for entry in memory_data:
-            if entry.get("category", "uncategorized").lower() == category.lower():
-                filtered_notes.append(entry)
+        filtered_notes = memory_index.category_entries(category)
         
         if not filtered_notes:
             speak(f"I found no notes in the '{category}' category.")
             print(f"[Memory Action] No notes found in category '{category}'.")
             return
-        speak(f"Here are your notes in the '{category}' category:")
+        speak(f"Here are your {len(filtered_notes)} notes in the '{category}' category:")
         print(f"[Memory Action] Reading notes in category: '{category}'.")
     elif search_query:
         speak(f"Searching notes for '{search_query}'.")
@@ -1178,8 +2582,19 @@ def read_memory(category=None, summarize=False, search_query=None):
     if summarize and gemini_model:
         if len(filtered_notes) > 1: # Only summarize if there's more than one relevant note
             speak(f"Since there are multiple entries, {GLOBAL_CONFIG['JARVIS_NAME']} will provide a summary for you.")
-            prompt = f"Please summarize the following memory entries concisely, highlighting key information and actionable items. Present it as if you are a helpful AI assistant named {GLOBAL_CONFIG['JARVIS_NAME']}:\n\n{notes_text_for_display}"
-            ask_gemini(prompt)
+            try:
+                summary_scope = f"category:{category.lower()}" if category else "all"
+                summary, used_count = summarize_notes(filtered_notes, query=search_query, scope=summary_scope)
+                if used_count < len(filtered_notes):
+                    speak(f"I focused on the {used_count} most {'relevant' if search_query else 'recent'} of your {len(filtered_notes)} notes.")
+                if summary:
+                    speak(summary)
+                    print(f"[Memory Summary] Summarized {used_count} of {len(filtered_notes)} notes.")
+                else:
+                    speak("I couldn't find anything to summarize.")
+            except Exception as e:
+                speak(f"I'm sorry, {GLOBAL_CONFIG['JARVIS_NAME']} encountered an error while summarizing your memories.")
+                print(f"[Gemini API Error] Memory summarization failed: {e}")
         else:
             speak(f"There is only one relevant entry. {GLOBAL_CONFIG['JARVIS_NAME']} will read it directly.")
             speak(f"Note: {filtered_notes[0]['note']}")
@@ -1225,7 +2640,7 @@ def forget_note(note_identifier=None):
             speak(f"Are you sure you want to delete note with ID {note_id}: '{found_notes[0]['note']}'? Say 'yes' to confirm or 'no' to cancel.")
             confirmation = listen_command(prompt="Confirm deletion...")
             if confirmation == "yes":
-                save_memory_data(updated_memory_data)
+                save_memory_data(updated_memory_data, {note_id: None})
                 speak(f"Understood. {GLOBAL_CONFIG['JARVIS_NAME']} has forgotten note with ID {note_id}.")
                 print(f"[Memory Action] Deleted note with ID {note_id}: {found_notes[0]['note']}")
             else:
@@ -1256,13 +2671,13 @@ def forget_note(note_identifier=None):
             speak(f"I found one note: '{matching_entries[0]['note']}'. Are you sure you want to delete it? Say 'yes' to confirm or 'no' to cancel.")
             confirmation = listen_command(prompt="Confirm deletion...")
             if confirmation == "yes":
-                save_memory_data(updated_memory_data)
+                save_memory_data(updated_memory_data, {matching_entries[0].get("id"): None})
                 speak(f"Understood. {GLOBAL_CONFIG['JARVIS_NAME']} has forgotten the note: '{matching_entries[0]['note']}'.")
                 print(f"[Memory Action] Deleted note by keyword: {matching_entries[0]['note']}")
             else:
                 speak("Deletion cancelled.")
                 print("[Memory Action] Deletion cancelled by user.")
-                save_memory_data(memory_data) # Revert if cancelled
+                save_memory_data(memory_data, {}) # Revert if cancelled
         else:
             # Multiple matches, ask for clarification
             speak(f"I found multiple notes containing '{note_identifier}'. Please clarify which one you'd like {GLOBAL_CONFIG['JARVIS_NAME']} to forget by saying its ID. Say 'cancel' to abort.")
@@ -1273,7 +2688,7 @@ def forget_note(note_identifier=None):
             if clarification == "cancel_command":
                 speak("Deletion cancelled.")
                 print("[Memory Action] Deletion cancelled by user.")
-                save_memory_data(memory_data) # Revert if cancelled
+                save_memory_data(memory_data, {}) # Revert if cancelled
                 return
 
             try:
@@ -1292,25 +2707,25 @@ def forget_note(note_identifier=None):
                     speak(f"Are you sure you want to delete note with ID {clarification_id}: '{found_to_delete['note']}'? Say 'yes' to confirm or 'no' to cancel.")
                     confirmation = listen_command(prompt="Confirm deletion...")
                     if confirmation == "yes":
-                        save_memory_data(final_updated_memory)
+                        save_memory_data(final_updated_memory, {clarification_id: None})
                         speak(f"Understood. {GLOBAL_CONFIG['JARVIS_NAME']} has forgotten note with ID {clarification_id}.")
                         print(f"[Memory Action] Deleted note with ID {clarification_id}: {found_to_delete['note']}")
                     else:
                         speak("Deletion cancelled.")
                         print("[Memory Action] Deletion cancelled by user.")
-                        save_memory_data(memory_data) # Revert if cancelled
+                        save_memory_data(memory_data, {}) # Revert if cancelled
                 else:
                     speak(f"I could not find a note with ID {clarification_id}. No notes were deleted.")
                     print(f"[Memory Action] No note found with ID {clarification_id}. Reverting changes.")
-                    save_memory_data(memory_data) # Revert if no deletion
+                    save_memory_data(memory_data, {}) # Revert if no deletion
             except ValueError:
                 speak(f"That was not a valid ID. No notes were deleted.")
                 print("[Memory Action] Invalid ID provided for deletion.")
-                save_memory_data(memory_data) # Revert if no deletion
+                save_memory_data(memory_data, {}) # Revert if no deletion
             except Exception as e:
                 speak(f"An error occurred during deletion. {e}")
                 print(f"[Memory Error] Error during multi-match deletion: {e}")
-                save_memory_data(memory_data) # Revert if error
+                save_memory_data(memory_data, {}) # Revert if error
 
     if len(memory_data) == initial_memory_count and not found_notes: # Final check if anything was actually deleted
         speak(f"I could not find any notes matching '{note_identifier}' to forget.")
@@ -1322,7 +2737,7 @@ def clear_all_memory():
     speak(f"Are you sure you want {GLOBAL_CONFIG['JARVIS_NAME']} to clear all your memories? This action cannot be undone. Say 'yes' to confirm or 'no' to cancel.")
     confirmation = listen_command(prompt="Say 'yes' to confirm or 'no' to cancel.")
     if "yes" in confirmation:
-        save_memory_data([]) # Save an empty list
+        save_memory_data([]) # Save an empty list; the note index is rebuilt (empty) on next use
         speak(f"All memories have been cleared. {GLOBAL_CONFIG['JARVIS_NAME']} has an empty slate.")
         print("[Memory Action] All memory cleared.")
     else:
@@ -1343,9 +2758,11 @@ def edit_note():
     try:
         note_id = int(id_input.strip())
         note_to_edit = None
-        for entry in memory_data:
+        for position, entry in enumerate(memory_data):
             if entry.get("id") == note_id:
-                note_to_edit = entry
+                note_to_edit = dict(entry) # The loaded notes may be a pending save's, so edit a copy
+                memory_data = list(memory_data)
+                memory_data[position] = note_to_edit
                 break
         
         if note_to_edit:
@@ -1370,8 +2787,9 @@ def edit_note():
             note_to_edit['note'] = new_note_text
             note_to_edit['category'] = new_category
             note_to_edit['timestamp'] = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S") # Update timestamp
+            note_to_edit['version'] = note_to_edit.get('version', 1) + 1
             
-            save_memory_data(memory_data)
+            save_memory_data(memory_data, {note_id: note_to_edit})
             speak(f"Note ID {note_id} has been updated to: '{new_note_text}' in category '{new_category}'.")
             print(f"[Memory Action] Edited note ID {note_id}.")
         else:
@@ -1385,6 +2803,400 @@ def edit_note():
         print(f"[Memory Error] Error editing note: {e}")
 
 
+# --- Memory Summarization (Retrieval + Map-Reduce) ---
+# Cache layout: {"chunks": {content_hash: summary_text},
+#                "scopes": {scope: {"key": note_set_hash, "members": ["id:version", ...], "summary": text}}}
+_summary_cache = None # Loaded lazily from SUMMARY_CACHE_FILE
+_summary_cache_lock = threading.Lock()
+
+def _estimate_tokens(text):
+    """Rough token estimate (about 4 characters per token), good enough for prompt budgeting."""
+    return len(text) // 4 + 1
+
+def _format_note_for_prompt(entry):
+    """Formats a single note as one compact prompt line."""
+    return f"- [{entry.get('timestamp', 'unknown time')}] ({entry.get('category', 'uncategorized')}) {entry.get('note', '')}"
+
+def _note_version_key(entry):
+    """Identifies one version of a note. Notes saved before versioning fall back to their timestamp."""
+    return f"{entry.get('id', 'N/A')}:{entry.get('version', entry.get('timestamp', ''))}"
+
+def _note_set_key(member_keys):
+    """Hash of a set of note version keys, independent of order."""
+    return hashlib.sha256("\n".join(sorted(member_keys)).encode("utf-8")).hexdigest()
+
+def _load_summary_cache():
+    """Loads the summary cache from disk once per session."""
+    global _summary_cache
+    if _summary_cache is not None:
+        return _summary_cache
+    cache_file = GLOBAL_CONFIG["SUMMARY_CACHE_FILE"]
+    _summary_cache = {"chunks": {}, "scopes": {}}
+    if os.path.exists(cache_file) and os.stat(cache_file).st_size > 0:
+        try:
+            with open(cache_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if "chunks" in data or "scopes" in data:
+                _summary_cache["chunks"] = data.get("chunks", {})
+                _summary_cache["scopes"] = data.get("scopes", {})
+            else: # Flat {hash: summary} layout written by earlier builds
+                _summary_cache["chunks"] = data
+            print(f"[Summary Cache] Loaded {len(_summary_cache['chunks'])} cached summaries and {len(_summary_cache['scopes'])} scope summaries from '{cache_file}'.")
+        except Exception as e:
+            print(f"[Summary Cache Error] Could not read '{cache_file}': {e}. Starting with an empty cache.")
+    return _summary_cache
+
+def _save_summary_cache():
+    """Persists the summary cache so unchanged notes cost no API calls after a restart."""
+    cache_file = GLOBAL_CONFIG["SUMMARY_CACHE_FILE"]
+    try:
+        cache = _load_summary_cache()
+        with _summary_cache_lock:
+            snapshot = {"chunks": dict(cache["chunks"]), "scopes": dict(cache["scopes"])}
+        with open(cache_file, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f)
+    except Exception as e:
+        print(f"[Summary Cache Error] Could not save '{cache_file}': {e}")
+
+def _gemini_generate_cached(prompt):
+    """
+    Returns Gemini's text for `prompt`, reusing a cached answer when the exact same
+    prompt (by content hash) was summarized before.
+    """
+    content_hash = hashlib.sha256(f"{gemini_model.model_name}\n{prompt}".encode("utf-8")).hexdigest()
+    chunk_cache = _load_summary_cache()["chunks"]
+    with _summary_cache_lock:
+        if content_hash in chunk_cache:
+            return chunk_cache[content_hash]
+    response = gemini_model.generate_content(prompt)
+    text = response.text.strip()
+    with _summary_cache_lock:
+        chunk_cache[content_hash] = text
+    return text
+
+def _select_notes_for_summary(notes, query=None, token_budget=None):
+    """
+    Retrieval stage: keeps the most relevant notes (when a query is given) or the most recent ones,
+    up to the token budget. Selected notes are returned in chronological order.
+    """
+    if token_budget is None:
+        token_budget = GLOBAL_CONFIG["MEMORY_SUMMARY_TOKEN_BUDGET"]
+
+    if query:
+        query_lower = query.lower()
+        ranked = sorted(notes, key=lambda e: (process.fuzz.partial_ratio(query_lower, e.get('note', '').lower()), e.get('timestamp', '')), reverse=True)
+    else:
+        ranked = sorted(notes, key=lambda e: (e.get('timestamp', ''), e.get('id', 0)), reverse=True)
+
+    selected = []
+    used_tokens = 0
+    for entry in ranked:
+        cost = _estimate_tokens(_format_note_for_prompt(entry))
+        if used_tokens + cost > token_budget:
+            if selected:
+                break
+            continue # A single oversized note is skipped rather than blowing the budget
+        selected.append(entry)
+        used_tokens += cost
+
+    selected.sort(key=lambda e: (e.get('timestamp', ''), e.get('id', 0)))
+    return selected
+
+def _chunk_lines(lines, chunk_tokens):
+    """Groups prompt lines into chunks of roughly `chunk_tokens` tokens each."""
+    chunks = []
+    current = []
+    current_tokens = 0
+    for line in lines:
+        cost = _estimate_tokens(line)
+        if current and current_tokens + cost > chunk_tokens:
+            chunks.append(current)
+            current = []
+            current_tokens = 0
+        current.append(line)
+        current_tokens += cost
+    if current:
+        chunks.append(current)
+    return chunks
+
+def _map_reduce_summary(lines, final_instruction, merge_instruction):
+    """
+    Summarizes prompt lines. When they don't fit in one chunk, chunks are summarized
+    concurrently (map) and the partial summaries merged (reduce) until one prompt remains.
+    Every round at least halves the number of chunks, and there are at most MEMORY_SUMMARY_MAX_ROUNDS.
+    """
+    chunk_tokens = GLOBAL_CONFIG["MEMORY_SUMMARY_CHUNK_TOKENS"]
+    chunks = _chunk_lines(lines, chunk_tokens)
+    for _ in range(GLOBAL_CONFIG["MEMORY_SUMMARY_MAX_ROUNDS"]):
+        if len(chunks) <= 1:
+            break
+        map_prompts = [
+            "Summarize these personal notes in a few short bullet points. Keep dates, names and action items:\n\n" + "\n".join(chunk)
+            for chunk in chunks
+        ]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=GLOBAL_CONFIG["MEMORY_SUMMARY_WORKERS"]) as executor:
+            partial_summaries = list(executor.map(_gemini_generate_cached, map_prompts))
+        print(f"[Memory Summary] Map stage produced {len(partial_summaries)} partial summaries.")
+        next_chunks = _chunk_lines(partial_summaries, chunk_tokens)
+        if len(next_chunks) > (len(chunks) + 1) // 2:
+            # Summaries too long to pack tightly (over half a chunk each): merge them in pairs instead
+            next_chunks = [partial_summaries[i:i + 2] for i in range(0, len(partial_summaries), 2)]
+        chunks = next_chunks
+        final_instruction = merge_instruction
+    if len(chunks) > 1:
+        print(f"[Memory Summary] Still {len(chunks)} chunks after {GLOBAL_CONFIG['MEMORY_SUMMARY_MAX_ROUNDS']} rounds; keeping what fits in one prompt.")
+        chunks = _chunk_lines([line for chunk in chunks for line in chunk], chunk_tokens)[:1]
+    return _gemini_generate_cached(final_instruction + "\n".join(chunks[0]))
+
+def summarize_notes(notes, query=None, scope=None):
+    """
+    Summarizes notes with a bounded prompt size.
+    Retrieval picks the notes that fit the token budget and every Gemini call is cached by content hash.
+    When a `scope` (category name or "all") is given and there is no search query, the summary is also
+    cached under that scope, keyed by the hash of the included note ids and versions: an unchanged note
+    set is answered from the cache, and a set that only gained notes has just the delta summarized and
+    merged into the previous summary. Returns (summary_text, number_of_notes_used).
+    """
+    selected = _select_notes_for_summary(notes, query=query)
+    if not selected:
+        return None, 0
+
+    jarvis_name = GLOBAL_CONFIG['JARVIS_NAME']
+    final_instruction = f"Please summarize the following memory entries concisely, highlighting key information and actionable items. Present it as if you are a helpful AI assistant named {jarvis_name}:\n\n"
+    merge_instruction = f"Please merge the following partial summaries of memory entries into one concise summary, highlighting key information and actionable items. Present it as if you are a helpful AI assistant named {jarvis_name}:\n\n"
+
+    if query or not scope:
+        summary = _map_reduce_summary([_format_note_for_prompt(e) for e in selected], final_instruction, merge_instruction)
+        _save_summary_cache()
+        return summary, len(selected)
+
+    members = [_note_version_key(e) for e in selected]
+    set_key = _note_set_key(members)
+    scope_cache = _load_summary_cache()["scopes"]
+    previous = scope_cache.get(scope)
+
+    if previous and previous.get("key") == set_key:
+        print(f"[Memory Summary] Note set for scope '{scope}' unchanged. Serving cached summary.")
+        return previous["summary"], len(selected)
+
+    previous_members = set(previous.get("members", [])) if previous else set()
+    if previous and previous_members < set(members):
+        delta_notes = [e for e in selected if _note_version_key(e) not in previous_members]
+        print(f"[Memory Summary] {len(delta_notes)} new notes in scope '{scope}'. Summarizing only the delta.")
+        delta_summary = _map_reduce_summary([_format_note_for_prompt(e) for e in delta_notes], "Summarize these new personal notes in a few short bullet points. Keep dates, names and action items:\n\n", merge_instruction)
+        summary = _gemini_generate_cached(
+            f"{merge_instruction}Existing summary:\n{previous['summary']}\n\nSummary of newly added notes:\n{delta_summary}"
+        )
+    else:
+        summary = _map_reduce_summary([_format_note_for_prompt(e) for e in selected], final_instruction, merge_instruction)
+
+    with _summary_cache_lock:
+        scope_cache[scope] = {"key": set_key, "members": members, "summary": summary}
+    _save_summary_cache()
+    return summary, len(selected)
+
+
+# --- Bulk Memory Import/Export (Streaming) ---
+LEGACY_MEMORY_LINE_PATTERN = re.compile(r"^\[(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\] (.*)$")
+NOTE_EXPORT_FIELDS = ["id", "timestamp", "category", "note", "version"]
+
+def _detect_note_file_format(path, fmt=None):
+    """Returns 'jsonl', 'csv' or 'legacy' (the '[timestamp] note' text format of older launcher versions)."""
+    if fmt:
+        return fmt
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".jsonl", ".ndjson"):
+        return "jsonl"
+    if extension == ".csv":
+        return "csv"
+    if extension == ".txt":
+        return "legacy"
+    raise ValueError(f"Cannot tell the note format of '{path}'. Use a .jsonl, .csv or .txt file or pass a format.")
+
+def _iter_notes_from_file(path, fmt):
+    """Streams raw notes (dicts with note/category/timestamp) from a file, one line at a time. Malformed JSONL lines yield None."""
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if fmt == "jsonl":
+            for line_number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    print(f"[Memory Import] Skipping malformed JSON on line {line_number}.")
+                    yield None
+        elif fmt == "csv":
+            for row in csv.DictReader(f):
+                yield row
+        elif fmt == "legacy":
+            for line in f:
+                match = LEGACY_MEMORY_LINE_PATTERN.match(line.rstrip("\n"))
+                if match:
+                    yield {"timestamp": match.group(1), "note": match.group(2), "category": "uncategorized"}
+        else:
+            raise ValueError(f"Unsupported note format: {fmt}")
+
+def import_memory_notes(path, fmt=None, batch_size=None):
+    """
+    Imports notes in bulk from JSONL, CSV or the legacy text format.
+    Source notes are streamed straight into a temporary copy of the memory file in batches,
+    so memory use does not grow with the size of the import file. The import is committed as
+    one transaction by atomically renaming the temporary file over the memory file. Rows that
+    aren't a note (malformed JSON, a JSONL line that isn't an object, an empty note) are
+    counted as rejected. Returns (imported_count, elapsed_seconds).
+    """
+    global _memory_index, _memory_index_signature
+    fmt = _detect_note_file_format(path, fmt)
+    batch_size = batch_size or GLOBAL_CONFIG["MEMORY_IMPORT_BATCH_SIZE"]
+    memory_file = GLOBAL_CONFIG["MEMORY_FILE"]
+    temp_file = memory_file + ".import.tmp"
+    start_time = time.perf_counter()
+
+    persistence_writer.flush() # The import replaces the file directly, so queued saves must land first
+    with _store_lock(memory_file): # Other processes must not write the store between our read and the rename
+        existing_data = load_memory_data()
+        existing_ids = [item["id"] for item in existing_data if "id" in item]
+        next_id = max((note_id for note_id in existing_ids if isinstance(note_id, int)), default=0) + 1
+        first_new_id = next_id
+        now_str = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+        imported_count = rejected_count = 0
+        written_any = False
+        try:
+            with open(temp_file, "w", encoding="utf-8") as out:
+                out.write("[\n")
+
+                def write_batch(lines):
+                    nonlocal written_any
+                    if not lines:
+                        return
+                    out.write((",\n" if written_any else "") + ",\n".join(lines))
+                    written_any = True
+
+                write_batch([json.dumps(entry) for entry in existing_data])
+                del existing_data
+
+                batch = []
+                for raw in _iter_notes_from_file(path, fmt):
+                    note_text = raw.get("note") if isinstance(raw, dict) else None
+                    if not isinstance(note_text, str) or not note_text.strip():
+                        rejected_count += 1
+                        continue
+                    entry = {
+                        "id": next_id,
+                        "timestamp": str(raw.get("timestamp") or now_str),
+                        "note": note_text.strip(),
+                        "category": str(raw.get("category") or "uncategorized").lower().strip(),
+                        "version": 1
+                    }
+                    next_id += 1
+                    batch.append(json.dumps(entry))
+                    if len(batch) >= batch_size:
+                        write_batch(batch)
+                        imported_count += len(batch)
+                        batch = []
+                write_batch(batch)
+                imported_count += len(batch)
+
+                out.write("\n]\n")
+                out.flush()
+                os.fsync(out.fileno())
+            os.replace(temp_file, memory_file)
+        except Exception:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+            raise
+        # Still under the lock: record the new file as our own version, so the store watcher doesn't reload it
+        persistence_writer.mark_synced(memory_file, _file_signature(memory_file),
+                                       [{"id": note_id} for note_id in itertools.chain(existing_ids, range(first_new_id, next_id))])
+    _memory_index, _memory_index_signature = None, None # Rebuilt from the new file on next use
+
+    elapsed = time.perf_counter() - start_time
+    rate = imported_count / elapsed if elapsed > 0 else float("inf")
+    print(f"[Memory Import] Imported {imported_count} notes from '{path}' ({fmt}) in {elapsed:.2f}s ({rate:,.0f} notes/s), rejected {rejected_count}.")
+    return imported_count, elapsed
+
+def _iter_json_array(path, chunk_size=1 << 16):
+    """
+    Streams the items of a file holding one JSON array of objects, such as the memory file, so only
+    one item and one read chunk are in memory at a time. Raises ValueError if the file isn't one.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buffer, position, opened = "", 0, False
+        while True:
+            while position < len(buffer) and buffer[position] in " \t\r\n" + (",]" if opened else "["):
+                if buffer[position] == "]":
+                    return
+                opened = opened or buffer[position] == "["
+                position += 1
+            if position == len(buffer):
+                buffer, position = f.read(chunk_size), 0
+                if not buffer:
+                    if opened:
+                        raise ValueError(f"'{path}' ends inside its JSON array")
+                    return # Empty file
+                continue
+            if not opened:
+                raise ValueError(f"'{path}' does not hold a JSON array")
+            while True:
+                try:
+                    item, position = decoder.raw_decode(buffer, position)
+                    break
+                except json.JSONDecodeError:
+                    chunk = f.read(chunk_size) # The item runs past the chunk read so far
+                    if not chunk:
+                        raise
+                    buffer, position = buffer[position:] + chunk, 0
+            yield item
+
+def export_memory_notes(path, fmt=None):
+    """
+    Exports every note to JSONL or CSV, streaming them from the memory file one note at a time,
+    so memory use does not grow with the number of notes.
+    Returns (exported_count, elapsed_seconds).
+    """
+    fmt = _detect_note_file_format(path, fmt)
+    if fmt not in ("jsonl", "csv"):
+        raise ValueError("Notes can only be exported as JSONL or CSV.")
+    start_time = time.perf_counter()
+    exported_count = 0
+    persistence_writer.flush() # Notes are read from the file, so queued saves must land first
+    memory_file = GLOBAL_CONFIG["MEMORY_FILE"]
+    with open(path, "w", encoding="utf-8", newline="") as out:
+        if fmt == "csv":
+            writer = csv.DictWriter(out, fieldnames=NOTE_EXPORT_FIELDS, extrasaction="ignore")
+            writer.writeheader()
+        for entry in _iter_json_array(memory_file) if os.path.exists(memory_file) else ():
+            if fmt == "csv":
+                writer.writerow(entry)
+            else:
+                out.write(json.dumps(entry) + "\n")
+            exported_count += 1
+    elapsed = time.perf_counter() - start_time
+    rate = exported_count / elapsed if elapsed > 0 else float("inf")
+    print(f"[Memory Export] Exported {exported_count} notes to '{path}' ({fmt}) in {elapsed:.2f}s ({rate:,.0f} notes/s).")
+    return exported_count, elapsed
+
+def benchmark_memory_import(note_count=1_000_000):
+    """Generates a JSONL file of `note_count` notes and times importing it into a scratch memory file."""
+    original_memory_file = GLOBAL_CONFIG["MEMORY_FILE"]
+    categories = ["task", "idea", "shopping list", "personal"]
+    with tempfile.TemporaryDirectory() as scratch_dir:
+        source_path = os.path.join(scratch_dir, "notes.jsonl")
+        with open(source_path, "w", encoding="utf-8") as f:
+            for i in range(note_count):
+                f.write(json.dumps({"timestamp": "2025-01-01 09:00:00", "note": f"Benchmark note number {i}", "category": categories[i % len(categories)]}) + "\n")
+        GLOBAL_CONFIG["MEMORY_FILE"] = os.path.join(scratch_dir, "memory.json")
+        try:
+            imported_count, elapsed = import_memory_notes(source_path)
+        finally:
+            GLOBAL_CONFIG["MEMORY_FILE"] = original_memory_file
+    print(f"[Benchmark] Import throughput: {imported_count / elapsed:,.0f} notes/s for {imported_count} notes.")
+    return imported_count / elapsed
+
+
 # --- Spotify Control Functions ---
 sp = None # Global spotipy client instance
 
@@ -1427,79 +3239,91 @@ def play_spotify_music():
     if not sp:
         speak("Spotify is not authenticated. Please authenticate Spotify first.")
         if authenticate_spotify(): # Try to authenticate if not already
-            play_spotify_music() # Retry after authentication
-        return
+            return play_spotify_music() # Retry after authentication
+        return False
     try:
         sp.start_playback()
         speak("Playing music on Spotify.")
         print("[Spotify Action] Play/Resume.")
+        return True
     except spotipy.exceptions.SpotifyException as e:
         if e.http_status == 404 and "No active device found" in str(e):
             speak("No active Spotify device found. Please open Spotify on a device and play something first.")
         else:
             speak(f"Could not play music on Spotify: {e}. Ensure Spotify is running and you have an active device.")
         print(f"[Spotify Error] Playback failed: {e}")
+        return False
     except Exception as e:
         speak(f"An unexpected error occurred while trying to play Spotify music: {e}.")
         print(f"[Spotify Error] Unexpected error during play: {e}")
+        return False
 
 
 def pause_spotify_music():
     """Pauses Spotify music."""
     if not sp:
         speak("Spotify is not authenticated. Please authenticate Spotify first.")
-        return
+        return False
     try:
         sp.pause_playback()
         speak("Music paused on Spotify.")
         print("[Spotify Action] Pause.")
+        return True
     except spotipy.exceptions.SpotifyException as e:
         if e.http_status == 404 and "No active device found" in str(e):
             speak("No active Spotify device found. Please open Spotify on a device and play something first.")
         else:
             speak(f"Could not pause music on Spotify: {e}. Ensure Spotify is running and you have an active device.")
         print(f"[Spotify Error] Pause failed: {e}")
+        return False
     except Exception as e:
         speak(f"An unexpected error occurred while trying to pause Spotify music: {e}.")
         print(f"[Spotify Error] Unexpected error during pause: {e}")
+        return False
 
 def next_spotify_song():
     """Skips to the next Spotify song."""
     if not sp:
         speak("Spotify is not authenticated. Please authenticate Spotify first.")
-        return
+        return False
     try:
         sp.next_track()
         speak("Skipping to the next song.")
         print("[Spotify Action] Next track.")
+        return True
     except spotipy.exceptions.SpotifyException as e:
         if e.http_status == 404 and "No active device found" in str(e):
             speak("No active Spotify device found. Please open Spotify on a device and play something first.")
         else:
             speak(f"Could not skip song on Spotify: {e}. Ensure Spotify is running and you have an active device.")
         print(f"[Spotify Error] Next track failed: {e}")
+        return False
     except Exception as e:
         speak(f"An unexpected error occurred while trying to skip Spotify song: {e}.")
         print(f"[Spotify Error] Unexpected error during next track: {e}")
+        return False
 
 def previous_spotify_song():
     """Plays the previous Spotify song."""
     if not sp:
         speak("Spotify is not authenticated. Please authenticate Spotify first.")
-        return
+        return False
     try:
         sp.previous_track()
         speak("Playing the previous song.")
         print("[Spotify Action] Previous track.")
+        return True
     except spotipy.exceptions.SpotifyException as e:
         if e.http_status == 404 and "No active device found" in str(e):
             speak("No active Spotify device found. Please open Spotify on a device and play something first.")
         else:
             speak(f"Could not play previous song on Spotify: {e}. Ensure Spotify is running and you have an active device.")
         print(f"[Spotify Error] Previous track failed: {e}")
+        return False
     except Exception as e:
         speak(f"An unexpected error occurred while trying to play previous Spotify song: {e}.")
         print(f"[Spotify Error] Unexpected error during previous track: {e}")
+        return False
 
 # --- Continuous Listening / Hotword Detection (Simulated) ---
 hotword_enabled = False
@@ -1644,25 +3468,64 @@ def close_gui():
     #     root.destroy()
 
 
+# --- Clock (injectable, so calendar and scheduler code can run in simulated time) ---
+class SystemClock:
+    """Wall-clock time; waits really block."""
+    def now(self):
+        return datetime.datetime.now()
+
+    def wait(self, cond, timeout):
+        """Waits on a held condition variable for up to `timeout` seconds (None = until notified)."""
+        cond.wait(timeout)
+
+class SimulatedClock:
+    """
+    Manually controlled time for simulations and load tests. A timed wait returns immediately after
+    advancing the clock by the timeout, so a scheduler running on it skips straight to its next trigger.
+    """
+    def __init__(self, start):
+        self._now = start
+
+    def now(self):
+        return self._now
+
+    def advance(self, seconds):
+        self._now += datetime.timedelta(seconds=seconds)
+
+    def wait(self, cond, timeout):
+        if timeout is None:
+            cond.wait() # Nothing pending: block until something is scheduled or the scheduler stops
+        else:
+            self.advance(timeout)
+
+jarvis_clock = SystemClock()
+
+def use_clock(clock):
+    """Replaces the clock used by calendar, alarm and timer code. Returns the previous clock."""
+    global jarvis_clock
+    previous, jarvis_clock = jarvis_clock, clock
+    return previous
+
 # --- Calendar/Reminder Integration (Functional with local JSON storage) ---
 
 def _load_calendar_data():
-    """Loads calendar data from the JSON file."""
+    """
+    Loads calendar data from the JSON file (or from a save that hasn't been written yet). A pending save
+    is returned as is, without copying it, so the result is read-only: callers copy the list or the
+    entries they change.
+    """
     calendar_file = GLOBAL_CONFIG["CALENDAR_FILE"]
+    pending = persistence_writer.pending_snapshot(calendar_file)
+    if pending is not None:
+        return pending
     if not os.path.exists(calendar_file) or os.stat(calendar_file).st_size == 0:
         print(f"[Calendar] Calendar file '{calendar_file}' not found or empty. Initializing empty calendar.")
+        persistence_writer.mark_synced(calendar_file, _file_signature(calendar_file), [])
         return []
     try:
-        with open(calendar_file, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            # Convert ISO strings back to datetime objects for easier manipulation
-            for entry in data:
-                # Handle 'completed' status if it exists, default to False
-                entry['completed'] = entry.get('completed', False)
-                entry['triggered'] = entry.get('triggered', False) # New for alarms/timers
-                entry['datetime'] = datetime.datetime.fromisoformat(entry['datetime'])
-            print(f"[Calendar] Calendar loaded successfully from '{calendar_file}'.")
-            return data
+        data = _read_calendar_file(calendar_file)
+        print(f"[Calendar] Calendar loaded successfully from '{calendar_file}'.")
+        return data
     except json.JSONDecodeError:
         print(f"[Calendar Error] Warning: {GLOBAL_CONFIG['JARVIS_NAME']} detected corrupted or empty JSON in calendar file. Starting with empty calendar.")
         speak(f"My calendar file seems corrupted. I'm starting with a fresh calendar. Apologies for the inconvenience.")
@@ -1672,134 +3535,817 @@ def _load_calendar_data():
         speak(f"An error occurred while loading my calendar. Some data might be inaccessible.")
         return []
 
+def _serialize_calendar_data(entries):
+    # Convert datetime objects to ISO strings for JSON serialization
+    return json.dumps([dict(entry, datetime=entry['datetime'].isoformat()) for entry in entries], indent=4)
+
+def _read_calendar_file(path):
+    """Parses the calendar file and records the version read as this process's base for conflict checks."""
+    with open(path, "r", encoding="utf-8") as f:
+        stat = os.fstat(f.fileno()) # The file that was actually read, even if it is replaced meanwhile
+        data = json.load(f)
+    # Convert ISO strings back to datetime objects for easier manipulation
+    for entry in data:
+        # Handle 'completed' status if it exists, default to False
+        entry['completed'] = entry.get('completed', False)
+        entry['triggered'] = entry.get('triggered', False) # New for alarms/timers
+        entry['datetime'] = datetime.datetime.fromisoformat(entry['datetime'])
+    persistence_writer.mark_synced(path, (stat.st_mtime_ns, stat.st_size), data)
+    return data
+
+def _resolve_calendar_conflict(theirs, ours):
+    """Our copy wins, but completion and firing are sticky so an alarm another process already fired isn't re-armed."""
+    resolved = dict(ours, completed=ours['completed'] or theirs['completed'], triggered=ours['triggered'] or theirs['triggered'])
+    if theirs.get('last_fired') and theirs['last_fired'] > (ours.get('last_fired') or ""):
+        resolved['last_fired'] = theirs['last_fired']
+    return resolved
+
+def _on_calendar_file_written(merged):
+    """Once the calendar file is written the index already reflects it (callers update it), unless it was merged."""
+    global _calendar_index_signature
+    if merged:
+        _calendar_index_signature = None
+        _reseed_calendar_schedule()
+    else:
+        _calendar_index_signature = _calendar_file_signature()
+
+def _on_calendar_file_changed(path):
+    """Store watcher callback: another process rewrote the calendar, so reload it and reschedule alarms/timers now."""
+    global _calendar_index_signature
+    if not persistence_writer.is_own_version(path):
+        _calendar_index_signature = None
+        print("[Calendar] Calendar was changed by another process; reloading.")
+        _reseed_calendar_schedule()
+
+CALENDAR_STORE = {"serialize": _serialize_calendar_data, "read": _read_calendar_file, "resolve": _resolve_calendar_conflict, "on_written": _on_calendar_file_written}
+
 def _save_calendar_data(data):
-    """Saves calendar data to the JSON file."""
+    """
+    Queues calendar data to be written to the JSON file in the background. Entries archived meanwhile
+    are dropped, since `data` may be a copy taken before the archival pass (e.g. at the start of a
+    voice dialogue) and must not bring them back into the live file.
+    """
     calendar_file = GLOBAL_CONFIG["CALENDAR_FILE"]
     try:
-        # Convert datetime objects to ISO strings for JSON serialization
-        serializable_data = []
-        for entry in data:
-            temp_entry = entry.copy()
-            temp_entry['datetime'] = temp_entry['datetime'].isoformat()
-            serializable_data.append(temp_entry)
-
-        with open(calendar_file, "w", encoding="utf-8") as f:
-            json.dump(serializable_data, f, indent=4)
-        print(f"[Calendar] Calendar saved successfully to '{calendar_file}'.")
+        persistence_writer.save(calendar_file, [dict(entry) for entry in data if entry.get('id') not in _calendar_archived_ids], CALENDAR_STORE)
     except Exception as e:
         speak(f"Sorry, {GLOBAL_CONFIG['JARVIS_NAME']} could not save the calendar data due to an error.")
         print(f"[Calendar Error] Error saving calendar data: {e}")
 
-def _parse_datetime_from_speech(text):
+# --- Recurring Calendar Entries (RRULE-style, expanded lazily) ---
+# An entry with a "recurrence" field such as "FREQ=WEEKLY;BYDAY=MO,TU,WE,TH,FR" repeats from its datetime.
+# Only the rule is stored; occurrences are generated on demand, so file size and memory stay constant.
+RRULE_WEEKDAYS = ["MO", "TU", "WE", "TH", "FR", "SA", "SU"]
+RRULE_MAX_EMPTY_PERIODS = 1000 # Consecutive periods without an occurrence before a rule is treated as ended
+
+RRULE_SUPPORTED_PARTS = {"FREQ", "INTERVAL", "BYDAY", "COUNT", "UNTIL", "WKST"}
+
+def _parse_rrule(rule):
     """
-    A simplified parser for dates/times from speech.
-    For robust parsing, use 'dateparser' library.
+    Parses the supported subset of an iCalendar RRULE (FREQ, INTERVAL, BYDAY, COUNT, UNTIL) into a dict.
+    Raises ValueError for anything outside it (BYMONTHDAY, BYSETPOS, ordinal days like 2TU, ...) rather
+    than quietly expanding a different rule.
     """
-    now = datetime.datetime.now()
-    today = now.date()
-    target_date = today
-    target_time = None # Default to no specific time, or current time if only date is given
+    parts = {}
+    for item in rule.split(";"):
+        if not item.strip():
+            continue
+        if "=" not in item:
+            raise ValueError(f"Malformed recurrence rule part: '{item}'")
+        name, value = item.split("=", 1)
+        parts[name.strip().upper()] = value.strip().upper()
+    unsupported = set(parts) - RRULE_SUPPORTED_PARTS
+    if unsupported:
+        raise ValueError(f"Unsupported recurrence rule parts: {', '.join(sorted(unsupported))}")
+    freq = parts.get("FREQ", "")
+    if freq not in ("DAILY", "WEEKLY", "MONTHLY"):
+        raise ValueError(f"Unsupported recurrence frequency: '{freq}'")
+    byday = None
+    if parts.get("BYDAY"):
+        if freq == "MONTHLY":
+            raise ValueError("BYDAY is not supported on monthly recurrences")
+        days = [day.strip() for day in parts["BYDAY"].split(",")]
+        unknown = [day for day in days if day not in RRULE_WEEKDAYS] # Includes ordinals such as '2TU' or '-1FR'
+        if unknown:
+            raise ValueError(f"Unsupported BYDAY values: {', '.join(unknown)}")
+        byday = sorted({RRULE_WEEKDAYS.index(day) for day in days})
+    for name in ("INTERVAL", "COUNT"):
+        if name in parts and (not parts[name].isdigit() or int(parts[name]) < 1):
+            raise ValueError(f"Invalid {name}: '{parts[name]}'")
+    if parts.get("WKST", "MO") not in RRULE_WEEKDAYS:
+        raise ValueError(f"Invalid WKST: '{parts['WKST']}'")
+    if parts.get("WKST", "MO") != "MO" and freq == "WEEKLY" and int(parts.get("INTERVAL", 1)) > 1 and byday and len(byday) > 1:
+        raise ValueError(f"Unsupported week start: '{parts['WKST']}'") # Weeks are counted from Monday; only matters here
+    until = None
+    if parts.get("UNTIL"):
+        until_text = parts["UNTIL"].rstrip("Z")
+        until = datetime.datetime.strptime(until_text, "%Y%m%dT%H%M%S") if "T" in until_text else datetime.datetime.strptime(until_text, "%Y%m%d").replace(hour=23, minute=59, second=59)
+        if parts["UNTIL"].endswith("Z"): # UTC, like a DTSTART ending in Z; occurrences are naive local times
+            until = until.replace(tzinfo=datetime.timezone.utc).astimezone().replace(tzinfo=None)
+    return {
+        "freq": freq,
+        "interval": max(1, int(parts.get("INTERVAL", 1))),
+        "byday": byday,
+        "count": int(parts["COUNT"]) if parts.get("COUNT") else None,
+        "until": until,
+    }
 
-    text_lower = text.lower()
+def _add_months(moment, months):
+    """Same day and time `months` later, or None when that day doesn't exist (e.g. February 30th)."""
+    month_index = moment.month - 1 + months
+    try:
+        return moment.replace(year=moment.year + month_index // 12, month=month_index % 12 + 1)
+    except ValueError:
+        return None
 
-    # --- Date Parsing ---
-    if "today" in text_lower:
-        target_date = today
-    elif "tomorrow" in text_lower:
-        target_date = today + datetime.timedelta(days=1)
-    elif "yesterday" in text_lower: # Added for flexibility, though usually for past events
-        target_date = today - datetime.timedelta(days=1)
-    elif "next monday" in text_lower:
-        days_until_monday = (0 - today.weekday() + 7) % 7 # 0 is Monday
-        if days_until_monday == 0: # If today is Monday, get next Monday
-            days_until_monday = 7
-        target_date = today + datetime.timedelta(days=days_until_monday)
-    elif "next tuesday" in text_lower:
-        days_until_tuesday = (1 - today.weekday() + 7) % 7
-        if days_until_tuesday == 0: days_until_tuesday = 7
-        target_date = today + datetime.timedelta(days=days_until_tuesday)
-    elif "next wednesday" in text_lower:
-        days_until_wednesday = (2 - today.weekday() + 7) % 7
-        if days_until_wednesday == 0: days_until_wednesday = 7
-        target_date = today + datetime.timedelta(days=days_until_wednesday)
-    elif "next thursday" in text_lower:
-        days_until_thursday = (3 - today.weekday() + 7) % 7
-        if days_until_thursday == 0: days_until_thursday = 7
-        target_date = today + datetime.timedelta(days=days_until_thursday)
-    elif "next friday" in text_lower:
-        days_until_friday = (4 - today.weekday() + 7) % 7
-        if days_until_friday == 0: days_until_friday = 7
-        target_date = today + datetime.timedelta(days=days_until_friday)
-    elif "next saturday" in text_lower:
-        days_until_saturday = (5 - today.weekday() + 7) % 7
-        if days_until_saturday == 0: days_until_saturday = 7
-        target_date = today + datetime.timedelta(days=days_until_saturday)
-    elif "next sunday" in text_lower:
-        days_until_sunday = (6 - today.weekday() + 7) % 7
-        if days_until_sunday == 0: days_until_sunday = 7
-        target_date = today + datetime.timedelta(days=days_until_sunday)
-    
-    # Check for specific day of week without "next" (implies current week or next if passed)
+def iter_occurrences(entry, start=None, end=None):
+    """
+    Yields occurrence datetimes of `entry` with start <= occurrence < end, in order.
+    One-shot entries yield their own datetime. Recurring entries are expanded lazily, period by period,
+    skipping straight to the query window when the rule has no COUNT. An entry saved with a rule outside
+    the supported subset (by an older import) is treated as one-shot, as a new import would be.
+    """
+    first = entry['datetime']
+    rule_text = entry.get('recurrence')
+    try:
+        rule = _parse_rrule(rule_text) if rule_text else None
+    except ValueError:
+        rule = None
+    if rule is None:
+        if (start is None or first >= start) and (end is None or first < end):
+            yield first
+        return
+
+    interval = rule["interval"]
+    if rule["freq"] == "DAILY" and rule["byday"] is not None:
+        reachable = {(first.weekday() + step * interval) % 7 for step in range(7)}
+        if not reachable.intersection(rule["byday"]):
+            return # e.g. every 7 days from a Tuesday, but only on Mondays: never
+    if rule["freq"] == "WEEKLY":
+        anchor = first - datetime.timedelta(days=first.weekday()) # Monday of the first week
+    else:
+        anchor = first
+
+    period = 0
+    if rule["count"] is None and start is not None and start > anchor:
+        # No COUNT to honour, so whole periods before the window can be skipped arithmetically
+        if rule["freq"] == "DAILY":
+            period = max(0, (start - anchor).days // interval - 1)
+        elif rule["freq"] == "WEEKLY":
+            period = max(0, (start - anchor).days // (7 * interval) - 1)
+        else:
+            period = max(0, ((start.year - anchor.year) * 12 + start.month - anchor.month) // interval - 1)
+
+    emitted = 0
+    empty_periods = 0
+    while True:
+        if rule["freq"] == "DAILY":
+            candidates = [anchor + datetime.timedelta(days=period * interval)]
+            if rule["byday"] is not None:
+                candidates = [c for c in candidates if c.weekday() in rule["byday"]]
+        elif rule["freq"] == "WEEKLY":
+            week_start = anchor + datetime.timedelta(weeks=period * interval)
+            weekdays = rule["byday"] if rule["byday"] is not None else [first.weekday()]
+            candidates = [week_start + datetime.timedelta(days=weekday) for weekday in weekdays]
+        else:
+            candidate = _add_months(anchor, period * interval)
+            candidates = [candidate] if candidate is not None else []
+
+        empty_periods += 1
+        for occurrence in candidates:
+            if occurrence < first:
+                continue
+            empty_periods = 0
+            if rule["until"] is not None and occurrence > rule["until"]:
+                return
+            emitted += 1
+            if rule["count"] is not None and emitted > rule["count"]:
+                return
+            if end is not None and occurrence >= end:
+                return
+            if start is None or occurrence >= start:
+                yield occurrence
+        if empty_periods > RRULE_MAX_EMPTY_PERIODS:
+            return # A rule that can't match any more (rather than running off the end of the calendar)
+        period += 1
+
+def next_occurrence(entry, after):
+    """First occurrence strictly after `after`, or None when the recurrence has ended."""
+    return next(iter_occurrences(entry, start=after + datetime.timedelta(microseconds=1)), None)
+
+def _parse_recurrence_from_speech(text):
+    """Maps phrases like 'every weekday', 'every day', 'every monday and friday' or 'every month' to an RRULE."""
+    text_lower = text.lower()
+    if "weekday" in text_lower:
+        return "FREQ=WEEKLY;BYDAY=MO,TU,WE,TH,FR"
+    if "weekend" in text_lower:
+        return "FREQ=WEEKLY;BYDAY=SA,SU"
+    if "month" in text_lower:
+        return "FREQ=MONTHLY"
     weekdays = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
-    for i, day in enumerate(weekdays):
-        if day in text_lower and "next" not in text_lower:
-            current_weekday = today.weekday() # Monday is 0, Sunday is 6
-            days_diff = i - current_weekday
-            if days_diff < 0: # If the day has already passed this week, assume next week
-                days_diff += 7
-            target_date = today + datetime.timedelta(days=days_diff)
-            break
+    named_days = [RRULE_WEEKDAYS[i] for i, day in enumerate(weekdays) if day in text_lower]
+    if named_days:
+        return "FREQ=WEEKLY;BYDAY=" + ",".join(named_days)
+    if "week" in text_lower:
+        return "FREQ=WEEKLY"
+    if "day" in text_lower or "daily" in text_lower or "night" in text_lower or "morning" in text_lower:
+        return "FREQ=DAILY"
+    return None
 
-    # --- Time Parsing (basic) ---
-    # Look for "at X (am/pm)"
-    time_match = None
-    for i in range(1, 13): # 1 to 12
-        if f"at {i} am" in text_lower:
-            time_match = (i, 0, "am")
-            break
-        if f"at {i} p m" in text_lower or f"at {i} pm" in text_lower:
-            time_match = (i, 0, "pm")
-            break
-        if f"at {i} o'clock" in text_lower:
-            time_match = (i, 0, "am") # Assume AM if not specified
-            break
-    
-    # Handle specific minutes if present (e.g., "at 3:30 pm") - very basic
-    if "at" in text_lower and ":" in text_lower:
+def _describe_recurrence(rule_text):
+    """Short spoken description of an RRULE."""
+    rule = _parse_rrule(rule_text)
+    if rule["freq"] == "DAILY":
+        return "every day"
+    if rule["freq"] == "MONTHLY":
+        return "every month"
+    if rule["byday"] == [0, 1, 2, 3, 4]:
+        return "every weekday"
+    if rule["byday"] == [5, 6]:
+        return "every weekend day"
+    days = [datetime.date(2024, 1, 1 + d).strftime("%A") for d in (rule["byday"] or [])]
+    return "every " + " and ".join(days) if days else "every week"
+
+
+# --- Calendar Index (time-sorted, with secondary indexes) ---
+CALENDAR_BUSY_TYPES = ("event", "reminder") # Entry types that can block time when they have a duration
+
+class CalendarIndex:
+    """
+    In-memory view of the calendar. Entries are kept in sorted (datetime, id) lists, one per
+    (type, state) pair, where state is 'active', 'triggered' or 'completed'. Range queries bisect
+    those lists, so asking for one day only touches that day's entries.
+
+    Entries with a 'duration_minutes' occupy [datetime, datetime + duration). Active one-shot busy
+    entries are also kept in one start-sorted list per duration: within a list, start order is end
+    order, and an entry of duration d overlaps [start, end) exactly when it starts in (start - d, end).
+    So an overlap query bisects each list straight to its overlapping entries, O(D log n + k) for D
+    distinct durations and k matches; one all-day event only widens the search in its own list.
+    Recurring busy entries are expanded only if their series (first start to the end of the last
+    occurrence, known from UNTIL or COUNT) can reach the window.
+    """
+    def __init__(self, entries=()):
+        self.lock = threading.RLock()
+        self.rebuild(entries)
+
+    @staticmethod
+    def _state_of(entry):
+        if entry.get('completed'):
+            return "completed"
+        if entry.get('triggered'):
+            return "triggered"
+        return "active"
+
+    def rebuild(self, entries):
+        with self.lock:
+            self._entries = {} # id -> entry dict
+            self._keys = {} # id -> ((type, state), (datetime, id)) as currently indexed
+            self._sorted = {} # (type, state) -> sorted list of (datetime, id)
+            self._recurring = set() # ids of entries with a recurrence rule
+            self._busy = {} # duration in minutes -> sorted list of (datetime, id) of active one-shot busy entries
+            self._recurring_busy = {} # id -> (first start, end of the last occurrence or None) of active recurring busy entries
+            for entry in entries:
+                self.add(entry)
+
+    def add(self, entry):
+        with self.lock:
+            if entry['id'] in self._entries:
+                self.remove(entry['id'])
+            bucket = (entry['type'], self._state_of(entry))
+            sort_key = (entry['datetime'], entry['id'])
+            bisect.insort(self._sorted.setdefault(bucket, []), sort_key)
+            self._entries[entry['id']] = entry
+            minutes = entry.get('duration_minutes') or 0
+            busy_minutes = minutes if minutes and bucket[0] in CALENDAR_BUSY_TYPES and bucket[1] == "active" else None
+            self._keys[entry['id']] = (bucket, sort_key, busy_minutes)
+            if entry.get('recurrence'):
+                self._recurring.add(entry['id'])
+                if busy_minutes:
+                    self._recurring_busy[entry['id']] = (entry['datetime'], self._series_end(entry, busy_minutes))
+            elif busy_minutes:
+                bisect.insort(self._busy.setdefault(busy_minutes, []), sort_key)
+
+    def remove(self, entry_id):
+        with self.lock:
+            entry = self._entries.pop(entry_id, None)
+            if entry is None:
+                return None
+            bucket, sort_key, busy_minutes = self._keys.pop(entry_id)
+            self._recurring.discard(entry_id)
+            self._recurring_busy.pop(entry_id, None)
+            self._discard_key(self._sorted[bucket], sort_key)
+            if busy_minutes in self._busy:
+                self._discard_key(self._busy[busy_minutes], sort_key)
+                if not self._busy[busy_minutes]:
+                    del self._busy[busy_minutes]
+            return entry
+
+    @staticmethod
+    def _discard_key(sorted_keys, sort_key):
+        position = bisect.bisect_left(sorted_keys, sort_key)
+        if position < len(sorted_keys) and sorted_keys[position] == sort_key:
+            del sorted_keys[position]
+
+    @staticmethod
+    def _series_end(entry, minutes):
+        """When the last occurrence of a recurring entry ends, or None if the series doesn't end."""
         try:
-            parts = text_lower.split("at")[1].strip().split(" ")
-            time_part = parts[0]
-            hour, minute = map(int, time_part.split(':'))
-            ampm = ""
-            if len(parts) > 1:
-                ampm = parts[1]
-            
-            if "pm" in ampm and hour < 12:
-                hour += 12
-            elif "am" in ampm and hour == 12: # 12 AM is midnight
-                hour = 0
-            target_time = datetime.time(hour, minute)
+            rule = _parse_rrule(entry['recurrence'])
         except ValueError:
-            pass # Failed to parse time, proceed without specific time
-    
-    if time_match:
-        hour, minute, ampm_str = time_match
-        if ampm_str == "pm" and hour < 12:
-            hour += 12
-        elif ampm_str == "am" and hour == 12: # 12 AM is midnight
-            hour = 0
-        target_time = datetime.time(hour, minute)
-
-    if target_time:
-        return datetime.datetime.combine(target_date, target_time)
-    else:
-        # If only date is specified, use a default time (e.g., start of day)
-        return datetime.datetime.combine(target_date, datetime.time(9, 0)) # Default to 9 AM
+            rule = {"count": 1, "until": None} # Expanded as a one-shot entry
+        if rule["count"] is not None:
+            last = None
+            for last in iter_occurrences(entry): # At most COUNT of them
+                pass
+            return last + datetime.timedelta(minutes=minutes) if last is not None else entry['datetime']
+        if rule["until"] is not None:
+            return rule["until"] + datetime.timedelta(minutes=minutes)
+        return None
+
+    def update(self, entry):
+        """Re-indexes an entry after its datetime, type, completed or triggered fields changed."""
+        self.add(entry)
+
+    def get(self, entry_id):
+        with self.lock:
+            return self._entries.get(entry_id)
+
+    def entries(self):
+        """All entries (the indexed dicts themselves), in datetime order."""
+        return list(self.range())
+
+    def range(self, start=None, end=None, types=None, states=None, expand_recurring=False):
+        """
+        Yields entries with start <= datetime < end, optionally limited to some types/states, in datetime order.
+        With `expand_recurring`, recurring entries are replaced by their occurrences in the window (copies whose
+        datetime is the occurrence); without an end, only each one's next occurrence is included.
+        """
+        with self.lock:
+            slices = []
+            for (entry_type, state), sorted_keys in self._sorted.items():
+                if types is not None and entry_type not in types:
+                    continue
+                if states is not None and state not in states:
+                    continue
+                low = bisect.bisect_left(sorted_keys, (start,)) if start is not None else 0
+                high = bisect.bisect_left(sorted_keys, (end,)) if end is not None else len(sorted_keys)
+                if low < high:
+                    window = sorted_keys[low:high]
+                    if expand_recurring and self._recurring:
+                        window = [key for key in window if key[1] not in self._recurring]
+                    slices.append(window)
+
+            if expand_recurring and self._recurring:
+                occurrence_start = start or jarvis_clock.now()
+                occurrences = []
+                for entry_id in self._recurring:
+                    entry = self._entries[entry_id]
+                    if types is not None and entry['type'] not in types:
+                        continue
+                    if states is not None and self._state_of(entry) not in states:
+                        continue
+                    expansion = iter_occurrences(entry, start=occurrence_start, end=end)
+                    if end is None:
+                        expansion = itertools.islice(expansion, 1)
+                    occurrences.extend((occurrence, entry_id) for occurrence in expansion)
+                occurrences.sort()
+                slices.append(occurrences)
+                matches = []
+                for when, entry_id in heapq.merge(*slices):
+                    entry = self._entries[entry_id]
+                    if entry_id in self._recurring:
+                        entry = dict(entry, datetime=when)
+                    matches.append(entry)
+            else:
+                matches = [self._entries[entry_id] for _, entry_id in heapq.merge(*slices)]
+        return iter(matches)
+
+    def overlapping(self, start, end, exclude_id=None):
+        """
+        Active reminders/events (including recurring occurrences) whose [datetime, datetime + duration) overlaps
+        [start, end), in datetime order. Recurring entries are returned as copies whose datetime is the occurrence.
+        """
+        with self.lock:
+            matches = []
+            for minutes, sorted_keys in self._busy.items():
+                duration = datetime.timedelta(minutes=minutes)
+                low = bisect.bisect_left(sorted_keys, (start - duration,))
+                high = bisect.bisect_left(sorted_keys, (end,))
+                matches.extend((when, entry_id) for when, entry_id in sorted_keys[low:high] if when + duration > start)
+            for entry_id, (first_start, series_end) in self._recurring_busy.items():
+                if first_start >= end or (series_end is not None and series_end <= start):
+                    continue # The series can't reach the window
+                entry = self._entries[entry_id]
+                duration = datetime.timedelta(minutes=entry['duration_minutes'])
+                matches.extend((occurrence, entry_id) for occurrence in iter_occurrences(entry, start=start - duration, end=end)
+                               if occurrence + duration > start)
+            matches.sort()
+            return [
+                dict(self._entries[entry_id], datetime=when) if entry_id in self._recurring else self._entries[entry_id]
+                for when, entry_id in matches if entry_id != exclude_id
+            ]
+
+    def free_slots(self, start, end, min_minutes=15):
+        """Gaps of at least `min_minutes` between busy entries in [start, end), as (slot_start, slot_end) pairs."""
+        slots = []
+        cursor = start
+        for entry in self.overlapping(start, end):
+            busy_until = entry['datetime'] + datetime.timedelta(minutes=entry['duration_minutes'])
+            if entry['datetime'] > cursor:
+                slots.append((cursor, min(entry['datetime'], end)))
+            cursor = max(cursor, busy_until)
+        if cursor < end:
+            slots.append((cursor, end))
+        return [(a, b) for a, b in slots if b - a >= datetime.timedelta(minutes=min_minutes)]
+
+
+calendar_index = None
+_calendar_index_signature = None
+_calendar_index_lock = threading.Lock() # The scheduler, store watcher and main threads all get the index
+
+def _calendar_file_signature():
+    """Cheap change marker for the calendar file: (modification time, size), or None if missing."""
+    return _file_signature(GLOBAL_CONFIG["CALENDAR_FILE"])
+
+def get_calendar_index():
+    """Returns the calendar index, reloading it only if the calendar file was changed by someone else."""
+    global calendar_index, _calendar_index_signature
+    with _calendar_index_lock:
+        signature = _calendar_file_signature()
+        if calendar_index is None or signature != _calendar_index_signature:
+            # The index's entries are edited in place, so they must not be a pending save's own dicts
+            calendar_index = CalendarIndex([dict(entry) for entry in _load_calendar_data()])
+            _calendar_index_signature = signature
+        return calendar_index
+
+# --- Date/Time Speech Grammar (compiled once, single pass) ---
+# Spoken numbers are first rewritten to digits ("twenty five" -> "25", "third" -> "3rd"), then one
+# precompiled alternation regex tokenizes the phrase. Each match's named group selects a handler that
+# fills in date, time and offset slots, which are resolved into a datetime at the end.
+_NUMBER_WORDS = {
+    "zero": 0, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8,
+    "nine": 9, "ten": 10, "eleven": 11, "twelve": 12, "thirteen": 13, "fourteen": 14, "fifteen": 15,
+    "sixteen": 16, "seventeen": 17, "eighteen": 18, "nineteen": 19,
+}
+_TENS_WORDS = {"twenty": 20, "thirty": 30, "forty": 40, "fifty": 50, "sixty": 60, "seventy": 70, "eighty": 80, "ninety": 90}
+_ORDINAL_WORDS = {
+    "first": 1, "second": 2, "third": 3, "fourth": 4, "fifth": 5, "sixth": 6, "seventh": 7, "eighth": 8,
+    "ninth": 9, "tenth": 10, "eleventh": 11, "twelfth": 12, "thirteenth": 13, "fourteenth": 14,
+    "fifteenth": 15, "sixteenth": 16, "seventeenth": 17, "eighteenth": 18, "nineteenth": 19,
+    "twentieth": 20, "thirtieth": 30,
+}
+_MONTH_NAMES = ["january", "february", "march", "april", "may", "june", "july", "august", "september", "october", "november", "december"]
+_MONTH_NUMBERS = {name: i + 1 for i, name in enumerate(_MONTH_NAMES)}
+_MONTH_NUMBERS.update({name[:3]: i + 1 for i, name in enumerate(_MONTH_NAMES)})
+_MONTH_NUMBERS["sept"] = 9
+_WEEKDAY_NAMES = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+_PART_OF_DAY_HOURS = {"morning": 9, "afternoon": 15, "evening": 19, "night": 20, "tonight": 20}
+_DURATION_UNIT_SECONDS = {"second": 1, "sec": 1, "minute": 60, "min": 60, "hour": 3600, "hr": 3600, "day": 86400, "week": 604800}
+
+_SPEECH_CLEANUP_PATTERN = re.compile(r"\b([ap])\.? ?m\b\.?|[,!?]|(?<=[a-z])-(?=[a-z])")
+_MONTH_ALTERNATION = "|".join(sorted(_MONTH_NUMBERS, key=len, reverse=True))
+_DURATION_QUANTITY = r"(?:\d+(?:\.\d+)?(?: and a half)?|an?|half an?|(?:a )?quarter(?: of an?)?)"
+_DURATION_UNIT = r"(?:second|sec|minute|min|hour|hr|day|week)s?"
+_DURATION_PART_PATTERN = re.compile(rf"\b(?P<qty>{_DURATION_QUANTITY}) (?P<unit>{_DURATION_UNIT})(?P<half> and a half)?\b")
+_DURATION_SEQUENCE = rf"{_DURATION_QUANTITY} {_DURATION_UNIT}(?: and a half)?(?:(?: and)? {_DURATION_QUANTITY} {_DURATION_UNIT})*"
+_TIME_PREFIX = r"(?:(?:at|by|for|around) )?"
+
+_DATETIME_GRAMMAR = re.compile("|".join([
+    rf"\bin (?P<in_duration>{_DURATION_SEQUENCE})\b",
+    r"\b(?P<iso_date>(?P<iso_y>\d{4})-(?P<iso_m>\d{1,2})-(?P<iso_d>\d{1,2}))\b",
+    r"\b(?P<slash_date>(?P<sl_m>\d{1,2})/(?P<sl_d>\d{1,2})(?:/(?P<sl_y>\d{2}|\d{4}))?)\b",
+    rf"\b(?:on )?(?P<month_day>(?P<md_month>{_MONTH_ALTERNATION}) (?:the )?(?P<md_day>\d{{1,2}})(?:st|nd|rd|th)?(?: (?P<md_year>\d{{4}}))?)\b",
+    rf"\b(?:on )?(?P<day_month>(?:the )?(?P<dm_day>\d{{1,2}})(?:st|nd|rd|th)? (?:of )?(?P<dm_month>{_MONTH_ALTERNATION})(?: (?P<dm_year>\d{{4}}))?)\b",
+    r"\b(?P<day_after_tomorrow>(?:the )?day after tomorrow)\b",
+    r"\b(?P<rel_day>today|tonight|tomorrow|yesterday)\b",
+    r"\b(?P<next_week>next week)\b",
+    rf"\b(?:on )?(?:(?P<weekday_mod>this|next|coming) )?(?P<weekday>{'|'.join(_WEEKDAY_NAMES)})\b",
+    rf"{_TIME_PREFIX}\b(?P<past_to>(?P<pt_min>half|(?:a )?quarter|\d{{1,2}})(?: minutes?)? (?P<pt_dir>past|after|to|before|till) (?P<pt_hour>\d{{1,2}}|noon|midnight))(?: (?P<pt_mer>am|pm))?\b",
+    rf"{_TIME_PREFIX}\b(?P<clock>(?P<ck_hour>\d{{1,2}})(?::| )(?P<ck_min>[0-5]\d))(?: (?P<ck_mer>am|pm))?\b",
+    rf"{_TIME_PREFIX}\b(?P<hour_mer>(?P<hm_hour>\d{{1,2}}) ?(?P<hm_mer>am|pm))\b",
+    rf"{_TIME_PREFIX}\b(?P<oclock>(?P<oc_hour>\d{{1,2}}) o'?clock)\b",
+    rf"{_TIME_PREFIX}\b(?P<named_time>noon|midday|midnight)\b",
+    r"\b(?:this |in the |at )?(?P<part_of_day>morning|afternoon|evening|night)\b",
+    r"\b(?:at|by|around) (?P<at_hour>\d{1,2})\b",
+]))
+
+def _normalize_spoken_numbers(text):
+    """Lowercases a phrase and rewrites spoken numbers and ordinals as digits ("twenty five past seven" -> "25 past 7")."""
+    text = _SPEECH_CLEANUP_PATTERN.sub(lambda m: f"{m.group(1)}m" if m.group(1) else " ", text.lower())
+    words = text.split()
+    out = []
+    i = 0
+    while i < len(words):
+        word = words[i]
+        nxt = words[i + 1] if i + 1 < len(words) else None
+        if word in _TENS_WORDS:
+            value = _TENS_WORDS[word]
+            if nxt in _NUMBER_WORDS and 0 < _NUMBER_WORDS[nxt] < 10:
+                out.append(str(value + _NUMBER_WORDS[nxt]))
+                i += 2
+                continue
+            if nxt in _ORDINAL_WORDS and _ORDINAL_WORDS[nxt] < 10:
+                out.append(f"{value + _ORDINAL_WORDS[nxt]}th")
+                i += 2
+                continue
+            out.append(str(value))
+        elif word in _NUMBER_WORDS:
+            out.append(str(_NUMBER_WORDS[word]))
+        elif word in _ORDINAL_WORDS and (word != "second" or (out and (out[-1] == "the" or out[-1] in _MONTH_NUMBERS))):
+            # "second" is only an ordinal after "the" or a month; otherwise it is a unit of time
+            out.append(f"{_ORDINAL_WORDS[word]}th")
+        elif word in ("oh", "o") and out and out[-1].isdigit() and nxt in _NUMBER_WORDS and 0 < _NUMBER_WORDS[nxt] < 10:
+            # "seven oh five" -> "7:05"
+            out[-1] = f"{out[-1]}:0{_NUMBER_WORDS[nxt]}"
+            i += 2
+            continue
+        else:
+            out.append(word)
+        i += 1
+    return " ".join(out)
+
+def _duration_seconds_from_normalized(text):
+    """Sums every "<quantity> <unit>" part of an already-normalized phrase. Returns seconds or None."""
+    total = 0.0
+    found = False
+    for part in _DURATION_PART_PATTERN.finditer(text):
+        qty = part.group("qty")
+        if qty in ("a", "an"):
+            amount = 1.0
+        elif qty.startswith("half"):
+            amount = 0.5
+        elif "quarter" in qty:
+            amount = 0.25
+        else:
+            amount = float(qty.split(" ")[0]) + (0.5 if qty.endswith("and a half") else 0.0)
+        if part.group("half"):
+            amount += 0.5
+        unit = part.group("unit").rstrip("s") if part.group("unit") not in ("secs", "mins", "hrs") else part.group("unit")[:-1]
+        total += amount * _DURATION_UNIT_SECONDS[unit]
+        found = True
+    return int(round(total)) if found and total > 0 else None
+
+def _parse_duration_from_speech(text):
+    """Parses durations like '5 minutes', 'an hour and a half' or 'one hour twenty minutes'. Returns seconds or None."""
+    if not text:
+        return None
+    return _duration_seconds_from_normalized(_normalize_spoken_numbers(text))
+
+def _to_24_hour(hour, meridiem, part_of_day):
+    """Applies an explicit am/pm, or an 'afternoon'/'evening' hint, to a spoken hour."""
+    if meridiem == "pm" and hour < 12:
+        return hour + 12
+    if meridiem == "am" and hour == 12:
+        return 0
+    if not meridiem and part_of_day in ("afternoon", "evening", "night", "tonight") and 1 <= hour < 12:
+        return hour + 12
+    return hour
+
+def _infer_year(month, day, today):
+    """Dates spoken without a year mean the next time that date comes around."""
+    candidate = datetime.date(today.year, month, day)
+    return candidate if candidate >= today else datetime.date(today.year + 1, month, day)
+
+def _parse_datetime_from_speech(text, now=None):
+    """
+    Parses dates and times from speech: relative days ('tomorrow', 'day after tomorrow', 'in three days'),
+    weekdays ('friday', 'next tuesday'), absolute dates ('march 5th', 'the 3rd of june', '2025-07-01'),
+    spoken times ('half past seven', 'quarter to 5 pm', 'seven thirty in the evening', 'noon') and offsets
+    ('in twenty minutes'). Returns a datetime, or None if nothing in the phrase was understood.
+    """
+    if not text:
+        return None
+    now = now or jarvis_clock.now()
+    today = now.date()
+    normalized = _normalize_spoken_numbers(text)
+
+    target_date = None
+    hour = minute = None
+    minute_shift = 0 # "quarter to five": the am/pm applies to five, then 15 minutes are taken off
+    meridiem = None
+    part_of_day = None
+    offset_seconds = None
+    try:
+        for match in _DATETIME_GRAMMAR.finditer(normalized):
+            if match.group("in_duration"):
+                seconds = _duration_seconds_from_normalized(match.group("in_duration"))
+                if seconds and seconds % 86400 == 0:
+                    target_date = today + datetime.timedelta(seconds=seconds)
+                elif seconds:
+                    offset_seconds = seconds
+            elif match.group("iso_date"):
+                target_date = datetime.date(int(match.group("iso_y")), int(match.group("iso_m")), int(match.group("iso_d")))
+            elif match.group("slash_date"):
+                month, day = int(match.group("sl_m")), int(match.group("sl_d"))
+                year = match.group("sl_y")
+                if year:
+                    target_date = datetime.date(int(year) + (2000 if len(year) == 2 else 0), month, day)
+                else:
+                    target_date = _infer_year(month, day, today)
+            elif match.group("month_day") or match.group("day_month"):
+                prefix = "md" if match.group("month_day") else "dm"
+                month = _MONTH_NUMBERS[match.group(f"{prefix}_month")]
+                day = int(match.group(f"{prefix}_day"))
+                year = match.group(f"{prefix}_year")
+                target_date = datetime.date(int(year), month, day) if year else _infer_year(month, day, today)
+            elif match.group("day_after_tomorrow"):
+                target_date = today + datetime.timedelta(days=2)
+            elif match.group("rel_day"):
+                word = match.group("rel_day")
+                target_date = today + datetime.timedelta(days={"today": 0, "tonight": 0, "tomorrow": 1, "yesterday": -1}[word])
+                if word == "tonight":
+                    part_of_day = "tonight"
+            elif match.group("next_week"):
+                target_date = today + datetime.timedelta(days=7)
+            elif match.group("weekday"):
+                days_ahead = (_WEEKDAY_NAMES.index(match.group("weekday")) - today.weekday()) % 7
+                if days_ahead == 0 and match.group("weekday_mod") in ("next", "coming"):
+                    days_ahead = 7
+                target_date = today + datetime.timedelta(days=days_ahead)
+            elif match.group("past_to"):
+                spoken_minutes = match.group("pt_min")
+                minutes = 30 if spoken_minutes == "half" else 15 if "quarter" in spoken_minutes else int(spoken_minutes)
+                spoken_hour = match.group("pt_hour")
+                towards = match.group("pt_dir") in ("to", "before", "till")
+                hour = 12 if spoken_hour == "noon" else (24 if towards else 0) if spoken_hour == "midnight" else int(spoken_hour)
+                minute, minute_shift = 0, -minutes if towards else minutes
+                meridiem = match.group("pt_mer") or (None if spoken_hour not in ("noon", "midnight") else "fixed")
+            elif match.group("clock"):
+                hour, minute = int(match.group("ck_hour")), int(match.group("ck_min"))
+                meridiem = match.group("ck_mer")
+            elif match.group("hour_mer"):
+                hour, minute = int(match.group("hm_hour")), 0
+                meridiem = match.group("hm_mer")
+            elif match.group("oclock"):
+                hour, minute = int(match.group("oc_hour")), 0
+            elif match.group("named_time"):
+                hour, minute = (0 if match.group("named_time") == "midnight" else 12), 0
+                meridiem = "fixed"
+            elif match.group("part_of_day"):
+                part_of_day = match.group("part_of_day")
+            elif match.group("at_hour") and hour is None:
+                hour, minute = int(match.group("at_hour")), 0
+
+        if offset_seconds is not None and target_date is None and hour is None:
+            return now + datetime.timedelta(seconds=offset_seconds)
+        if hour is not None:
+            if hour > 24 or minute > 59:
+                return None
+            fixed = meridiem == "fixed" # noon/midnight ignore am/pm and part-of-day hints
+            hour = _to_24_hour(hour, None if fixed else meridiem, None if fixed else part_of_day)
+            time_of_day = datetime.timedelta(hours=hour, minutes=minute + minute_shift)
+        elif part_of_day:
+            time_of_day = datetime.timedelta(hours=_PART_OF_DAY_HOURS[part_of_day])
+        elif target_date is not None:
+            time_of_day = datetime.timedelta(hours=9) # Date without a time defaults to 9 AM
+        else:
+            return None
+
+        if target_date is None:
+            # A bare time means its next occurrence: "7 AM" said in the evening is tomorrow morning
+            result = datetime.datetime.combine(today, datetime.time.min) + time_of_day
+            return result if result > now else result + datetime.timedelta(days=1)
+        return datetime.datetime.combine(target_date, datetime.time.min) + time_of_day
+    except (ValueError, OverflowError):
+        return None # e.g. "february 30th"
+
+def _spoken_number(n):
+    """Renders 0-99 in words, as a speech recognizer might transcribe it."""
+    if n < 20:
+        return next(word for word, value in _NUMBER_WORDS.items() if value == n)
+    tens = next(word for word, value in _TENS_WORDS.items() if value == n - n % 10)
+    return tens if n % 10 == 0 else f"{tens} {_spoken_number(n % 10)}"
+
+def _generate_datetime_corpus(now, count=5000, seed=7):
+    """
+    Builds a labelled corpus of (phrase, kind, expected) tuples, where kind is 'datetime' or 'duration'.
+    Expected values are computed from the template parameters, independently of the parser.
+    """
+    rng = random.Random(seed)
+    today = now.date()
+
+    def spoken_or_digits(n):
+        return _spoken_number(n) if rng.random() < 0.5 else str(n)
+
+    def future_time(t):
+        result = datetime.datetime.combine(today, t)
+        return result if result > now else result + datetime.timedelta(days=1)
+
+    def time_phrase():
+        hour12 = rng.randint(1, 12)
+        pm = rng.random() < 0.5
+        hour24 = (hour12 % 12) + (12 if pm else 0)
+        style = rng.randrange(6)
+        if style == 0:
+            return f"at {spoken_or_digits(hour12)} {'pm' if pm else 'am'}", datetime.time(hour24, 0)
+        if style == 1:
+            minute = rng.choice([5, 10, 15, 20, 25, 30, 40, 45, 50, 55])
+            spoken_minute = _spoken_number(minute) if minute >= 10 else f"oh {_spoken_number(minute)}"
+            spoken = f"{hour12}:{minute:02d}" if rng.random() < 0.5 else f"{_spoken_number(hour12)} {spoken_minute}"
+            return f"at {spoken} {'p.m.' if pm else 'a.m.'}", datetime.time(hour24, minute)
+        if style == 2:
+            return f"at half past {spoken_or_digits(hour12)} {'pm' if pm else 'am'}", datetime.time(hour24, 30)
+        if style == 3:
+            hour12 = rng.randint(1, 11)
+            hour24 = hour12 + (12 if pm else 0)
+            target = datetime.datetime.combine(today, datetime.time(hour24, 0)) - datetime.timedelta(minutes=15)
+            return f"at quarter to {spoken_or_digits(hour12)} {'pm' if pm else 'am'}", target.time()
+        if style == 4:
+            hour12 = rng.randint(1, 11)
+            part = rng.choice(["morning", "afternoon", "evening"])
+            hour24 = hour12 if part == "morning" else hour12 + 12
+            return f"at {spoken_or_digits(hour12)} in the {part}", datetime.time(hour24, 0)
+        return rng.choice([("at noon", datetime.time(12, 0)), ("at midnight", datetime.time(0, 0))])
+
+    corpus = []
+    while len(corpus) < count:
+        template = rng.randrange(8)
+        if template == 0:
+            word, days = rng.choice([("today", 0), ("tomorrow", 1), ("the day after tomorrow", 2)])
+            phrase, t = time_phrase()
+            corpus.append((f"{word} {phrase}", "datetime", datetime.datetime.combine(today + datetime.timedelta(days=days), t)))
+        elif template == 1:
+            weekday = rng.randrange(7)
+            modifier = rng.choice(["", "next ", "this "])
+            days_ahead = (weekday - today.weekday()) % 7
+            if days_ahead == 0 and modifier == "next ":
+                days_ahead = 7
+            phrase, t = time_phrase()
+            corpus.append((f"on {modifier}{_WEEKDAY_NAMES[weekday]} {phrase}", "datetime", datetime.datetime.combine(today + datetime.timedelta(days=days_ahead), t)))
+        elif template == 2:
+            date = today + datetime.timedelta(days=rng.randint(1, 360))
+            month = _MONTH_NAMES[date.month - 1]
+            ordinal = next((w for w, v in _ORDINAL_WORDS.items() if v == date.day), None) if rng.random() < 0.3 else None
+            day_text = ordinal or f"{date.day}{'th' if rng.random() < 0.5 else ''}"
+            spoken_date = f"{month} {day_text}" if rng.random() < 0.5 else f"the {day_text} of {month}"
+            phrase, t = time_phrase()
+            corpus.append((f"{spoken_date} {phrase}", "datetime", datetime.datetime.combine(date, t)))
+        elif template == 3:
+            date = today + datetime.timedelta(days=rng.randint(-30, 720))
+            corpus.append((f"{date.isoformat()}", "datetime", datetime.datetime.combine(date, datetime.time(9, 0))))
+        elif template == 4:
+            minutes = rng.randint(1, 59)
+            corpus.append((f"in {spoken_or_digits(minutes)} minutes", "datetime", now + datetime.timedelta(minutes=minutes)))
+        elif template == 5:
+            phrase, t = time_phrase()
+            corpus.append((phrase, "datetime", future_time(t)))
+        elif template == 6:
+            hours, minutes = rng.randint(0, 3), rng.choice([0, 5, 10, 15, 20, 30, 45])
+            if hours == 0 and minutes == 0:
+                minutes = 10
+            parts = []
+            if hours:
+                parts.append("an hour" if hours == 1 and rng.random() < 0.5 else f"{spoken_or_digits(hours)} hour{'s' if hours > 1 else ''}")
+            if minutes:
+                parts.append(f"{spoken_or_digits(minutes)} minutes")
+            corpus.append((" and ".join(parts), "duration", hours * 3600 + minutes * 60))
+        else:
+            phrase, seconds = rng.choice([
+                ("half an hour", 1800), ("an hour and a half", 5400), ("two and a half hours", 9000),
+                ("ninety seconds", 90), ("a quarter of an hour", 900), ("45 secs", 45), ("one hour thirty minutes", 5400),
+            ])
+            corpus.append((phrase, "duration", seconds))
+    return corpus
+
+def benchmark_datetime_parser(count=5000):
+    """Measures accuracy and per-phrase latency of the date/time and duration parsers on the generated corpus."""
+    now = datetime.datetime(2025, 6, 11, 14, 20) # Fixed reference time so the run is reproducible
+    corpus = _generate_datetime_corpus(now, count)
+    failures = []
+    start = time.perf_counter()
+    for phrase, kind, expected in corpus:
+        result = _parse_datetime_from_speech(phrase, now=now) if kind == "datetime" else _parse_duration_from_speech(phrase)
+        if result != expected:
+            failures.append((phrase, expected, result))
+    elapsed = time.perf_counter() - start
+
+    accuracy = 100.0 * (len(corpus) - len(failures)) / len(corpus)
+    print(f"[Benchmark] {len(corpus)} phrases: {accuracy:.2f}% parsed correctly, {elapsed / len(corpus) * 1e6:.1f} us per phrase.")
+    for phrase, expected, result in failures[:10]:
+        print(f"[Benchmark] Mismatch: '{phrase}' expected {expected}, got {result}")
+    return {"phrases": len(corpus), "accuracy": accuracy, "seconds_per_phrase": elapsed / len(corpus), "failures": failures}
+
+
+def _ask_for_recurrence():
+    """Asks how often an entry repeats. Returns an RRULE string, or None if cancelled or not understood."""
+    speak("How often should it repeat? For example, 'every day', 'every weekday', or 'every Monday and Thursday'. Say 'cancel' to abort.")
+    recurrence_text = listen_command("Listening for how often...")
+    if recurrence_text == "cancel_command" or not recurrence_text:
+        return None
+    recurrence = _parse_recurrence_from_speech(recurrence_text)
+    if not recurrence:
+        speak("I couldn't understand how often it should repeat. Please try again.")
+        print(f"[Calendar Error] Invalid recurrence: {recurrence_text}")
+    return recurrence
+
+CALENDAR_LISTING_ACTIONS = ("show_reminders", "show_reminders_for_day", "show_timers", "show_alarms", "show_history", "find_free_time")
 
 def manage_calendar_event(action_type, user_command_raw=None):
-    calendar_data = _load_calendar_data()
+    index = get_calendar_index()
+    # Listing commands only run range queries on the index; everything else edits the full list
+    calendar_data = [] if action_type in CALENDAR_LISTING_ACTIONS else index.entries()
 
-    if action_type == "add_reminder" or action_type == "add_event":
+    if action_type in ("add_reminder", "add_event", "add_repeating_reminder"):
         speak("What is the reminder or event for? Say 'cancel' to abort.")
         event_text = listen_command("Listening for event text...")
         if event_text == "cancel_command": return
@@ -1820,29 +4366,52 @@ def manage_calendar_event(action_type, user_command_raw=None):
             print(f"[Calendar Error] Failed to parse datetime from: '{time_text}'")
             return
 
-        new_id = 1
-        if calendar_data:
-            existing_ids = [item.get("id", 0) for item in calendar_data if isinstance(item.get("id"), int)]
-            if existing_ids:
-                new_id = max(existing_ids) + 1
+        recurrence = None
+        if action_type == "add_repeating_reminder":
+            recurrence = _ask_for_recurrence()
+            if not recurrence: return
+
+        duration_minutes = 0
+        if action_type == "add_event":
+            speak("How long will it last? For example, 'one hour' or 'forty five minutes'.")
+            duration_text = listen_command("Listening for duration...")
+            if duration_text == "cancel_command": return
+            duration_seconds = _parse_duration_from_speech(duration_text)
+            duration_minutes = -(-duration_seconds // 60) if duration_seconds else GLOBAL_CONFIG["DEFAULT_EVENT_DURATION_MINUTES"]
+
+        if duration_minutes:
+            # Checked against the first occurrence; warn rather than refuse, the user may double-book on purpose
+            conflicts = index.overlapping(parsed_datetime, parsed_datetime + datetime.timedelta(minutes=duration_minutes))
+            for conflict in conflicts[:3]:
+                speak(f"Heads up, this overlaps with '{conflict['text']}' at {conflict['datetime'].strftime('%I:%M %p on %A, %B %d')}.")
+            if conflicts:
+                print(f"[Calendar Warning] New entry overlaps {len(conflicts)} existing entries: {[c['id'] for c in conflicts]}")
+
+        new_id = _next_calendar_id(calendar_data)
 
         new_entry = {
             "id": new_id,
-            "type": "reminder" if action_type == "add_reminder" else "event",
+            "type": "event" if action_type == "add_event" else "reminder",
             "text": event_text,
             "datetime": parsed_datetime, # Stored as datetime object, converted to ISO string on save
             "completed": False, # New field
             "triggered": False # New field for alarms/timers
         }
+        if recurrence:
+            new_entry["recurrence"] = recurrence
+        if duration_minutes:
+            new_entry["duration_minutes"] = duration_minutes
         calendar_data.append(new_entry)
+        index.add(new_entry)
         _save_calendar_data(calendar_data)
-        speak(f"Okay, I've added your {new_entry['type']} for '{event_text}' on {parsed_datetime.strftime('%A, %B %d at %I:%M %p')}.")
+        if recurrence:
+            speak(f"Okay, I've added your repeating reminder for '{event_text}' {_describe_recurrence(recurrence)} at {parsed_datetime.strftime('%I:%M %p')}.")
+        else:
+            speak(f"Okay, I've added your {new_entry['type']} for '{event_text}' on {parsed_datetime.strftime('%A, %B %d at %I:%M %p')}.")
         print(f"[Calendar Action] Added {new_entry['type']} (ID {new_id}): '{event_text}' at {parsed_datetime}")
 
     elif action_type == "show_reminders":
-        upcoming_events = sorted([
-            e for e in calendar_data if e['datetime'] >= datetime.datetime.now() and not e['completed'] and e['type'] in ["reminder", "event"]
-        ], key=lambda x: x['datetime'])
+        upcoming_events = list(index.range(start=jarvis_clock.now(), types=("reminder", "event"), states=("active", "triggered"), expand_recurring=True))
 
         if not upcoming_events:
             speak("You have no upcoming reminders or appointments.")
@@ -1869,12 +4438,15 @@ def manage_calendar_event(action_type, user_command_raw=None):
             speak("No day provided. Aborting.")
             return
 
-        target_date_obj = _parse_datetime_from_speech(day_query).date() # Get just the date part
+        parsed_day = _parse_datetime_from_speech(day_query)
+        if not parsed_day:
+            speak(f"I couldn't understand which day '{day_query}' is. Please try again.")
+            print(f"[Calendar Error] Failed to parse day from: '{day_query}'")
+            return
+        target_date_obj = parsed_day.date() # Get just the date part
 
-        reminders_for_day = sorted([
-            e for e in calendar_data 
-            if e['datetime'].date() == target_date_obj and not e['completed'] and e['type'] in ["reminder", "event"]
-        ], key=lambda x: x['datetime'])
+        day_start = datetime.datetime.combine(target_date_obj, datetime.time.min)
+        reminders_for_day = list(index.range(start=day_start, end=day_start + datetime.timedelta(days=1), types=("reminder", "event"), states=("active", "triggered"), expand_recurring=True))
 
         if not reminders_for_day:
             speak(f"You have no reminders or appointments for {target_date_obj.strftime('%A, %B %d')}.")
@@ -1908,7 +4480,9 @@ def manage_calendar_event(action_type, user_command_raw=None):
                 confirmation = listen_command(prompt="Confirm deletion...")
                 if confirmation == "yes":
                     calendar_data = [e for e in calendar_data if e.get('id') != event_id_to_delete]
+                    index.remove(event_id_to_delete)
                     _save_calendar_data(calendar_data)
+                    alarm_scheduler.cancel(("calendar", event_id_to_delete))
                     speak(f"Reminder or event with ID {event_id_to_delete} has been deleted.")
                     print(f"[Calendar Action] Deleted event with ID: {event_id_to_delete}")
                 else:
@@ -1928,7 +4502,9 @@ def manage_calendar_event(action_type, user_command_raw=None):
         speak(f"Are you sure you want {GLOBAL_CONFIG['JARVIS_NAME']} to clear all your reminders and events? This action cannot be undone. Say 'yes' to confirm or 'no' to cancel.")
         confirmation = listen_command(prompt="Say 'yes' to confirm or 'no' to cancel.")
         if "yes" in confirmation:
+            index.rebuild([])
             _save_calendar_data([]) # Save an empty list
+            alarm_scheduler.cancel_where(lambda key: key[0] == "calendar")
             speak(f"All reminders and events have been cleared.")
             print("[Calendar Action] All calendar entries cleared.")
         else:
@@ -1947,6 +4523,7 @@ def manage_calendar_event(action_type, user_command_raw=None):
                 if event.get('id') == event_id_to_complete:
                     if not event['completed']:
                         event['completed'] = True
+                        index.update(event)
                         event_found = True
                         break
                     else:
@@ -1956,7 +4533,7 @@ def manage_calendar_event(action_type, user_command_raw=None):
             
             if event_found:
                 _save_calendar_data(calendar_data)
-                speak(f"Reminder or event with ID {event_id_to_delete} has been marked as complete.")
+                speak(f"Reminder or event with ID {event_id_to_complete} has been marked as complete.")
                 print(f"[Calendar Action] Marked event with ID: {event_id_to_complete} as complete.")
             else:
                 speak(f"I could not find an incomplete reminder or event with ID {event_id_to_complete}.")
@@ -1973,25 +4550,10 @@ def manage_calendar_event(action_type, user_command_raw=None):
         duration_text = listen_command("Listening for duration...")
         if duration_text == "cancel_command": return
         
-        duration_seconds = 0
-        if "minute" in duration_text:
-            try:
-                minutes = int(''.join(filter(str.isdigit, duration_text.split("minute")[0])))
-                duration_seconds += minutes * 60
-            except ValueError: pass
-        if "hour" in duration_text:
-            try:
-                hours = int(''.join(filter(str.isdigit, duration_text.split("hour")[0])))
-                duration_seconds += hours * 3600
-            except ValueError: pass
-        
+        duration_seconds = _parse_duration_from_speech(duration_text) or 0
         if duration_seconds > 0:
-            alarm_time = datetime.datetime.now() + datetime.timedelta(seconds=duration_seconds)
-            new_id = 1
-            if calendar_data:
-                existing_ids = [item.get("id", 0) for item in calendar_data if isinstance(item.get("id"), int)]
-                if existing_ids:
-                    new_id = max(existing_ids) + 1
+            alarm_time = jarvis_clock.now() + datetime.timedelta(seconds=duration_seconds)
+            new_id = _next_calendar_id(calendar_data)
             
             new_entry = {
                 "id": new_id,
@@ -2002,25 +4564,28 @@ def manage_calendar_event(action_type, user_command_raw=None):
                 "triggered": False
             }
             calendar_data.append(new_entry)
+            index.add(new_entry)
             _save_calendar_data(calendar_data)
+            _schedule_calendar_entry(new_entry)
             speak(f"Timer set for {duration_text}. I will alert you at {alarm_time.strftime('%I:%M %p')}.")
             print(f"[Calendar Action] Set timer (ID {new_id}): {duration_text} for {alarm_time}")
         else:
             speak("I couldn't understand the timer duration. Please specify in minutes or hours.")
             print(f"[Calendar Error] Invalid timer duration: {duration_text}")
 
-    elif action_type == "set_alarm":
+    elif action_type == "set_alarm" or action_type == "set_repeating_alarm":
         speak("What time should I set the alarm for? For example, '7 AM' or '8:30 PM'. Say 'cancel' to abort.")
         alarm_time_text = listen_command("Listening for alarm time...")
         if alarm_time_text == "cancel_command": return
 
         parsed_alarm_datetime = _parse_datetime_from_speech(alarm_time_text)
-        if parsed_alarm_datetime and parsed_alarm_datetime > datetime.datetime.now():
-            new_id = 1
-            if calendar_data:
-                existing_ids = [item.get("id", 0) for item in calendar_data if isinstance(item.get("id"), int)]
-                if existing_ids:
-                    new_id = max(existing_ids) + 1
+        recurrence = None
+        if action_type == "set_repeating_alarm" and parsed_alarm_datetime:
+            recurrence = _ask_for_recurrence()
+            if not recurrence: return
+        # A repeating alarm may start earlier today; its next occurrence is what gets scheduled
+        if parsed_alarm_datetime and (recurrence or parsed_alarm_datetime > jarvis_clock.now()):
+            new_id = _next_calendar_id(calendar_data)
 
             new_entry = {
                 "id": new_id,
@@ -2030,18 +4595,23 @@ def manage_calendar_event(action_type, user_command_raw=None):
                 "completed": False,
                 "triggered": False
             }
+            if recurrence:
+                new_entry["recurrence"] = recurrence
             calendar_data.append(new_entry)
+            index.add(new_entry)
             _save_calendar_data(calendar_data)
-            speak(f"Alarm set for {parsed_alarm_datetime.strftime('%I:%M %p on %A, %B %d')}.")
+            _schedule_calendar_entry(new_entry)
+            if recurrence:
+                speak(f"Repeating alarm set for {parsed_alarm_datetime.strftime('%I:%M %p')} {_describe_recurrence(recurrence)}.")
+            else:
+                speak(f"Alarm set for {parsed_alarm_datetime.strftime('%I:%M %p on %A, %B %d')}.")
             print(f"[Calendar Action] Set alarm (ID {new_id}): {alarm_time_text} for {parsed_alarm_datetime}")
         else:
             speak("I couldn't understand the alarm time or it's in the past. Please try again.")
             print(f"[Calendar Error] Invalid alarm time: {alarm_time_text}")
     
     elif action_type == "show_timers":
-        active_timers = sorted([
-            e for e in calendar_data if e['type'] == "timer" and not e['completed'] and not e['triggered']
-        ], key=lambda x: x['datetime'])
+        active_timers = list(index.range(types=("timer",), states=("active",), expand_recurring=True))
         
         if not active_timers:
             speak("You have no active timers.")
@@ -2051,7 +4621,7 @@ def manage_calendar_event(action_type, user_command_raw=None):
         speak("Here are your active timers:")
         print("\n--- Active Timers ---")
         for timer in active_timers:
-            remaining_time = timer['datetime'] - datetime.datetime.now()
+            remaining_time = timer['datetime'] - jarvis_clock.now()
             if remaining_time.total_seconds() > 0:
                 mins, secs = divmod(int(remaining_time.total_seconds()), 60)
                 hours, mins = divmod(mins, 60)
@@ -2067,9 +4637,7 @@ def manage_calendar_event(action_type, user_command_raw=None):
         print("---------------------\n")
 
     elif action_type == "show_alarms":
-        active_alarms = sorted([
-            e for e in calendar_data if e['type'] == "alarm" and not e['completed'] and not e['triggered']
-        ], key=lambda x: x['datetime'])
+        active_alarms = list(index.range(types=("alarm",), states=("active",), expand_recurring=True))
 
         if not active_alarms:
             speak("You have no active alarms.")
@@ -2084,6 +4652,67 @@ def manage_calendar_event(action_type, user_command_raw=None):
             print(f"ID {alarm['id']}: '{alarm['text']}'. Set for {alarm_time_str}.")
         print("---------------------\n")
 
+    elif action_type == "find_free_time":
+        # e.g. "when am i free tomorrow afternoon"; with no day given, today
+        day_query = (user_command_raw or "").lower().replace("when am i free", "").strip()
+        now = jarvis_clock.now()
+        parsed_day = _parse_datetime_from_speech(day_query, now=now) if day_query else None
+        target_date_obj = parsed_day.date() if parsed_day else now.date()
+        start_hour, end_hour = GLOBAL_CONFIG["FREE_TIME_DAY_START_HOUR"], GLOBAL_CONFIG["FREE_TIME_DAY_END_HOUR"]
+        for part, hours in (("morning", (start_hour, 12)), ("afternoon", (12, 17)), ("evening", (17, 22)), ("tonight", (17, 22))):
+            if part in day_query:
+                start_hour, end_hour = hours
+                break
+        window_start = datetime.datetime.combine(target_date_obj, datetime.time(start_hour))
+        window_end = datetime.datetime.combine(target_date_obj, datetime.time(end_hour))
+        window_start = max(window_start, now.replace(second=0, microsecond=0))
+        day_label = target_date_obj.strftime('%A, %B %d')
+
+        if window_start >= window_end:
+            speak(f"That time on {day_label} has already passed.")
+            return
+
+        free_slots = index.free_slots(window_start, window_end)
+        if not free_slots:
+            speak(f"You're fully booked then on {day_label}.")
+            print(f"[Calendar Action] No free time between {window_start} and {window_end}.")
+            return
+        if free_slots == [(window_start, window_end)]:
+            speak(f"You're free the whole time, from {window_start.strftime('%I:%M %p')} to {window_end.strftime('%I:%M %p')} on {day_label}.")
+            return
+
+        speak(f"On {day_label} you're free:")
+        print(f"\n--- Free Time on {day_label} ---")
+        for slot_start, slot_end in free_slots:
+            speak(f"from {slot_start.strftime('%I:%M %p')} to {slot_end.strftime('%I:%M %p')}.")
+            print(f"{slot_start.strftime('%I:%M %p')} - {slot_end.strftime('%I:%M %p')}")
+        print("-----------------------------\n")
+
+    elif action_type == "show_history":
+        history_start = jarvis_clock.now() - datetime.timedelta(days=GLOBAL_CONFIG["CALENDAR_HISTORY_DAYS"])
+        # Recently finished entries are still in the hot calendar; older ones come from the archive on demand
+        history = {}
+        for entry in iter_calendar_archive(start=history_start):
+            history[entry['id']] = entry
+        for entry in index.range(start=history_start, states=("completed", "triggered")):
+            if _is_calendar_entry_finished(entry):
+                history[entry['id']] = entry
+        finished_entries = sorted(history.values(), key=lambda x: x['datetime'], reverse=True)
+
+        if not finished_entries:
+            speak(f"You have no completed reminders or fired timers in the last {GLOBAL_CONFIG['CALENDAR_HISTORY_DAYS']} days.")
+            print("[Calendar Action] No calendar history found.")
+            return
+
+        speak(f"You have {len(finished_entries)} finished items in the last {GLOBAL_CONFIG['CALENDAR_HISTORY_DAYS']} days. Here are the most recent:")
+        print("\n--- Calendar History ---")
+        for i, entry in enumerate(finished_entries):
+            entry_time_str = entry['datetime'].strftime('%A, %B %d at %I:%M %p')
+            if i < 5:
+                speak(f"ID {entry['id']}: {entry['text']} on {entry_time_str}.")
+            print(f"ID {entry['id']} ({entry['type'].capitalize()}): '{entry['text']}' on {entry_time_str}")
+        print("------------------------\n")
+
     elif action_type == "cancel_timer" or action_type == "cancel_alarm":
         item_type = "timer" if action_type == "cancel_timer" else "alarm"
         speak(f"Which {item_type} would you like to cancel? Please tell me the ID number. Say 'cancel' to abort.")
@@ -2103,6 +4732,8 @@ def manage_calendar_event(action_type, user_command_raw=None):
                         # Mark as completed/cancelled instead of deleting
                         item['completed'] = True
                         item['triggered'] = True # Also mark as triggered to prevent future alerts
+                        index.update(item)
+                        alarm_scheduler.cancel(("calendar", item_id_to_cancel))
                         updated_calendar_data.append(item)
                         speak(f"{item_type.capitalize()} with ID {item_id_to_cancel} has been cancelled.")
                         print(f"[Calendar Action] Cancelled {item_type} with ID: {item_id_to_cancel}")
@@ -2125,37 +4756,728 @@ def manage_calendar_event(action_type, user_command_raw=None):
             print(f"[Calendar Error] Error cancelling {item_type}: {e}")
 
 
-# --- Background thread for Alarms/Timers ---
-alarm_timer_thread_running = True
+# --- Calendar Archive (finished entries, gzip-compressed JSON lines) ---
+_calendar_archive_max_id = None # Highest ID ever archived, so new IDs never collide with history
+_calendar_archived_ids = set() # IDs this process moved to the archive; saves from older copies of the calendar skip them
+
+def _is_calendar_entry_finished(entry):
+    """Completed entries and fired timers/alarms no longer need to live in the hot calendar file."""
+    return entry.get('completed') or (entry['type'] in ("timer", "alarm") and entry.get('triggered'))
+
+def _entry_to_archive_record(entry):
+    record = dict(entry)
+    record['datetime'] = entry['datetime'].isoformat()
+    return record
+
+def iter_calendar_archive(start=None, end=None, types=None):
+    """Streams archived entries (with datetime objects) whose datetime falls in [start, end)."""
+    archive_file = GLOBAL_CONFIG["CALENDAR_ARCHIVE_FILE"]
+    if not os.path.exists(archive_file):
+        return
+    try:
+        with gzip.open(archive_file, "rt", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                entry['datetime'] = datetime.datetime.fromisoformat(entry['datetime'])
+                if start is not None and entry['datetime'] < start:
+                    continue
+                if end is not None and entry['datetime'] >= end:
+                    continue
+                if types is not None and entry['type'] not in types:
+                    continue
+                yield entry
+    except (OSError, EOFError, json.JSONDecodeError) as e:
+        print(f"[Calendar Archive Error] Could not read archive '{archive_file}': {e}")
+
+def _get_calendar_archive_max_id():
+    """Scans the archive once per session for its highest ID."""
+    global _calendar_archive_max_id
+    if _calendar_archive_max_id is None:
+        _calendar_archive_max_id = max((entry.get('id', 0) for entry in iter_calendar_archive() if isinstance(entry.get('id'), int)), default=0)
+    return _calendar_archive_max_id
+
+def _next_calendar_id(calendar_data):
+    """Next free calendar ID, considering both the hot calendar and the archive."""
+    existing_ids = [item.get("id", 0) for item in calendar_data if isinstance(item.get("id"), int)]
+    return max(existing_ids + [_get_calendar_archive_max_id()]) + 1
+
+def archive_finished_calendar_entries(now=None):
+    """
+    Moves finished entries older than CALENDAR_ARCHIVE_AFTER_HOURS from the calendar file into the
+    compressed archive. The archive is appended (and synced) before the smaller calendar is saved.
+    Returns the number of archived entries.
+    """
+    global _calendar_archive_max_id
+    now = now or jarvis_clock.now()
+    cutoff = now - datetime.timedelta(hours=GLOBAL_CONFIG["CALENDAR_ARCHIVE_AFTER_HOURS"])
+    index = get_calendar_index()
+    finished = [e for e in index.range(end=cutoff, states=("completed", "triggered")) if _is_calendar_entry_finished(e)]
+    if not finished:
+        return 0
+
+    archive_file = GLOBAL_CONFIG["CALENDAR_ARCHIVE_FILE"]
+    try:
+        with _store_lock(archive_file):
+            with gzip.open(archive_file, "at", encoding="utf-8") as f: # Appending adds a new gzip member
+                for entry in finished:
+                    f.write(json.dumps(_entry_to_archive_record(entry)) + "\n")
+            with open(archive_file, "rb+") as f:
+                os.fsync(f.fileno())
+    except Exception as e:
+        print(f"[Calendar Archive Error] Could not append to archive '{archive_file}': {e}")
+        return 0
+
+    archived_max_id = max((e['id'] for e in finished if isinstance(e.get('id'), int)), default=0)
+    _calendar_archive_max_id = max(_get_calendar_archive_max_id(), archived_max_id)
+    _calendar_archived_ids.update(e['id'] for e in finished)
+    for entry in finished:
+        index.remove(entry['id'])
+    _save_calendar_data(index.entries())
+    print(f"[Calendar Archive] Archived {len(finished)} finished entries to '{archive_file}'.")
+    return len(finished)
+
+def _run_calendar_archival(key=None, payload=None):
+    """Scheduler callback: archives finished entries, then schedules the next pass."""
+    archive_finished_calendar_entries()
+    alarm_scheduler.schedule(("maintenance", "calendar_archive"), jarvis_clock.now() + datetime.timedelta(hours=GLOBAL_CONFIG["CALENDAR_ARCHIVE_AFTER_HOURS"]), _run_calendar_archival)
+
+
+# --- Calendar iCalendar (.ics) Import/Export (Streaming) ---
+# VEVENTs are parsed one at a time from unfolded lines, so memory use does not depend on the file size.
+# Jarvis-specific fields round-trip through X-JARVIS-* properties; other calendars' events import as "event".
+ICS_ESCAPES = {"\\n": "\n", "\\N": "\n", "\\,": ",", "\\;": ";", "\\\\": "\\"}
+ICS_ESCAPE_PATTERN = re.compile(r"\\[nN,;\\]")
+ICS_DURATION_PATTERN = re.compile(r"^([+-])?P(?:(\d+)W)?(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?$")
+_ics_timezones = {} # TZID -> tzinfo, or None when the zone is unknown (times are then taken as local)
+
+def _iter_ics_lines(f):
+    """Yields logical iCalendar lines, joining folded continuation lines (those starting with a space or tab)."""
+    pending = None
+    for raw in f:
+        line = raw.rstrip("\r\n")
+        if line[:1] in (" ", "\t"):
+            if pending is not None:
+                pending += line[1:]
+            continue
+        if pending is not None:
+            yield pending
+        pending = line
+    if pending:
+        yield pending
+
+def _split_ics_property(line):
+    """Splits 'NAME;PARAM=X:value' into (NAME, {PARAM: X}, value)."""
+    head, _, value = line.partition(":")
+    name, *params = head.split(";")
+    return name.upper(), dict(param.split("=", 1) for param in params if "=" in param), value
+
+def _iter_ics_events(path):
+    """Streams VEVENTs from an .ics file as {NAME: (params, value)} dicts (first occurrence of each property wins)."""
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        event = None
+        depth = 0 # nested components inside the VEVENT, e.g. VALARM, whose properties are ignored
+        for line in _iter_ics_lines(f):
+            if event is None:
+                if line.upper() == "BEGIN:VEVENT":
+                    event = {}
+                continue
+            upper = line.upper()
+            if upper.startswith("BEGIN:"):
+                depth += 1
+            elif upper.startswith("END:"):
+                if depth:
+                    depth -= 1
+                elif upper == "END:VEVENT":
+                    yield event
+                    event = None
+            elif not depth:
+                name, params, value = _split_ics_property(line)
+                event.setdefault(name, (params, value))
+
+def _ics_unescape(value):
+    return ICS_ESCAPE_PATTERN.sub(lambda m: ICS_ESCAPES[m.group(0)], value)
+
+def _ics_escape(value):
+    return value.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+
+def _ics_parse_datetime(params, value):
+    """Parses DATE or DATE-TIME values into a naive local datetime. Returns (datetime, is_all_day)."""
+    value = value.strip()
+    if params.get("VALUE", "").upper() == "DATE" or len(value) == 8:
+        return datetime.datetime(int(value[0:4]), int(value[4:6]), int(value[6:8]), 9, 0), True # All-day entries default to 9 AM
+    parsed = datetime.datetime(int(value[0:4]), int(value[4:6]), int(value[6:8]), int(value[9:11]), int(value[11:13]), int(value[13:15] or 0))
+    tz = None
+    if value.endswith("Z"):
+        tz = datetime.timezone.utc
+    elif "TZID" in params:
+        tzid = params["TZID"].strip('"')
+        if tzid not in _ics_timezones:
+            try:
+                from zoneinfo import ZoneInfo
+                _ics_timezones[tzid] = ZoneInfo(tzid)
+            except Exception:
+                print(f"[Calendar Import] Unknown time zone '{tzid}', treating its times as local.")
+                _ics_timezones[tzid] = None
+        tz = _ics_timezones[tzid]
+    if tz is not None:
+        parsed = parsed.replace(tzinfo=tz).astimezone().replace(tzinfo=None)
+    return parsed, False
+
+def _ics_duration_minutes(value):
+    """Converts an iCalendar DURATION such as 'PT1H30M' or 'P1D' into whole minutes."""
+    match = ICS_DURATION_PATTERN.match(value.strip())
+    if not match:
+        return 0
+    sign, weeks, days, hours, minutes, seconds = match.groups()
+    total = int(weeks or 0) * 10080 + int(days or 0) * 1440 + int(hours or 0) * 60 + int(minutes or 0) + -(-int(seconds or 0) // 60)
+    return -total if sign == "-" else total
+
+def _ics_event_to_entry(event):
+    """Maps a parsed VEVENT onto a calendar entry (without an ID). Returns None if it has no usable start time."""
+    if "DTSTART" not in event:
+        return None
+    start, all_day = _ics_parse_datetime(*event["DTSTART"])
+    entry_type = event.get("X-JARVIS-TYPE", ({}, "event"))[1].lower()
+    if entry_type not in ("reminder", "event", "alarm", "timer"):
+        entry_type = "event"
+    entry = {
+        "type": entry_type,
+        "text": _ics_unescape(event.get("SUMMARY", ({}, ""))[1]).strip() or "(untitled)",
+        "datetime": start,
+        "completed": event.get("STATUS", ({}, ""))[1].upper() == "COMPLETED",
+        "triggered": event.get("X-JARVIS-TRIGGERED", ({}, ""))[1].upper() == "TRUE",
+    }
+    if not all_day:
+        if "DTEND" in event:
+            duration = int((_ics_parse_datetime(*event["DTEND"])[0] - start).total_seconds() // 60)
+        else:
+            duration = _ics_duration_minutes(event["DURATION"][1]) if "DURATION" in event else 0
+        if duration > 0:
+            entry["duration_minutes"] = duration
+    if "RRULE" in event:
+        rule = event["RRULE"][1].strip()
+        try:
+            _parse_rrule(rule)
+            for name in ("EXDATE", "RDATE", "EXRULE"): # Exceptions and extra dates aren't stored, so the series would be wrong
+                if name in event:
+                    raise ValueError(f"{name} is not supported")
+            entry["recurrence"] = rule
+        except ValueError as e:
+            print(f"[Calendar Import] Unsupported RRULE '{rule}' on '{entry['text']}' ({e}), importing its first occurrence only.")
+    if "UID" in event:
+        entry["uid"] = event["UID"][1].strip()
+    return entry
+
+def _fold_ics_line(line):
+    """Folds a content line at 75 octets, as RFC 5545 requires."""
+    encoded = line.encode("utf-8")
+    if len(encoded) <= 75:
+        return line + "\r\n"
+    chunks = []
+    while encoded:
+        limit = 75 if not chunks else 74
+        cut = min(limit, len(encoded))
+        while cut < len(encoded) and (encoded[cut] & 0xC0) == 0x80: # Don't split a UTF-8 sequence
+            cut -= 1
+        chunks.append(encoded[:cut].decode("utf-8"))
+        encoded = encoded[cut:]
+    return "\r\n ".join(chunks) + "\r\n"
+
+def _entry_to_ics_lines(entry, stamp):
+    """Renders a calendar entry as the content lines of one VEVENT."""
+    start = entry['datetime']
+    lines = [
+        "BEGIN:VEVENT",
+        f"UID:{entry.get('uid') or str(entry['id']) + '@jarvis'}",
+        f"DTSTAMP:{stamp}",
+        f"DTSTART:{start.strftime('%Y%m%dT%H%M%S')}",
+    ]
+    if entry.get('duration_minutes'):
+        lines.append(f"DTEND:{(start + datetime.timedelta(minutes=entry['duration_minutes'])).strftime('%Y%m%dT%H%M%S')}")
+    lines.append(f"SUMMARY:{_ics_escape(entry.get('text', ''))}")
+    if entry.get('recurrence'):
+        lines.append(f"RRULE:{entry['recurrence']}")
+    if entry.get('completed'):
+        lines.append("STATUS:COMPLETED")
+    lines.append(f"X-JARVIS-TYPE:{entry['type'].upper()}")
+    if entry.get('triggered'):
+        lines.append("X-JARVIS-TRIGGERED:TRUE")
+    lines.append("END:VEVENT")
+    return lines
+
+def import_calendar_ics(path, batch_size=None):
+    """
+    Imports VEVENTs from an .ics file into the calendar. Events are streamed into a temporary copy of
+    the calendar file in batches and committed with an atomic rename. Events whose UID is already in
+    the calendar are skipped, so importing the same file twice is harmless. The calendar index and
+    the alarm/timer schedule are refreshed afterwards, so imported alarms are armed at once.
+    Returns (imported_count, elapsed_seconds).
+    """
+    global _calendar_index_signature
+    batch_size = batch_size or GLOBAL_CONFIG["CALENDAR_IMPORT_BATCH_SIZE"]
+    calendar_file = GLOBAL_CONFIG["CALENDAR_FILE"]
+    temp_file = calendar_file + ".import.tmp"
+    start_time = time.perf_counter()
+
+    persistence_writer.flush() # The import replaces the file directly, so queued saves must land first
+    with _store_lock(calendar_file): # Other processes must not write the store between our read and the rename
+        existing_data = _load_calendar_data()
+        next_id = first_new_id = _next_calendar_id(existing_data)
+        existing_ids = [entry['id'] for entry in existing_data]
+        known_uids = {entry['uid'] for entry in existing_data if entry.get('uid')}
+
+        imported_count = skipped_count = 0
+        written_any = False
+        try:
+            with open(temp_file, "w", encoding="utf-8") as out:
+                out.write("[\n")
+
+                def write_batch(lines):
+                    nonlocal written_any
+                    if not lines:
+                        return
+                    out.write((",\n" if written_any else "") + ",\n".join(lines))
+                    written_any = True
+
+                write_batch([json.dumps(dict(entry, datetime=entry['datetime'].isoformat())) for entry in existing_data])
+                del existing_data
+
+                batch = []
+                for event in _iter_ics_events(path):
+                    if "UID" in event and event["UID"][1].strip() in known_uids:
+                        skipped_count += 1
+                        continue
+                    try:
+                        entry = _ics_event_to_entry(event)
+                    except (ValueError, IndexError) as e:
+                        entry = None
+                        print(f"[Calendar Import] Skipping malformed event: {e}")
+                    if entry is None:
+                        skipped_count += 1
+                        continue
+                    if entry.get('uid'):
+                        known_uids.add(entry['uid'])
+                    entry = {"id": next_id, **entry}
+                    next_id += 1
+                    batch.append(json.dumps(dict(entry, datetime=entry['datetime'].isoformat())))
+                    if len(batch) >= batch_size:
+                        write_batch(batch)
+                        imported_count += len(batch)
+                        batch = []
+                write_batch(batch)
+                imported_count += len(batch)
+
+                out.write("\n]\n")
+                out.flush()
+                os.fsync(out.fileno())
+            os.replace(temp_file, calendar_file)
+        except Exception:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+            raise
+        # Still under the lock: record the new file as our own version, so the store watcher doesn't reload it
+        persistence_writer.mark_synced(calendar_file, _file_signature(calendar_file),
+                                       [{"id": entry_id} for entry_id in itertools.chain(existing_ids, range(first_new_id, next_id))])
+    _calendar_index_signature = None # The next get_calendar_index() reloads the file
+    _reseed_calendar_schedule()
+
+    elapsed = time.perf_counter() - start_time
+    rate = imported_count / elapsed if elapsed > 0 else float("inf")
+    print(f"[Calendar Import] Imported {imported_count} events from '{path}' in {elapsed:.2f}s ({rate:,.0f} events/s), skipped {skipped_count}.")
+    return imported_count, elapsed
+
+def export_calendar_ics(path):
+    """
+    Exports the calendar (not the archive) as an .ics file, writing one VEVENT at a time.
+    Returns (exported_count, elapsed_seconds).
+    """
+    start_time = time.perf_counter()
+    stamp = datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    exported_count = 0
+    with open(path, "w", encoding="utf-8", newline="") as out:
+        out.write(f"BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//{GLOBAL_CONFIG['JARVIS_NAME']}//Voice Launcher//EN\r\n")
+        for entry in get_calendar_index().entries():
+            out.write("".join(_fold_ics_line(line) for line in _entry_to_ics_lines(entry, stamp)))
+            exported_count += 1
+        out.write("END:VCALENDAR\r\n")
+    elapsed = time.perf_counter() - start_time
+    rate = exported_count / elapsed if elapsed > 0 else float("inf")
+    print(f"[Calendar Export] Exported {exported_count} events to '{path}' in {elapsed:.2f}s ({rate:,.0f} events/s).")
+    return exported_count, elapsed
+
+def benchmark_calendar_ics(event_count=50_000):
+    """Generates an .ics file of `event_count` events and times importing it into, and exporting it from, a scratch calendar."""
+    global calendar_index, _calendar_archive_max_id
+    original_files = (GLOBAL_CONFIG["CALENDAR_FILE"], GLOBAL_CONFIG["CALENDAR_ARCHIVE_FILE"])
+    first_start = datetime.datetime(2025, 1, 6, 8, 0)
+    with tempfile.TemporaryDirectory() as scratch_dir:
+        source_path = os.path.join(scratch_dir, "events.ics")
+        with open(source_path, "w", encoding="utf-8", newline="") as f:
+            f.write("BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//Benchmark//EN\r\n")
+            for i in range(event_count):
+                start = first_start + datetime.timedelta(minutes=90 * i)
+                lines = [
+                    "BEGIN:VEVENT",
+                    f"UID:bench-{i}@example.com",
+                    f"DTSTART:{start.strftime('%Y%m%dT%H%M%S')}",
+                    f"DTEND:{(start + datetime.timedelta(minutes=45)).strftime('%Y%m%dT%H%M%S')}",
+                    f"SUMMARY:Benchmark event {i}\\, with a long enough title to need folding across more than one line",
+                ]
+                if i % 10 == 0:
+                    lines.append("RRULE:FREQ=WEEKLY;BYDAY=MO,WE;COUNT=10")
+                lines += ["BEGIN:VALARM", "TRIGGER:-PT15M", "ACTION:DISPLAY", "END:VALARM", "END:VEVENT"]
+                f.write("".join(_fold_ics_line(line) for line in lines))
+            f.write("END:VCALENDAR\r\n")
+        GLOBAL_CONFIG["CALENDAR_FILE"] = os.path.join(scratch_dir, "calendar.json")
+        GLOBAL_CONFIG["CALENDAR_ARCHIVE_FILE"] = os.path.join(scratch_dir, "archive.jsonl.gz")
+        calendar_index, _calendar_archive_max_id = None, None
+        try:
+            imported_count, import_seconds = import_calendar_ics(source_path)
+            exported_count, export_seconds = export_calendar_ics(os.path.join(scratch_dir, "export.ics"))
+        finally:
+            GLOBAL_CONFIG["CALENDAR_FILE"], GLOBAL_CONFIG["CALENDAR_ARCHIVE_FILE"] = original_files
+            calendar_index, _calendar_archive_max_id = None, None
+    print(f"[Benchmark] ICS import: {imported_count / import_seconds:,.0f} events/s, export: {exported_count / export_seconds:,.0f} events/s ({event_count} events).")
+    return {"import_per_second": imported_count / import_seconds, "export_per_second": exported_count / export_seconds}
+
+
+# --- Background Scheduler for Alarms/Timers ---
+class AlarmScheduler:
+    """
+    Min-heap of pending triggers guarded by a condition variable.
+    The worker thread sleeps until the earliest trigger is due; scheduling or cancelling
+    an item wakes it so it can recompute its deadline. Cancelled heap entries are dropped lazily.
+    """
+    def __init__(self, clock=None, max_sleep_seconds=60):
+        self._clock = clock # None: follow the module clock, including later use_clock() calls
+        self.trace = None # Optional trace(key, due, fired_at) hook, used by the simulation harness
+        self._heap = [] # (due_datetime, sequence, key)
+        self._pending = {} # key -> (due_datetime, sequence, callback, payload)
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+        self._running = True # Set here, not in run(), so a stop() before the worker gets going still counts
+        # Upper bound on a single sleep so wall-clock jumps (suspend, DST) are noticed
+        self._max_sleep_seconds = max_sleep_seconds
+
+    @property
+    def clock(self):
+        return self._clock or jarvis_clock
+
+    def schedule(self, key, due, callback, payload=None):
+        """Schedules (or reschedules) `callback(key, payload)` to run at datetime `due`."""
+        with self._cond:
+            sequence = next(self._sequence)
+            self._pending[key] = (due, sequence, callback, payload)
+            heapq.heappush(self._heap, (due, sequence, key))
+            self._cond.notify()
+
+    def cancel(self, key):
+        """Cancels a pending trigger. Returns True if one was pending."""
+        with self._cond:
+            if self._pending.pop(key, None) is None:
+                return False
+            self._cond.notify()
+            return True
+
+    def cancel_where(self, predicate):
+        """Cancels every pending trigger whose key matches `predicate`."""
+        with self._cond:
+            for key in [k for k in self._pending if predicate(k)]:
+                del self._pending[key]
+            self._cond.notify()
+
+    def pending_count(self):
+        with self._cond:
+            return len(self._pending)
+
+    def _pop_due_locked(self, now):
+        """Pops every trigger due at `now`. Must hold the condition lock."""
+        due_items = []
+        while self._heap:
+            due, sequence, key = self._heap[0]
+            pending = self._pending.get(key)
+            if pending is None or pending[1] != sequence:
+                heapq.heappop(self._heap) # Cancelled or rescheduled
+                continue
+            if due > now:
+                break
+            heapq.heappop(self._heap)
+            del self._pending[key]
+            due_items.append((key, due, pending[2], pending[3]))
+        return due_items
+
+    def _seconds_until_next_locked(self, now):
+        """Seconds until the earliest live trigger, or None when nothing is pending. Must hold the lock."""
+        if not self._heap:
+            return None
+        return max(0.0, min(self._max_sleep_seconds, (self._heap[0][0] - now).total_seconds()))
+
+    def run(self):
+        """Worker loop: fires due triggers, then sleeps until the next one (or until woken). Returns once stopped."""
+        while True:
+            with self._cond:
+                due_items = self._pop_due_locked(self.clock.now())
+                while not due_items and self._running:
+                    self.clock.wait(self._cond, self._seconds_until_next_locked(self.clock.now()))
+                    due_items = self._pop_due_locked(self.clock.now())
+                if not self._running:
+                    return
+            # Callbacks run outside the lock so they can schedule follow-up triggers
+            for key, due, callback, payload in due_items:
+                if self.trace:
+                    self.trace(key, due, self.clock.now())
+                try:
+                    callback(key, payload)
+                except Exception as e:
+                    print(f"[Scheduler Error] Trigger {key} failed: {e}")
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+
+
+alarm_scheduler = AlarmScheduler()
+
+def _fire_calendar_entry(key, payload):
+    """
+    Announces a due timer/alarm occurrence and persists its state. This is the only disk write per alert.
+    One-shot items are marked triggered; recurring ones record the occurrence and queue the next one.
+    """
+    entry_id, occurrence = payload
+    index = get_calendar_index()
+    entry = index.get(entry_id)
+    if entry is None or entry['completed'] or entry['triggered']:
+        return # Deleted, cancelled or already handled elsewhere
+    if entry['type'] == "timer":
+        speak(f"Your timer for '{entry['text']}' is complete!")
+        print(f"[Timer Alert] Timer '{entry['text']}' complete.")
+    elif entry['type'] == "alarm":
+        speak(f"Alarm! It's {occurrence.strftime('%I:%M %p')}. {entry['text']}")
+        print(f"[Alarm Alert] Alarm '{entry['text']}' triggered.")
+    rule_engine.publish_calendar(entry, occurrence)
+
+    if entry.get('recurrence'):
+        entry['last_fired'] = occurrence.isoformat()
+        if next_occurrence(entry, occurrence) is None:
+            entry['triggered'] = True # Recurrence exhausted (COUNT/UNTIL reached)
+    else:
+        entry['triggered'] = True # Mark as triggered to prevent repeated alerts
+    index.update(entry)
+    _save_calendar_data(index.entries())
+    _schedule_calendar_entry(entry)
+
+def _schedule_calendar_entry(entry):
+    """Registers the next occurrence of an active timer or alarm with the scheduler."""
+    if entry['type'] not in ("timer", "alarm") or entry['completed'] or entry['triggered']:
+        return
+    if entry.get('recurrence'):
+        # Recurring items are fed to the scheduler one occurrence at a time
+        last_fired = datetime.datetime.fromisoformat(entry['last_fired']) if entry.get('last_fired') else None
+        due = next_occurrence(entry, last_fired) if last_fired else next(iter_occurrences(entry), None)
+        now = jarvis_clock.now()
+        if due is not None and due < now - datetime.timedelta(minutes=1):
+            print(f"[Scheduler] Skipping missed occurrences of '{entry['text']}' (ID {entry['id']}).")
+            due = next(iter_occurrences(entry, start=now), None)
+        if due is None:
+            return
+    else:
+        due = entry['datetime']
+    alarm_scheduler.schedule(("calendar", entry['id']), due, _fire_calendar_entry, (entry['id'], due))
+
+def _reseed_calendar_schedule():
+    """(Re)registers every active timer/alarm from the calendar, e.g. at startup or after another process changed it."""
+    alarm_scheduler.cancel_where(lambda key: key[0] == "calendar")
+    for entry in get_calendar_index().range(types=("timer", "alarm"), states=("active",)):
+        _schedule_calendar_entry(entry)
+
 def check_alarms_and_timers():
-    global alarm_timer_thread_running
-    while alarm_timer_thread_running:
-        calendar_data = _load_calendar_data()
-        updated_data = []
-        now = datetime.datetime.now()
-        
-        for entry in calendar_data:
-            if not entry['completed'] and not entry['triggered'] and entry['datetime'] <= now:
-                if entry['type'] == "timer":
-                    speak(f"Your timer for '{entry['text']}' is complete!")
-                    print(f"[Timer Alert] Timer '{entry['text']}' complete.")
-                elif entry['type'] == "alarm":
-                    speak(f"Alarm! It's {entry['datetime'].strftime('%I:%M %p')}. {entry['text']}")
-                    print(f"[Alarm Alert] Alarm '{entry['text']}' triggered.")
-                
-                entry['triggered'] = True # Mark as triggered to prevent repeated alerts
-            updated_data.append(entry)
-        
-        _save_calendar_data(updated_data) # Save updated status
-        time.sleep(5) # Check every 5 seconds
+    """Background thread body: loads pending timers/alarms once, then runs the scheduler."""
+    _reseed_calendar_schedule()
+    _run_calendar_archival() # Archive on startup; it reschedules itself
+    print(f"[Background Thread] Alarm/Timer scheduler started with {alarm_scheduler.pending_count()} pending items.")
+    alarm_scheduler.run()
 
 def stop_alarm_timer_thread():
-    global alarm_timer_thread_running
-    alarm_timer_thread_running = False
+    alarm_scheduler.stop()
     print("[Background Thread] Alarm/Timer checking thread stopped.")
 
+# --- Scheduler Simulation Harness (accelerated time) ---
+def _run_scheduler_simulation(scheduler, until, body):
+    """
+    Runs `body` (normally scheduler.run or check_alarms_and_timers) on a muted worker thread until the
+    simulated clock reaches `until`. A sentinel trigger at `until` stops the scheduler, so everything
+    due earlier has fired by the time this returns. Returns the wall-clock seconds taken.
+    """
+    scheduler.schedule(("simulation", "end"), until, lambda key, payload: scheduler.stop())
+
+    def worker():
+        _speech_local.muted = True
+        body()
+
+    start = time.perf_counter()
+    thread = threading.Thread(target=worker, daemon=True)
+    thread.start()
+    thread.join()
+    return time.perf_counter() - start
 
-# --- Smart Home Integration (Simulated Philips Hue) ---
+def simulate_calendar_week(days=7, timer_count=200, seed=11):
+    """
+    Runs `days` of alarms and timers through the real calendar code (check_alarms_and_timers,
+    _fire_calendar_entry, persistence) on a simulated clock with a scratch calendar, then checks that
+    every occurrence fired exactly once, in order, at its due time, and that nothing else fired.
+    """
+    global alarm_scheduler, calendar_index, _calendar_archive_max_id, _calendar_archived_ids
+    rng = random.Random(seed)
+    start = datetime.datetime(2025, 6, 2, 6, 0) # A Monday
+    until = start + datetime.timedelta(days=days)
+    entries = [
+        {"id": 1, "type": "alarm", "text": "Wake up", "datetime": start.replace(hour=7), "recurrence": "FREQ=DAILY"},
+        {"id": 2, "type": "alarm", "text": "Standup", "datetime": start.replace(hour=9, minute=30), "recurrence": "FREQ=WEEKLY;BYDAY=MO,TU,WE,TH,FR"},
+        {"id": 3, "type": "alarm", "text": "Medication", "datetime": start.replace(hour=13), "recurrence": "FREQ=DAILY;COUNT=3"},
+        {"id": 4, "type": "alarm", "text": "Cancelled alarm", "datetime": start.replace(hour=8), "completed": True},
+        {"id": 5, "type": "alarm", "text": "Already fired", "datetime": start - datetime.timedelta(hours=1), "triggered": True},
+    ]
+    for i in range(timer_count):
+        entries.append({"id": 100 + i, "type": "timer", "text": f"Timer {i}", "datetime": start + datetime.timedelta(seconds=rng.randrange(days * 86400))})
+    for entry in entries:
+        entry.setdefault("completed", False)
+        entry.setdefault("triggered", False)
+
+    expected = []
+    for entry in entries:
+        if entry['completed'] or entry['triggered']:
+            continue
+        occurrences = iter_occurrences(entry, start=start, end=until) if entry.get('recurrence') else [entry['datetime']]
+        expected.extend((due, entry['id']) for due in occurrences if due < until)
+    expected.sort()
+
+    fired = []
+    saved = (GLOBAL_CONFIG["CALENDAR_FILE"], GLOBAL_CONFIG["CALENDAR_ARCHIVE_FILE"], alarm_scheduler, _calendar_archived_ids)
+    clock = SimulatedClock(start)
+    previous_clock = use_clock(clock)
+    with tempfile.TemporaryDirectory() as scratch_dir:
+        GLOBAL_CONFIG["CALENDAR_FILE"] = os.path.join(scratch_dir, "calendar.json")
+        GLOBAL_CONFIG["CALENDAR_ARCHIVE_FILE"] = os.path.join(scratch_dir, "archive.jsonl.gz")
+        calendar_index, _calendar_archive_max_id, _calendar_archived_ids = None, None, set()
+        alarm_scheduler = AlarmScheduler(clock)
+        alarm_scheduler.trace = lambda key, due, fired_at: fired.append((due, key, fired_at)) if key[0] == "calendar" else None
+        try:
+            _save_calendar_data(entries)
+            stale_copy = get_calendar_index().entries() # As a voice dialogue started before the week would hold it
+            wall_seconds = _run_scheduler_simulation(alarm_scheduler, until, check_alarms_and_timers)
+            _save_calendar_data(stale_copy) # ...and then save it, after entries were archived
+            # Finished entries may have been archived during the simulated week
+            archived_ids = {entry['id'] for entry in iter_calendar_archive()}
+            revived = archived_ids.intersection(entry['id'] for entry in _load_calendar_data())
+            final_state = {entry['id']: entry for entry in itertools.chain(iter_calendar_archive(), _load_calendar_data())}
+        finally:
+            persistence_writer.flush() # Before the scratch directory goes away
+            GLOBAL_CONFIG["CALENDAR_FILE"], GLOBAL_CONFIG["CALENDAR_ARCHIVE_FILE"], alarm_scheduler, _calendar_archived_ids = saved
+            calendar_index, _calendar_archive_max_id = None, None
+            use_clock(previous_clock)
+
+    problems = []
+    if [(due, key[1]) for due, key, _ in fired] != expected:
+        problems.append(f"fired {len(fired)} occurrences, expected {len(expected)} (or a different order)")
+    late = [(key, fired_at - due) for due, key, fired_at in fired if fired_at != due]
+    if late:
+        problems.append(f"{len(late)} triggers fired late, worst {max(delay for _, delay in late)}")
+    if not all(final_state[100 + i]['triggered'] for i in range(timer_count)):
+        problems.append("some fired timers were not persisted as triggered")
+    if not final_state[3]['triggered']:
+        problems.append("the COUNT=3 alarm was not marked triggered after its last occurrence")
+    if revived:
+        problems.append(f"saving an older copy of the calendar brought back {len(revived)} archived entries")
+
+    print(f"[Simulation] {days} simulated days, {len(fired)} alerts in {wall_seconds:.2f}s of wall time.")
+    for problem in problems:
+        print(f"[Simulation] FAILED: {problem}")
+    if not problems:
+        print("[Simulation] All alerts fired once, in order, at their due time.")
+    return not problems
+
+def simulate_calendar_merge():
+    """
+    Two writers on one scratch calendar: another process adds an entry behind this one's back while this
+    process saves a change made from its older copy. Checks that the merged file, the reloaded index and
+    the next save all keep both processes' entries.
+    """
+    global calendar_index, _calendar_index_signature, _calendar_archived_ids
+    start = datetime.datetime(2025, 6, 2, 9, 0)
+    def entry(entry_id):
+        return {"id": entry_id, "type": "reminder", "text": f"Entry {entry_id}", "datetime": start + datetime.timedelta(hours=entry_id),
+                "completed": False, "triggered": False}
+    def ids_on_disk():
+        with open(GLOBAL_CONFIG["CALENDAR_FILE"], encoding="utf-8") as f:
+            return sorted(item['id'] for item in json.load(f))
+
+    saved_file, saved_archived_ids = GLOBAL_CONFIG["CALENDAR_FILE"], _calendar_archived_ids
+    with tempfile.TemporaryDirectory() as scratch_dir:
+        GLOBAL_CONFIG["CALENDAR_FILE"] = os.path.join(scratch_dir, "calendar.json")
+        calendar_index, _calendar_index_signature, _calendar_archived_ids = None, None, set()
+        try:
+            _save_calendar_data([entry(1)])
+            persistence_writer.flush()
+            ours = [dict(item) for item in get_calendar_index().entries()]
+
+            # The other process read [1] too, and writes [1, 2] first
+            with _store_lock(GLOBAL_CONFIG["CALENDAR_FILE"]):
+                time.sleep(0.01) # A distinct modification time, as a separate write would have
+                _atomic_write_text(GLOBAL_CONFIG["CALENDAR_FILE"], _serialize_calendar_data([entry(1), entry(2)]))
+
+            _save_calendar_data(ours + [entry(3)]) # Saved from this process's stale copy
+            persistence_writer.flush()
+            after_merge = ids_on_disk()
+            in_index = sorted(item['id'] for item in get_calendar_index().entries())
+
+            _save_calendar_data([dict(item) for item in get_calendar_index().entries()] + [entry(4)])
+            persistence_writer.flush()
+            after_next_save = ids_on_disk()
+        finally:
+            persistence_writer.flush()
+            GLOBAL_CONFIG["CALENDAR_FILE"], _calendar_archived_ids = saved_file, saved_archived_ids
+            calendar_index, _calendar_index_signature = None, None
+
+    ok = after_merge == in_index == [1, 2, 3] and after_next_save == [1, 2, 3, 4]
+    print(f"[Merge Simulation] After the merge: file {after_merge}, index {in_index}; after the next save: file {after_next_save}.")
+    print(f"[Merge Simulation] {'Both processes kept their entries.' if ok else 'FAILED: an entry was lost.'}")
+    return ok
+
+def load_test_scheduler(timer_count=100_000, cancel_fraction=0.1, seed=5):
+    """Schedules `timer_count` timers over a simulated week, cancels some, and checks firing order and latency."""
+    rng = random.Random(seed)
+    start = datetime.datetime(2025, 6, 2, 0, 0)
+    until = start + datetime.timedelta(days=7, seconds=1)
+    clock = SimulatedClock(start)
+    scheduler = AlarmScheduler(clock)
+    fired = []
+    scheduler.trace = lambda key, due, fired_at: fired.append((due, fired_at))
+    noop = lambda key, payload: None
+
+    schedule_start = time.perf_counter()
+    for i in range(timer_count):
+        scheduler.schedule(("timer", i), start + datetime.timedelta(seconds=rng.randrange(7 * 86400)), noop)
+    schedule_seconds = time.perf_counter() - schedule_start
+    cancelled = rng.sample(range(timer_count), int(timer_count * cancel_fraction))
+    for i in cancelled:
+        scheduler.cancel(("timer", i))
+
+    run_seconds = _run_scheduler_simulation(scheduler, until, scheduler.run)
+    fired.pop() # The end-of-simulation sentinel
+
+    in_order = all(fired[i][0] <= fired[i + 1][0] for i in range(len(fired) - 1))
+    worst_latency = max((fired_at - due for due, fired_at in fired), default=datetime.timedelta(0))
+    expected_count = timer_count - len(cancelled)
+    print(f"[Load Test] Scheduled {timer_count} timers in {schedule_seconds:.2f}s ({timer_count / schedule_seconds:,.0f}/s); "
+          f"fired {len(fired)} of {expected_count} in {run_seconds:.2f}s ({len(fired) / run_seconds:,.0f}/s).")
+    print(f"[Load Test] In order: {in_order}. Worst firing latency (simulated): {worst_latency}.")
+    return in_order and len(fired) == expected_count and worst_latency == datetime.timedelta(0)
+
+
+# --- Smart Home Integration (Philips Hue: real bridge or simulation) ---
 # This dictionary will simulate the state of your Hue lights
 # In a real scenario, this would be fetched from the Hue Bridge API
 SIMULATED_HUE_LIGHTS = {
@@ -2164,71 +5486,603 @@ SIMULATED_HUE_LIGHTS = {
     "3": {"name": "Bedroom Light", "state": {"on": False, "bri": 254, "hue": 0, "sat": 0}},
     "4": {"name": "Desk Light", "state": {"on": True, "bri": 100, "hue": 30000, "sat": 200}}, # Added more varied state
 }
+SIMULATED_HUE_GROUPS = {
+    "1": {"name": "Living Room", "type": "Room", "lights": ["1"]},
+    "2": {"name": "Kitchen", "type": "Room", "lights": ["2"]},
+    "3": {"name": "Bedroom", "type": "Room", "lights": ["3"]},
+    "4": {"name": "Office", "type": "Room", "lights": ["4"]},
+}
+SIMULATED_HUE_SCENES = {
+    "relax01": {"name": "Relax", "group": "0", "lightstates": {light_id: {"on": True, "bri": 144, "hue": 7676, "sat": 199} for light_id in SIMULATED_HUE_LIGHTS}},
+    "concentrate01": {"name": "Concentrate", "group": "0", "lightstates": {light_id: {"on": True, "bri": 254, "hue": 39392, "sat": 13} for light_id in SIMULATED_HUE_LIGHTS}},
+    "nightlight01": {"name": "Nightlight", "group": "3", "lightstates": {"3": {"on": True, "bri": 1, "hue": 6291, "sat": 251}}},
+}
+
+# Wide-gamut RGB <-> CIE XYZ (D65), as given in Philips' "RGB to xy" developer notes
+_HUE_RGB_TO_XYZ = ((0.664511, 0.154324, 0.162028), (0.283881, 0.668433, 0.047685), (0.000088, 0.072310, 0.986039))
+_HUE_XYZ_TO_RGB = ((1.656492, -0.354851, -0.255038), (-0.707196, 1.655397, 0.036152), (0.051713, -0.121364, 1.011530))
+
+def _hue_rgb_to_xy(red, green, blue):
+    """Converts sRGB components (0-1) to Hue xy chromaticity."""
+    linear = [((c + 0.055) / 1.055) ** 2.4 if c > 0.04045 else c / 12.92 for c in (red, green, blue)]
+    x_, y_, z_ = (sum(m * c for m, c in zip(row, linear)) for row in _HUE_RGB_TO_XYZ)
+    total = x_ + y_ + z_
+    if total == 0:
+        return (0.3227, 0.329) # White point for black/off
+    return (round(x_ / total, 4), round(y_ / total, 4))
+
+def _hue_xy_to_rgb(x, y):
+    """Converts Hue xy chromaticity to sRGB components (0-1) at full brightness."""
+    if y == 0:
+        return (1.0, 1.0, 1.0)
+    xyz = (x / y, 1.0, (1.0 - x - y) / y)
+    linear = [max(0.0, sum(m * c for m, c in zip(row, xyz))) for row in _HUE_XYZ_TO_RGB]
+    peak = max(linear) or 1.0
+    return tuple(12.92 * c if c <= 0.0031308 else 1.055 * c ** (1 / 2.4) - 0.055 for c in (c / peak for c in linear))
+
+def _hue_v1_state_to_v2(state):
+    """Translates a v1 light state body (on/bri/hue/sat/xy) into a CLIP v2 light update."""
+    body = {}
+    if "on" in state:
+        body["on"] = {"on": state["on"]}
+    if "bri" in state:
+        body["dimming"] = {"brightness": round(state["bri"] / 2.54, 1)}
+    if "xy" in state:
+        body["color"] = {"xy": {"x": state["xy"][0], "y": state["xy"][1]}}
+    elif "hue" in state or "sat" in state:
+        x, y = _hue_rgb_to_xy(*colorsys.hsv_to_rgb(state.get("hue", 0) / 65535, state.get("sat", 0) / 254, 1.0))
+        body["color"] = {"xy": {"x": x, "y": y}}
+    return body
+
+def _hue_v2_state_to_v1(resource):
+    """Translates a CLIP v2 light resource into the v1 state dict the rest of the code reads."""
+    state = {"on": resource.get("on", {}).get("on", False), "bri": int(round(resource.get("dimming", {}).get("brightness", 0) * 2.54))}
+    xy = resource.get("color", {}).get("xy")
+    if xy:
+        hue, sat, _ = colorsys.rgb_to_hsv(*_hue_xy_to_rgb(xy["x"], xy["y"]))
+        state.update(hue=int(round(hue * 65535)), sat=int(round(sat * 254)), xy=[xy["x"], xy["y"]])
+    return state
+
+# CSS/X11 named colors (black left out: a light can't show it). Spoken names are matched with spaces removed.
+CSS_COLOR_HEX = {
+    "aliceblue": "f0f8ff", "antiquewhite": "faebd7", "aqua": "00ffff", "aquamarine": "7fffd4", "azure": "f0ffff",
+    "beige": "f5f5dc", "bisque": "ffe4c4", "blanchedalmond": "ffebcd", "blue": "0000ff", "blueviolet": "8a2be2",
+    "brown": "a52a2a", "burlywood": "deb887", "cadetblue": "5f9ea0", "chartreuse": "7fff00", "chocolate": "d2691e",
+    "coral": "ff7f50", "cornflowerblue": "6495ed", "cornsilk": "fff8dc", "crimson": "dc143c", "cyan": "00ffff",
+    "darkblue": "00008b", "darkcyan": "008b8b", "darkgoldenrod": "b8860b", "darkgray": "a9a9a9", "darkgreen": "006400",
+    "darkgrey": "a9a9a9", "darkkhaki": "bdb76b", "darkmagenta": "8b008b", "darkolivegreen": "556b2f", "darkorange": "ff8c00",
+    "darkorchid": "9932cc", "darkred": "8b0000", "darksalmon": "e9967a", "darkseagreen": "8fbc8f", "darkslateblue": "483d8b",
+    "darkslategray": "2f4f4f", "darkslategrey": "2f4f4f", "darkturquoise": "00ced1", "darkviolet": "9400d3", "deeppink": "ff1493",
+    "deepskyblue": "00bfff", "dimgray": "696969", "dimgrey": "696969", "dodgerblue": "1e90ff", "firebrick": "b22222",
+    "floralwhite": "fffaf0", "forestgreen": "228b22", "fuchsia": "ff00ff", "gainsboro": "dcdcdc", "ghostwhite": "f8f8ff",
+    "gold": "ffd700", "goldenrod": "daa520", "gray": "808080", "green": "008000", "greenyellow": "adff2f",
+    "grey": "808080", "honeydew": "f0fff0", "hotpink": "ff69b4", "indianred": "cd5c5c", "indigo": "4b0082",
+    "ivory": "fffff0", "khaki": "f0e68c", "lavender": "e6e6fa", "lavenderblush": "fff0f5", "lawngreen": "7cfc00",
+    "lemonchiffon": "fffacd", "lightblue": "add8e6", "lightcoral": "f08080", "lightcyan": "e0ffff", "lightgoldenrodyellow": "fafad2",
+    "lightgray": "d3d3d3", "lightgreen": "90ee90", "lightgrey": "d3d3d3", "lightpink": "ffb6c1", "lightsalmon": "ffa07a",
+    "lightseagreen": "20b2aa", "lightskyblue": "87cefa", "lightslategray": "778899", "lightslategrey": "778899", "lightsteelblue": "b0c4de",
+    "lightyellow": "ffffe0", "lime": "00ff00", "limegreen": "32cd32", "linen": "faf0e6", "magenta": "ff00ff",
+    "maroon": "800000", "mediumaquamarine": "66cdaa", "mediumblue": "0000cd", "mediumorchid": "ba55d3", "mediumpurple": "9370db",
+    "mediumseagreen": "3cb371", "mediumslateblue": "7b68ee", "mediumspringgreen": "00fa9a", "mediumturquoise": "48d1cc", "mediumvioletred": "c71585",
+    "midnightblue": "191970", "mintcream": "f5fffa", "mistyrose": "ffe4e1", "moccasin": "ffe4b5", "navajowhite": "ffdead",
+    "navy": "000080", "oldlace": "fdf5e6", "olive": "808000", "olivedrab": "6b8e23", "orange": "ffa500",
+    "orangered": "ff4500", "orchid": "da70d6", "palegoldenrod": "eee8aa", "palegreen": "98fb98", "paleturquoise": "afeeee",
+    "palevioletred": "db7093", "papayawhip": "ffefd5", "peachpuff": "ffdab9", "peru": "cd853f", "pink": "ffc0cb",
+    "plum": "dda0dd", "powderblue": "b0e0e6", "purple": "800080", "rebeccapurple": "663399", "red": "ff0000",
+    "rosybrown": "bc8f8f", "royalblue": "4169e1", "saddlebrown": "8b4513", "salmon": "fa8072", "sandybrown": "f4a460",
+    "seagreen": "2e8b57", "seashell": "fff5ee", "sienna": "a0522d", "silver": "c0c0c0", "skyblue": "87ceeb",
+    "slateblue": "6a5acd", "slategray": "708090", "slategrey": "708090", "snow": "fffafa", "springgreen": "00ff7f",
+    "steelblue": "4682b4", "tan": "d2b48c", "teal": "008080", "thistle": "d8bfd8", "tomato": "ff6347",
+    "turquoise": "40e0d0", "violet": "ee82ee", "wheat": "f5deb3", "white": "ffffff", "whitesmoke": "f5f5f5",
+    "yellow": "ffff00", "yellowgreen": "9acd32",
+}
+
+def _build_hue_color_table():
+    """Precomputes every named color into the state fields a Hue light takes: hue/sat for v1, xy for gamut-accurate color."""
+    table = {}
+    for name, hex_value in CSS_COLOR_HEX.items():
+        red, green, blue = (int(hex_value[i:i + 2], 16) / 255 for i in (0, 2, 4))
+        hue, sat, _ = colorsys.rgb_to_hsv(red, green, blue) # Brightness is left to the brightness command
+        table[name] = {"hue": int(round(hue * 65535)), "sat": int(round(sat * 254)), "xy": list(_hue_rgb_to_xy(red, green, blue))}
+    return table
+
+HUE_COLOR_TABLE = _build_hue_color_table()
+
+def _hue_color_state(color_name):
+    """State fields for a spoken color name ("light sea green", "grey"), or None if it isn't a known color."""
+    entry = HUE_COLOR_TABLE.get(re.sub(r"[^a-z]", "", color_name.lower()))
+    return dict(entry) if entry else None
+
+class SimulatedHueClient:
+    """
+    Stand-in for a Hue Bridge that reads and writes SIMULATED_HUE_LIGHTS (plus the simulated groups
+    and scenes) and answers with the bridge's v1 JSON. Group "0" is every light, as on the bridge.
+    """
+    def __init__(self, lights=None, groups=None, scenes=None, verbose=True):
+        self.lights = SIMULATED_HUE_LIGHTS if lights is None else lights
+        self.groups = SIMULATED_HUE_GROUPS if groups is None else groups
+        self.scenes = SIMULATED_HUE_SCENES if scenes is None else scenes
+        self.verbose = verbose
+
+    @staticmethod
+    def _apply_state(state, update):
+        """Updates a light's state like the bridge does: a new hue/sat replaces the old xy color."""
+        if ("hue" in update or "sat" in update) and "xy" not in update:
+            state.pop("xy", None)
+        state.update(update)
+
+    def _group_light_ids(self, group_id):
+        if group_id == "0":
+            return list(self.lights)
+        group = self.groups.get(group_id)
+        return None if group is None else [light_id for light_id in group["lights"] if light_id in self.lights]
+
+    def request(self, method, endpoint, data=None):
+        if self.verbose:
+            print(f"[Hue Simulated API Call] {method} {endpoint} with data: {data}")
+        if "/lights" in endpoint and "/state" in endpoint:
+            light_id = endpoint.split('/')[2] # e.g., /lights/1/state -> 1
+            if light_id in self.lights:
+                self._apply_state(self.lights[light_id]["state"], data)
+                if self.verbose:
+                    print(f"[Hue Simulated Response] Light {self.lights[light_id]['name']} updated: {data}")
+                return [{"success": {f"{endpoint}/{key}": value}} for key, value in data.items()]
+            return {"error": f"Light ID {light_id} not found."}
+        elif "/lights" == endpoint and method == "GET":
+            # Simulate getting all lights
+            return self.lights
+        elif "/lights/" in endpoint and method == "GET": # Specific light status
+            light_id = endpoint.split('/')[2]
+            if light_id in self.lights:
+                return self.lights[light_id]
+            return {"error": f"Light ID {light_id} not found."}
+        elif "/groups/" in endpoint and endpoint.endswith("/action") and method == "PUT":
+            group_id = endpoint.split('/')[2] # e.g., /groups/0/action -> 0
+            light_ids = self._group_light_ids(group_id)
+            if light_ids is None:
+                return {"error": f"Group ID {group_id} not found."}
+            state = dict(data)
+            scene_id = state.pop("scene", None)
+            if scene_id is not None:
+                if scene_id not in self.scenes:
+                    return {"error": f"Scene ID {scene_id} not found."}
+                for light_id, scene_state in self.scenes[scene_id]["lightstates"].items():
+                    if light_id in self.lights:
+                        self._apply_state(self.lights[light_id]["state"], scene_state)
+            for light_id in light_ids:
+                self._apply_state(self.lights[light_id]["state"], state)
+            if self.verbose:
+                print(f"[Hue Simulated Response] {len(light_ids)} lights in group {group_id} updated: {data}")
+            return [{"success": {f"{endpoint}/{key}": value}} for key, value in data.items()]
+        elif "/groups" == endpoint and method == "GET":
+            return self.groups
+        elif "/scenes" == endpoint and method == "GET":
+            # The bridge leaves lightstates out of the scene list
+            return {scene_id: {key: value for key, value in scene.items() if key != "lightstates"} for scene_id, scene in self.scenes.items()}
+        return {"success": "Command simulated successfully."}
+
+class HueBridgeClient:
+    """
+    Real Hue Bridge client. One requests.Session keeps connections to the bridge alive between calls;
+    every call has a timeout, and GET/PUT (both idempotent on the bridge) are retried with backoff on
+    connection errors and 5xx answers. API v1 talks to /api/<username>. API v2 talks to /clip/v2 and
+    its answers are translated to v1 shapes, so callers don't need to know which one is in use.
+    """
+    def __init__(self, base_url, username, api_version=1, timeout=3.0, retries=2, pool_size=10):
+        self.base_url = base_url.rstrip("/")
+        self.username = username
+        self.api_version = api_version
+        self.timeout = timeout
+        self.session = requests.Session()
+        if URLLIB3_AVAILABLE:
+            retry = Retry(total=retries, backoff_factor=0.1, status_forcelist=(500, 502, 503, 504), allowed_methods=frozenset(["GET", "PUT"]))
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+            self.session.mount("http://", adapter)
+            self.session.mount("https://", adapter)
+        if api_version == 2:
+            self.session.headers["hue-application-key"] = username
+            self.session.verify = False # The bridge presents a self-signed certificate
+            if URLLIB3_AVAILABLE:
+                urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+        self._v2_ids = {} # (resource type, v1 id) -> v2 resource id
+
+    def _send(self, method, url, data=None):
+        response = self.session.request(method, url, json=data, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def request(self, method, endpoint, data=None):
+        if self.api_version == 2:
+            return self._request_v2(method, endpoint, data)
+        return self._send(method, f"{self.base_url}/api/{self.username}{endpoint}", data)
+
+    def _v2_resources(self, rtype):
+        """Lists the v2 resources of one type as (v1 id, resource) pairs, remembering the id mapping for writes."""
+        pairs = []
+        for resource in self._send("GET", f"{self.base_url}/clip/v2/resource/{rtype}").get("data", []):
+            v1_id = (resource.get("id_v1") or "").rsplit("/", 1)[-1] or resource["id"]
+            self._v2_ids[(rtype, v1_id)] = resource["id"]
+            pairs.append((v1_id, resource))
+        return pairs
+
+    def _v2_put(self, rtype, v1_id, body):
+        """Writes to the v2 resource behind a v1 id. False if there is no such resource."""
+        if (rtype, v1_id) not in self._v2_ids:
+            self._v2_resources(rtype)
+        resource_id = self._v2_ids.get((rtype, v1_id))
+        if resource_id is None:
+            return False
+        self._send("PUT", f"{self.base_url}/clip/v2/resource/{rtype}/{resource_id}", body)
+        return True
+
+    def _request_v2(self, method, endpoint, data):
+        parts = endpoint.strip("/").split("/")
+        if method == "GET" and parts[0] == "lights":
+            lights = {v1_id: {"name": resource.get("metadata", {}).get("name", v1_id), "state": _hue_v2_state_to_v1(resource)}
+                      for v1_id, resource in self._v2_resources("light")}
+            if len(parts) == 1:
+                return lights
+            return lights.get(parts[1], {"error": f"Light ID {parts[1]} not found."})
+        if method == "GET" and endpoint in ("/groups", "/scenes"):
+            rtypes = ("room", "zone") if endpoint == "/groups" else ("scene",)
+            return {v1_id: {"name": resource.get("metadata", {}).get("name", v1_id)} for rtype in rtypes for v1_id, resource in self._v2_resources(rtype)}
+        if method == "PUT" and len(parts) == 3 and (parts[0], parts[2]) in (("lights", "state"), ("groups", "action")):
+            state = dict(data)
+            scene_id = state.pop("scene", None)
+            if scene_id is not None and not self._v2_put("scene", scene_id, {"recall": {"action": "active"}}):
+                return {"error": f"Scene ID {scene_id} not found."}
+            rtype = "light" if parts[0] == "lights" else "grouped_light"
+            if state and not self._v2_put(rtype, parts[1], _hue_v1_state_to_v2(state)):
+                return {"error": f"{parts[0][:-1].capitalize()} ID {parts[1]} not found."}
+            return [{"success": {f"{endpoint}/{key}": value}} for key, value in data.items()]
+        return {"error": f"'{method} {endpoint}' is not supported with Hue API v2."}
+
+_hue_client = None
 
 def _hue_api_base_url():
-    """Constructs the base URL for the Hue Bridge API."""
+    """Constructs the base URL for the Hue Bridge API (only needed when HUE_MODE is 'bridge')."""
     ip = GLOBAL_CONFIG["HUE_BRIDGE_IP"]
     username = GLOBAL_CONFIG["HUE_USERNAME"]
     if ip == "YOUR_HUE_BRIDGE_IP" or username == "your_hue_username":
         speak("Hue Bridge IP or username is not configured. Please set them in GLOBAL_CONFIG.")
         print("[Hue Error] Hue Bridge IP or username not configured.")
         return None
-    return f"http://{ip}/api/{username}"
+    return f"{'https' if GLOBAL_CONFIG['HUE_API_VERSION'] == 2 else 'http'}://{ip}"
+
+def get_hue_client():
+    """The Hue client for the configured HUE_MODE, created on first use. None if bridge mode isn't configured."""
+    global _hue_client
+    if _hue_client is None:
+        if GLOBAL_CONFIG["HUE_MODE"] == "bridge":
+            base_url = _hue_api_base_url()
+            if not base_url:
+                return None
+            _hue_client = HueBridgeClient(base_url, GLOBAL_CONFIG["HUE_USERNAME"], api_version=GLOBAL_CONFIG["HUE_API_VERSION"],
+                                          timeout=GLOBAL_CONFIG["HUE_REQUEST_TIMEOUT_SECONDS"], retries=GLOBAL_CONFIG["HUE_REQUEST_RETRIES"])
+        else:
+            _hue_client = SimulatedHueClient()
+        hue_state_cache.invalidate()
+    return _hue_client
 
 def _hue_send_command(method, endpoint, data=None):
+    """Sends a command to the Hue Bridge (or the simulation) and returns its JSON answer, or {"error": ...}."""
+    client = get_hue_client()
+    if client is None:
+        return {"error": "Configuration missing"}
+    try:
+        return client.request(method, endpoint, data)
+    except Exception as e:
+        print(f"[Hue API Error] {method} {endpoint} failed: {e}")
+        return {"error": str(e)}
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, holding at most `capacity`. acquire() blocks until one is free."""
+    def __init__(self, rate, capacity=1):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Takes one token, sleeping until it is available. Returns the seconds spent waiting."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+class HueCommandExecutor:
     """
-    Simulates sending a command to the Hue Bridge API.
-    In a real implementation, this would use `requests`.
+    Fans Hue commands out over a small thread pool, for updates that a group action can't express
+    (different brightness or colour per light). A token bucket keeps the bridge under its ~10
+    commands/s limit. A PUT to an endpoint that already has a PUT waiting for a token is merged into
+    it instead of being queued again (later values win), so redundant updates to the same light only
+    go out once. Identical waiting GETs share one request.
     """
-    base_url = _hue_api_base_url()
-    if not base_url:
-        return {"error": "Configuration missing"}
-    
-    url = f"{base_url}{endpoint}"
-    print(f"[Hue Simulated API Call] {method} {url} with data: {data}")
+    def __init__(self, send=None, commands_per_second=10, burst=1, max_workers=4):
+        self._send = send or _hue_send_command
+        self._bucket = TokenBucket(commands_per_second, burst)
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hue-command")
+        self._pending = {} # (method, endpoint) -> {"data": ..., "future": ..., "submitted": ...}
+        self._lock = threading.Lock()
+        self.coalesced_count = 0
+
+    def submit(self, method, endpoint, data=None):
+        """Queues one command and returns a Future for its response (shared with any command it was merged into)."""
+        key = (method, endpoint)
+        with self._lock:
+            entry = self._pending.get(key)
+            if entry is not None:
+                if method != "GET":
+                    entry["data"].update(data or {})
+                self.coalesced_count += 1
+                return entry["future"]
+            future = concurrent.futures.Future()
+            # Non-GET bodies are always a fresh dict, so a later PUT can be merged in even if this one had none
+            self._pending[key] = {"data": data if method == "GET" else dict(data or {}), "future": future, "submitted": time.perf_counter()}
+        self._pool.submit(self._run, key)
+        return future
+
+    def _run(self, key):
+        self._bucket.acquire()
+        with self._lock:
+            entry = self._pending.pop(key) # Nothing can be merged into it from here on
+        try:
+            response = self._send(key[0], key[1], entry["data"])
+        except Exception as e:
+            response = {"error": str(e)}
+        entry["future"].set_result((response, time.perf_counter() - entry["submitted"]))
+
+    def run_batch(self, commands):
+        """
+        Sends (method, endpoint, data) commands concurrently and waits for all of them. Returns
+        {"responses": [...] in command order, "latencies": per-request seconds, "seconds": batch time,
+        "requests": requests actually sent}.
+        """
+        started = time.perf_counter()
+        futures = [self.submit(method, endpoint, data) for method, endpoint, data in commands]
+        results = [future.result() for future in futures]
+        unique = {id(future): result for future, result in zip(futures, results)}
+        batch = {"responses": [response for response, _ in results], "latencies": [latency for _, latency in unique.values()],
+                 "seconds": time.perf_counter() - started, "requests": len(unique)}
+        if batch["latencies"]:
+            mean_ms, p95_ms = _latency_summary(batch["latencies"])
+            print(f"[Hue Executor] {len(commands)} commands as {batch['requests']} requests in {batch['seconds'] * 1000:.0f} ms; "
+                  f"latency incl. queueing mean {mean_ms:.0f} ms, p95 {p95_ms:.0f} ms.")
+        return batch
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+
+_hue_executor = None
+
+def get_hue_executor():
+    """The shared command executor for the configured bridge, created on first use."""
+    global _hue_executor
+    if _hue_executor is None:
+        _hue_executor = HueCommandExecutor(commands_per_second=GLOBAL_CONFIG["HUE_COMMANDS_PER_SECOND"], burst=GLOBAL_CONFIG["HUE_COMMAND_BURST"],
+                                           max_workers=GLOBAL_CONFIG["HUE_MAX_PARALLEL_REQUESTS"])
+    return _hue_executor
+
+def _latency_summary(samples):
+    """Mean and 95th percentile of a list of durations in seconds, in milliseconds."""
+    ordered = sorted(samples)
+    return sum(ordered) / len(ordered) * 1000, ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000
+
+class HueStateCache:
+    """
+    Last known bridge state, so status questions and name lookups don't each cost a round trip and
+    writes only carry the fields that would actually change. Light state expires after `ttl_seconds`
+    (wall switches and other apps change it too); room and scene lists after `catalog_ttl_seconds`.
+    Successful writes update the cached state in place; failed writes and scene recalls drop it.
+    """
+    def __init__(self, ttl_seconds=30, catalog_ttl_seconds=300):
+        self.ttl_seconds = ttl_seconds
+        self.catalog_ttl_seconds = catalog_ttl_seconds
+        self._entries = {} # "lights" / "groups" / "scenes" -> (fetched at, {id: {...}})
+        self._lock = threading.Lock()
+
+    def _fresh(self, kind):
+        """The cached collection if it hasn't expired, else None. Caller holds the lock."""
+        entry = self._entries.get(kind)
+        ttl = self.ttl_seconds if kind == "lights" else self.catalog_ttl_seconds
+        if entry and time.monotonic() - entry[0] < ttl:
+            return entry[1]
+        return None
 
-    # Simulate success/failure and update SIMULATED_HUE_LIGHTS
-    try:
-        if "/lights" in endpoint and "/state" in endpoint:
-            light_id = endpoint.split('/')[2] # e.g., /lights/1/state -> 1
-            if light_id in SIMULATED_HUE_LIGHTS:
-                for key, value in data.items():
-                    SIMULATED_HUE_LIGHTS[light_id]["state"][key] = value
-                print(f"[Hue Simulated Response] Light {SIMULATED_HUE_LIGHTS[light_id]['name']} updated: {data}")
-                return [{"success": {f"{endpoint}/{key}": value for key, value in data.items()}}]
+    def get(self, kind):
+        """All lights, groups or scenes, from the cache if fresh, else from the bridge. {} if it can't be reached."""
+        with self._lock:
+            cached = self._fresh(kind)
+        if cached is not None:
+            return cached
+        response = _hue_send_command("GET", f"/{kind}")
+        if not isinstance(response, dict) or "error" in response:
+            return {}
+        # Copy so that the simulation's own dicts are never edited through the cache
+        snapshot = {item_id: dict(item, state=dict(item["state"])) if "state" in item else dict(item) for item_id, item in response.items()}
+        with self._lock:
+            self._entries[kind] = (time.monotonic(), snapshot)
+        return snapshot
+
+    def _target_light_ids(self, endpoint, lights):
+        """Light ids a /lights/<id>/state or /groups/<id>/action write reaches, or None if unknown. Caller holds the lock."""
+        parts = endpoint.strip("/").split("/")
+        if parts[0] == "lights":
+            light_ids = [parts[1]]
+        elif parts[1] == "0":
+            light_ids = list(lights)
+        else:
+            group = (self._fresh("groups") or {}).get(parts[1])
+            if not group or "lights" not in group:
+                return None
+            light_ids = group["lights"]
+        return light_ids if all(light_id in lights for light_id in light_ids) else None
+
+    def changed_fields(self, endpoint, data):
+        """The part of a state write that differs from the cached state of the lights it targets (all of it if unknown)."""
+        with self._lock:
+            lights = self._fresh("lights")
+            light_ids = None if lights is None or "scene" in data else self._target_light_ids(endpoint, lights)
+            if light_ids is None:
+                return dict(data)
+            return {key: value for key, value in data.items() if any(lights[light_id]["state"].get(key) != value for light_id in light_ids)}
+
+    def record_write(self, endpoint, data, succeeded=True):
+        """Folds a write the bridge accepted into the cached state; forgets light state the write may have left unknown."""
+        with self._lock:
+            entry = self._entries.get("lights")
+            if entry is None:
+                return
+            light_ids = None if not succeeded or "scene" in data else self._target_light_ids(endpoint, entry[1])
+            if light_ids is None:
+                del self._entries["lights"]
+                return
+            for light_id in light_ids:
+                SimulatedHueClient._apply_state(entry[1][light_id]["state"], data)
+
+    def invalidate(self, kind=None):
+        with self._lock:
+            if kind is None:
+                self._entries.clear()
             else:
-                return {"error": f"Light ID {light_id} not found."}
-        elif "/lights" == endpoint and method == "GET":
-            # Simulate getting all lights
-            return SIMULATED_HUE_LIGHTS
-        elif "/lights/" in endpoint and method == "GET": # Specific light status
-            light_id = endpoint.split('/')[2]
-            if light_id in SIMULATED_HUE_LIGHTS:
-                return SIMULATED_HUE_LIGHTS[light_id]
+                self._entries.pop(kind, None)
+
+hue_state_cache = HueStateCache(GLOBAL_CONFIG["HUE_STATE_CACHE_TTL_SECONDS"], GLOBAL_CONFIG["HUE_CATALOG_CACHE_TTL_SECONDS"])
+
+def use_hue_client(client):
+    """Replaces the Hue client (e.g. with one pointed at a FakeHueBridge) and drops cached state. Returns the previous client."""
+    global _hue_client
+    previous, _hue_client = _hue_client, client
+    hue_state_cache.invalidate()
+    return previous
+
+def _hue_get_resources(kind="lights"):
+    """All "lights", "groups" or "scenes" on the bridge as {id: {"name": ..., ...}}, or {} if it can't be reached."""
+    return hue_state_cache.get(kind)
+
+_SOUNDEX_CODES = str.maketrans("aeiouybfpvcgjkqsxzdtlmnr", "000000111122222222334556", "hw") # Vowels separate repeats; h and w don't
+
+def _soundex(word):
+    """American Soundex code of one word ("lamp" -> "L510"), for matching names the recognizer mis-hears."""
+    if not word.isalpha():
+        return word # "2" and "10" must stay distinct
+    code = []
+    previous = word[0].translate(_SOUNDEX_CODES)
+    for digit in word[1:].translate(_SOUNDEX_CODES):
+        if digit != previous and digit not in "0":
+            code.append(digit)
+        previous = digit if digit.isdigit() else previous
+    return (word[0].upper() + "".join(code) + "000")[:4]
+
+def _hue_normalize_name(name):
+    """Lowercase words without punctuation or filler ("The Living-Room lamp" -> "living room lamp")."""
+    return " ".join(word for word in re.sub(r"[^a-z0-9]+", " ", name.lower()).split() if word not in ("the", "my"))
+
+class HueNameIndex:
+    """
+    Spoken-name lookup for lights, rooms or scenes. Built once from the cached device lists (plus
+    HUE_NAME_ALIASES) and rebuilt only when the names on the bridge change. Exact names and aliases
+    resolve with one dict lookup. A Soundex key of each word narrows a mis-heard name down to the few
+    names that sound alike, which are then fuzzy scored, so a shared key alone never picks a light;
+    only when none of them scores well enough does it fall back to fuzzy matching every name.
+    Lookups return (kind, id, name), where kind is "light", "group" or "scene".
+    """
+    def __init__(self, kinds):
+        self.kinds = kinds
+        self._collections = None
+        self._signature = None
+        self._exact = {}
+        self._phonetic = {} # Soundex key -> {normalized name or alias: target}
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        collections = tuple(hue_state_cache.get(kind) for kind in self.kinds)
+        if self._collections is not None and all(new is old for new, old in zip(collections, self._collections)):
+            return
+        signature = tuple((kind, item_id, item["name"]) for kind, collection in zip(self.kinds, collections) for item_id, item in collection.items())
+        self._collections = collections
+        if signature == self._signature:
+            return
+        aliases = {}
+        for alias, target_name in GLOBAL_CONFIG["HUE_NAME_ALIASES"].items():
+            aliases.setdefault(_hue_normalize_name(target_name), []).append(alias)
+        exact, phonetic = {}, {}
+        for kind, item_id, name in signature: # Later kinds win a shared name, so a light beats a room called the same
+            target = (kind[:-1], item_id, name)
+            normalized = _hue_normalize_name(name)
+            for key in [normalized] + [_hue_normalize_name(alias) for alias in aliases.get(normalized, [])]:
+                exact[key] = target
+                phonetic.setdefault(" ".join(_soundex(word) for word in key.split()), {})[key] = target
+        self._exact, self._phonetic, self._signature = exact, phonetic, signature
+
+    def lookup(self, name):
+        """The best (kind, id, name) for a spoken name, or None if nothing matches well enough."""
+        with self._lock:
+            self._refresh()
+            exact, phonetic = self._exact, self._phonetic
+        key = _hue_normalize_name(name)
+        target = exact.get(key)
+        if target or not exact or not key:
+            return target
+        candidates = phonetic.get(" ".join(_soundex(word) for word in key.split()))
+        if candidates:
+            if len(candidates) == 1:
+                best_match_name = next(iter(candidates))
+                score = fuzz.ratio(key, best_match_name)
             else:
-                return {"error": f"Light ID {light_id} not found."}
-        else:
-            return {"success": "Command simulated successfully."}
-    except Exception as e:
-        print(f"[Hue Simulated API Error] Error processing simulated command: {e}")
-        return {"error": str(e)}
+                best_match_name, score = process.extractOne(key, list(candidates))
+            if score > GLOBAL_CONFIG["FUZZY_MATCH_THRESHOLD"]:
+                return candidates[best_match_name]
+        best_match_name, score = process.extractOne(key, list(exact.keys()))
+        if score > GLOBAL_CONFIG["FUZZY_MATCH_THRESHOLD"]:
+            return exact[best_match_name]
+        return None
+
+hue_light_index = HueNameIndex(("lights",))
+hue_target_index = HueNameIndex(("groups", "lights"))
+hue_scene_index = HueNameIndex(("scenes",))
 
 def _hue_find_light_id(light_name):
-    """Finds a light ID by its name using fuzzy matching."""
-    light_names_map = {light_data["name"].lower(): light_id for light_id, light_data in SIMULATED_HUE_LIGHTS.items()}
-    best_match_name, score = process.extractOne(light_name.lower(), list(light_names_map.keys()))
+    """Finds a light ID by its spoken name."""
+    target = hue_light_index.lookup(light_name)
+    return target[1] if target else None
 
-    if score > GLOBAL_CONFIG["FUZZY_MATCH_THRESHOLD"]: # Use a configurable threshold
-        return light_names_map[best_match_name]
-    return None
+HUE_ALL_LIGHTS_PHRASES = {"all", "all lights", "all the lights", "every light", "everything", "lights", "the lights"}
+
+def _hue_find_target(name):
+    """
+    Resolves a spoken name to ("group", id, name) for a room/zone or ("light", id, name) for a single
+    light, so "living room" switches the room and "living room lamp" the lamp. "All lights" is group 0.
+    Returns None if nothing matches well enough.
+    """
+    if name.lower().strip() in HUE_ALL_LIGHTS_PHRASES:
+        return ("group", "0", "all lights")
+    return hue_target_index.lookup(name)
+
+def _hue_find_scene(scene_name):
+    """Finds a scene by its spoken name. Returns (scene_id, scene_data) or None."""
+    target = hue_scene_index.lookup(scene_name)
+    if target is None:
+        return None
+    scene_data = _hue_get_resources("scenes").get(target[1])
+    return (target[1], scene_data) if scene_data else None
 
 def _hue_get_light_status(light_id=None):
     """Gets and speaks the status of a specific light or all lights."""
-    if not _hue_api_base_url(): return # Configuration check handled by base_url func
+    if not get_hue_client(): return # Bridge mode without IP/username; already reported
 
     if light_id:
-        response = _hue_send_command("GET", f"/lights/{light_id}")
-        if response and "error" not in response:
+        response = _hue_get_resources("lights").get(light_id)
+        if response:
             light_name = response["name"]
             state = response["state"]
             status = "on" if state.get("on") else "off"
@@ -2252,15 +6106,10 @@ def _hue_get_light_status(light_id=None):
             print(f"[Hue Status] {light_name} is {status}, brightness: {brightness}, state: {state}")
         else:
             speak(f"I couldn't get the status for that light. It might not exist or there's a connection issue.")
-            print(f"[Hue Error] Failed to get status for light ID {light_id}: {response.get('error', 'Unknown')}")
+            print(f"[Hue Error] Failed to get status for light ID {light_id}: {response}")
     else:
-        response = _hue_send_command("GET", "/lights")
-        if response and "error" not in response:
-            if not response:
-                speak("No Philips Hue lights are configured or found.")
-                print("[Hue Status] No lights found in simulated data.")
-                return
-            
+        response = _hue_get_resources("lights")
+        if response:
             speak("Here are the statuses of your Philips Hue lights:")
             for lid, light_data in response.items():
                 name = light_data["name"]
@@ -2283,14 +6132,12 @@ def _hue_get_light_status(light_id=None):
                 speak(status_message)
                 print(f"[Hue Status] {name}: {status}, {brightness}% brightness, state: {state}.")
         else:
-            speak(f"I couldn't get the status of your lights. There might be a connection issue with the Hue Bridge.")
-            print(f"[Hue Error] Failed to get all light statuses: {response.get('error', 'Unknown')}")
-
+            speak("I couldn't find any Philips Hue lights. There might be a connection issue with the Hue Bridge.")
+            print("[Hue Error] No lights returned by the bridge.")
 
-def _hue_set_light(light_id, on=None, brightness=None, color_name=None):
-    """Sets the state of a Philips Hue light."""
-    if not _hue_api_base_url(): return # Configuration check handled by base_url func
 
+def _hue_build_state(on=None, brightness=None, color_name=None):
+    """Builds the v1 state body shared by light and group actions. None (already spoken) for an unsupported color."""
     data = {}
     if on is not None:
         data["on"] = on
@@ -2298,90 +6145,419 @@ def _hue_set_light(light_id, on=None, brightness=None, color_name=None):
         # Hue brightness is 0-254
         data["bri"] = int(min(254, max(0, brightness * 2.54)))
     if color_name:
-        # Simplified color mapping for demonstration (Hue uses XY or HSL)
-        color_name_lower = color_name.lower()
-        if color_name_lower == "red":
-            data["hue"] = 0 # Example hue value for red
-            data["sat"] = 254 # Max saturation
-        elif color_name_lower == "blue":
-            data["hue"] = 46920 # Example hue value for blue
-            data["sat"] = 254
-        elif color_name_lower == "green":
-            data["hue"] = 25500 # Example hue value for green
-            data["sat"] = 254
-        elif color_name_lower == "white":
-            data["hue"] = 0
-            data["sat"] = 0 # No saturation for white
-        elif color_name_lower == "yellow":
-            data["hue"] = 12750
-            data["sat"] = 254
-        elif color_name_lower == "purple":
-            data["hue"] = 56100
-            data["sat"] = 254
-        elif color_name_lower == "orange":
-            data["hue"] = 5000
-            data["sat"] = 254
-        else:
-            speak(f"I can't set the light to '{color_name}'. Try basic colors like red, blue, green, white, yellow, purple, or orange.")
+        color_state = _hue_color_state(color_name)
+        if color_state is None:
+            speak(f"I can't set the light to '{color_name}'. Try a color like red, teal, coral or lavender.")
             print(f"[Hue Info] Unsupported color: {color_name}")
-            return
+            return None
+        data.update(color_state)
+    return data
 
+def _hue_put_state(endpoint, data, target_name, on=None, brightness=None, color_name=None, scene_name=None):
+    """
+    Sends one light or group state change and speaks a single confirmation for it. Only the fields
+    that differ from the cached state are sent; if none do, no request is made.
+    """
     if not data:
         speak("No specific light state provided to set.")
-        return
-
-    response = _hue_send_command("PUT", f"/lights/{light_id}/state", data)
-    if response and "success" in response[0]:
-        light_name = SIMULATED_HUE_LIGHTS.get(light_id, {}).get("name", "the light")
-        status_msg = f"set {light_name}"
-        if on is not None: status_msg += f" {'on' if on else 'off'}"
-        if brightness is not None: status_msg += f" to {brightness}% brightness"
-        if color_name: status_msg += f" to {color_name} color"
+        return False
+    status_msg = f"set {target_name}"
+    if scene_name: status_msg += f" to the {scene_name} scene"
+    if on is not None: status_msg += f" {'on' if on else 'off'}"
+    if brightness is not None: status_msg += f" to {brightness}% brightness"
+    if color_name: status_msg += f" to {color_name} color"
+    changed = hue_state_cache.changed_fields(endpoint, data)
+    if not changed:
+        speak(f"Okay, nothing to change for {target_name}.")
+        print(f"[Hue Action] {status_msg}: already in that state, nothing sent.")
+        return True
+    response = _hue_send_command("PUT", endpoint, changed)
+    succeeded = isinstance(response, list) and bool(response) and "success" in response[0]
+    hue_state_cache.record_write(endpoint, changed, succeeded)
+    if succeeded:
         speak(f"Okay, I have {status_msg}.")
-        print(f"[Hue Action] {status_msg} for ID {light_id}.")
-    else:
-        speak(f"I couldn't control that light. There might be an issue with the Hue Bridge or the light ID.")
-        print(f"[Hue Error] Failed to set light state for ID {light_id}: {response.get('error', 'Unknown')}")
+        print(f"[Hue Action] {status_msg} via {endpoint} (sent {changed}).")
+        return True
+    speak(f"I couldn't control {target_name}. There might be an issue with the Hue Bridge or the light ID.")
+    print(f"[Hue Error] Failed to send {data} to {endpoint}: {response}")
+    return False
+
+def _hue_set_light(light_id, on=None, brightness=None, color_name=None, light_name=None):
+    """Sets the state of a Philips Hue light. `light_name` is only used for the spoken confirmation. True on success."""
+    if not get_hue_client(): return False # Bridge mode without IP/username; already reported
 
+    data = _hue_build_state(on, brightness, color_name)
+    if data is None:
+        return False
+    light_name = light_name or _hue_get_resources("lights").get(light_id, {}).get("name", "the light")
+    return _hue_put_state(f"/lights/{light_id}/state", data, light_name, on, brightness, color_name)
+
+def _hue_set_group(group_id="0", on=None, brightness=None, color_name=None, group_name="all lights", scene_id=None, scene_name=None):
+    """
+    Sets every light in a room/zone (group "0" is all lights) or recalls a scene with one
+    /groups/<id>/action request and one spoken confirmation, however many lights are involved.
+    """
+    if not get_hue_client(): return False # Bridge mode without IP/username; already reported
+
+    data = _hue_build_state(on, brightness, color_name)
+    if data is None:
+        return False
+    if scene_id is not None:
+        data["scene"] = scene_id
+    return _hue_put_state(f"/groups/{group_id}/action", data, group_name, on, brightness, color_name, scene_name)
+
+def _hue_set_lights(light_states, description="the lights"):
+    """
+    Sets different states on several lights at once ({light_id: {"on"/"brightness"/"color_name": ...}}),
+    fanned out through the command executor, with one spoken confirmation for the whole batch.
+    """
+    if not get_hue_client(): return False # Bridge mode without IP/username; already reported
+
+    commands = []
+    for light_id, state in light_states.items():
+        data = _hue_build_state(state.get("on"), state.get("brightness"), state.get("color_name"))
+        if data is None:
+            return False
+        changed = hue_state_cache.changed_fields(f"/lights/{light_id}/state", data)
+        if changed:
+            commands.append(("PUT", f"/lights/{light_id}/state", changed))
+    if not commands:
+        speak(f"Okay, nothing to change for {description}.")
+        return True
+    batch = get_hue_executor().run_batch(commands)
+    failed = []
+    for (_, endpoint, data), response in zip(commands, batch["responses"]):
+        succeeded = isinstance(response, list) and bool(response) and "success" in response[0]
+        hue_state_cache.record_write(endpoint, data, succeeded)
+        if not succeeded:
+            failed.append(endpoint)
+    if failed:
+        speak(f"I set {description}, but {len(failed)} of {len(commands)} lights didn't respond.")
+        print(f"[Hue Error] Failed updates: {failed}")
+        return False
+    speak(f"Okay, I have set {description}.")
+    print(f"[Hue Action] set {description}: {len(commands)} lights in {batch['seconds']:.2f}s.")
+    return True
+
+def _hue_group_name(group_id):
+    """Spoken name of a group: "all lights" for group 0, else the room/zone name."""
+    if group_id == "0":
+        return "all lights"
+    return _hue_get_resources("groups").get(group_id, {}).get("name", "the room")
+
+def _hue_set_target(target, on=None, brightness=None, color_name=None):
+    """Applies a state change to a ("light" | "group", id, name) target from _hue_find_target. True if it took effect."""
+    kind, target_id, target_name = target
+    if kind == "group":
+        return _hue_set_group(target_id, on, brightness, color_name, group_name=target_name)
+    return _hue_set_light(target_id, on, brightness, color_name, light_name=target_name)
+
+
+# --- Smart Home Devices (thermostats and locks through a device hub) ---
+SIMULATED_DEVICES = {
+    "hallway_thermostat": {"type": "thermostat", "name": "Hallway Thermostat", "state": {"target": 21.0, "mode": "heat"}},
+    "front_door": {"type": "lock", "name": "Front Door", "state": {"locked": True}},
+    "back_door": {"type": "lock", "name": "Back Door", "state": {"locked": False}},
+}
+
+def _thermostat_target(value):
+    low, high = GLOBAL_CONFIG["THERMOSTAT_RANGE_CELSIUS"]
+    value = float(value)
+    if not low <= value <= high:
+        raise ValueError(f"{value:g} degrees is outside {low} to {high}")
+    return value
+
+def _thermostat_mode(value):
+    if value not in ("heat", "cool", "auto", "off"):
+        raise ValueError(f"unknown thermostat mode '{value}'")
+    return value
+
+def _lock_state(value):
+    if not isinstance(value, bool):
+        raise ValueError(f"'locked' must be true or false, not {value!r}")
+    return value
+
+class DeviceDriver:
+    """
+    A device type: which state fields a command may set and how to check them, and how to describe
+    a device's state in speech. Drivers hold no state; the hub owns it.
+    """
+    device_type = None
+    fields = {} # state field -> function(value) returning the checked value or raising ValueError
+
+    @classmethod
+    def validate(cls, state):
+        """Checks a command's state for this device type. Raises ValueError for unknown fields or bad values."""
+        unknown = sorted(set(state) - set(cls.fields))
+        if unknown:
+            raise ValueError(f"a {cls.device_type} has no {', '.join(unknown)}")
+        return {field: cls.fields[field](value) for field, value in state.items()}
+
+    @staticmethod
+    def describe(name, state):
+        return name
+
+class ThermostatDriver(DeviceDriver):
+    device_type = "thermostat"
+    fields = {"target": _thermostat_target, "mode": _thermostat_mode}
+
+    @staticmethod
+    def describe(name, state):
+        return f"{name} is set to {state['target']:g} degrees"
+
+class LockDriver(DeviceDriver):
+    device_type = "lock"
+    fields = {"locked": _lock_state}
+
+    @staticmethod
+    def describe(name, state):
+        return f"{name} is {'locked' if state['locked'] else 'unlocked'}"
+
+DEVICE_DRIVERS = {driver.device_type: driver for driver in (ThermostatDriver, LockDriver)}
+
+class SimulatedDeviceHub:
+    """
+    In-process device hub: holds device state and applies each command after `latency_seconds` (the
+    time a lock motor or thermostat relay takes), acknowledging it through the Future that submit
+    returns. Commands are timed on their own AlarmScheduler, so many devices act at once on one thread.
+    """
+    def __init__(self, devices=None, latency_seconds=0.0, verbose=True):
+        devices = SIMULATED_DEVICES if devices is None else devices
+        self.devices = {device_id: {"type": device["type"], "name": device["name"], "state": dict(device["state"])} for device_id, device in devices.items()}
+        self.latency = datetime.timedelta(seconds=latency_seconds)
+        self.verbose = verbose
+        self._scheduler = AlarmScheduler(SystemClock(), max_sleep_seconds=1)
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def list_devices(self):
+        with self._lock:
+            return {device_id: dict(device, state=dict(device["state"])) for device_id, device in self.devices.items()}
+
+    def submit(self, device_id, state):
+        """Queues a command for a device. Returns a Future for its acknowledgement: {"device", "ok", "state" or "error"}."""
+        future = concurrent.futures.Future()
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._scheduler.run, name="device-hub", daemon=True)
+                self._thread.start()
+            command_id = next(self._sequence)
+        self._scheduler.schedule(("device", command_id), self._scheduler.clock.now() + self.latency, self._apply, (device_id, state, future))
+        return future
+
+    def _apply(self, key, payload):
+        device_id, state, future = payload
+        with self._lock:
+            device = self.devices.get(device_id)
+            try:
+                if device is None:
+                    raise ValueError(f"unknown device '{device_id}'")
+                device["state"].update(DEVICE_DRIVERS[device["type"]].validate(state))
+                ack = {"device": device_id, "ok": True, "state": dict(device["state"])}
+            except ValueError as e:
+                ack = {"device": device_id, "ok": False, "error": str(e)}
+        if self.verbose:
+            print(f"[Device Hub Simulated] {device_id}: {ack}")
+        if future.set_running_or_notify_cancel(): # False when the caller gave up waiting
+            future.set_result(ack)
+
+    def close(self):
+        self._scheduler.stop()
+
+class DeviceHubClient:
+    """
+    Device hub over HTTP. Commands from submit() are gathered for `batch_window_seconds` and posted
+    as one batch; the hub answers at once and acknowledges each command when its device has acted.
+    A long-poll on /acks hands those acknowledgements to the Futures that submit returned, so
+    senders never wait on the hub. Posting and the long-poll each keep one keep-alive connection.
+    """
+    def __init__(self, base_url, timeout=3.0, batch_window_seconds=0.02, max_batch=200):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.batch_window_seconds = batch_window_seconds
+        self.max_batch = max_batch
+        self.batch_count = 0
+        self.session = requests.Session()
+        self._ack_session = requests.Session()
+        self._client_id = uuid.uuid4().hex # The hub keeps each client's acknowledgements apart
+        self._sequence = itertools.count()
+        self._outbox = [] # Commands waiting to be posted
+        self._pending = {} # command id -> Future
+        self._cond = threading.Condition()
+        self._running = True
+        threading.Thread(target=self._send_loop, name="device-hub-send", daemon=True).start()
+        threading.Thread(target=self._ack_loop, name="device-hub-acks", daemon=True).start()
+
+    def list_devices(self):
+        response = self.session.get(f"{self.base_url}/devices", timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def submit(self, device_id, state):
+        """Queues a command for the next batch. Returns a Future for its acknowledgement."""
+        future = concurrent.futures.Future()
+        with self._cond:
+            command_id = f"{self._client_id}-{next(self._sequence)}"
+            self._pending[command_id] = future
+            self._outbox.append({"id": command_id, "device": device_id, "state": state})
+            self._cond.notify_all()
+        future.add_done_callback(lambda _, command_id=command_id: self._forget(command_id)) # Also runs if the caller cancels
+        return future
+
+    def _forget(self, command_id):
+        with self._cond:
+            self._pending.pop(command_id, None)
+
+    def _resolve(self, command_id, ack):
+        with self._cond:
+            future = self._pending.get(command_id)
+        if future is not None and future.set_running_or_notify_cancel():
+            future.set_result(ack)
+
+    def _send_loop(self):
+        while True:
+            with self._cond:
+                while not self._outbox and self._running:
+                    self._cond.wait()
+                if not self._running:
+                    return
+                full = len(self._outbox) >= self.max_batch
+            if not full and self.batch_window_seconds:
+                time.sleep(self.batch_window_seconds) # Let commands issued together share one request
+            with self._cond:
+                batch, self._outbox = self._outbox[:self.max_batch], self._outbox[self.max_batch:]
+            try:
+                response = self.session.post(f"{self.base_url}/commands", json={"client": self._client_id, "commands": batch}, timeout=self.timeout)
+                response.raise_for_status()
+                self.batch_count += 1
+            except Exception as e:
+                print(f"[Device Hub Error] Could not send {len(batch)} commands: {e}")
+                for command in batch:
+                    self._resolve(command["id"], {"device": command["device"], "ok": False, "error": "the hub is unreachable"})
+
+    def _ack_loop(self):
+        while self._running:
+            try:
+                response = self._ack_session.get(f"{self.base_url}/acks", params={"client": self._client_id, "wait": 1.0}, timeout=self.timeout + 1.0)
+                response.raise_for_status()
+                acks = response.json()["acks"]
+            except Exception as e:
+                if self._running:
+                    print(f"[Device Hub Error] Acknowledgement poll failed: {e}")
+                    time.sleep(0.5)
+                continue
+            for ack in acks:
+                self._resolve(ack.pop("id"), ack)
+
+    def close(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        self.session.close()
+        self._ack_session.close()
+
+_device_hub = None
+
+def get_device_hub():
+    """The hub for thermostats and locks: an in-process simulation unless DEVICE_HUB_MODE is "hub"."""
+    global _device_hub
+    if _device_hub is None:
+        if GLOBAL_CONFIG["DEVICE_HUB_MODE"] == "hub":
+            _device_hub = DeviceHubClient(GLOBAL_CONFIG["DEVICE_HUB_URL"], batch_window_seconds=GLOBAL_CONFIG["DEVICE_BATCH_WINDOW_MS"] / 1000.0)
+        else:
+            _device_hub = SimulatedDeviceHub(latency_seconds=0.3)
+    return _device_hub
+
+def use_device_hub(hub):
+    """Replaces the device hub (e.g. with a client for the fake hub). Returns the previous one."""
+    global _device_hub
+    previous, _device_hub = _device_hub, hub
+    return previous
+
+def send_device_commands(commands, timeout=None):
+    """
+    Sends (device_id, state) commands through the hub all at once and waits for their
+    acknowledgements. Returns the acks in command order; one that doesn't arrive within
+    DEVICE_COMMAND_TIMEOUT_SECONDS is reported as {"ok": False, "error": "no acknowledgement"}.
+    """
+    timeout = GLOBAL_CONFIG["DEVICE_COMMAND_TIMEOUT_SECONDS"] if timeout is None else timeout
+    hub = get_device_hub()
+    futures = [hub.submit(device_id, state) for device_id, state in commands]
+    done, _ = concurrent.futures.wait(futures, timeout=timeout)
+    acks = []
+    for (device_id, _), future in zip(commands, futures):
+        if future in done or not future.cancel():
+            acks.append(future.result())
+        else:
+            acks.append({"device": device_id, "ok": False, "error": "no acknowledgement"})
+    return acks
+
+def _set_devices(device_type, state):
+    """Applies `state` to every device of a type and speaks the outcome. Returns True if every device confirmed."""
+    driver = DEVICE_DRIVERS[device_type]
+    try:
+        state = driver.validate(state)
+        devices = {device_id: device for device_id, device in get_device_hub().list_devices().items() if device["type"] == device_type}
+    except ValueError as e:
+        speak(f"I can't do that: {e}.")
+        return False
+    except requests.exceptions.RequestException as e:
+        speak("I couldn't reach the device hub.")
+        print(f"[Device Hub Error] {e}")
+        return False
+    if not devices:
+        speak(f"I don't know of any {device_type}s.")
+        return False
+    acks = send_device_commands([(device_id, state) for device_id in devices])
+    done = [driver.describe(devices[ack["device"]]["name"], ack["state"]) for ack in acks if ack["ok"]]
+    failed = [(devices[ack["device"]]["name"], ack["error"]) for ack in acks if not ack["ok"]]
+    if done:
+        speak(f"Okay, {' and '.join(done)}.")
+    for name, error in failed:
+        speak(f"{name} didn't respond: {error}.")
+    print(f"[Device Action] {device_type} {state}: {len(done)} confirmed, {len(failed)} failed.")
+    return not failed
+
+def _parse_temperature(text):
+    match = re.search(r"\d+(?:\.\d+)?", _normalize_spoken_numbers(text or ""))
+    return float(match.group()) if match else None
 
 def control_smart_device(action_type, user_command_raw, target_value=None):
     """
-    Controls smart home devices (currently simulated Philips Hue lights).
+    Controls smart home devices: Philips Hue lights (simulated unless HUE_MODE is "bridge") and
+    thermostats and locks through the device hub (simulated unless DEVICE_HUB_MODE is "hub").
     This function acts as a dispatcher for smart home commands.
     """
     if action_type == "lights_on":
         if target_value == "all":
-            speak("Turning on all Philips Hue lights.")
-            for light_id in SIMULATED_HUE_LIGHTS.keys():
-                _hue_set_light(light_id, on=True)
-        else: # Specific light, will prompt for name
-            speak("Which light would you like me to turn on? Say 'cancel' to abort.")
+            _hue_set_group("0", on=True) # One request and one confirmation for every light
+        else: # Specific light or room, will prompt for name
+            speak("Which light or room would you like me to turn on? Say 'cancel' to abort.")
             light_name = listen_command("Listening for light name...")
             if light_name == "cancel_command": return
             if light_name:
-                light_id = _hue_find_light_id(light_name)
-                if light_id:
-                    _hue_set_light(light_id, on=True)
+                target = _hue_find_target(light_name)
+                if target:
+                    _hue_set_target(target, on=True)
                 else:
-                    speak(f"I couldn't find a light named '{light_name}'.")
+                    speak(f"I couldn't find a light or room named '{light_name}'.")
             else:
                 speak("No light name provided. Aborting.")
 
     elif action_type == "lights_off":
         if target_value == "all":
-            speak("Turning off all Philips Hue lights.")
-            for light_id in SIMULATED_HUE_LIGHTS.keys():
-                _hue_set_light(light_id, on=False)
-        else: # Specific light, will prompt for name
-            speak("Which light would you like me to turn off? Say 'cancel' to abort.")
+            _hue_set_group("0", on=False) # One request and one confirmation for every light
+        else: # Specific light or room, will prompt for name
+            speak("Which light or room would you like me to turn off? Say 'cancel' to abort.")
             light_name = listen_command("Listening for light name...")
             if light_name == "cancel_command": return
             if light_name:
-                light_id = _hue_find_light_id(light_name)
-                if light_id:
-                    _hue_set_light(light_id, on=False)
+                target = _hue_find_target(light_name)
+                if target:
+                    _hue_set_target(target, on=False)
                 else:
-                    speak(f"I couldn't find a light named '{light_name}'.")
+                    speak(f"I couldn't find a light or room named '{light_name}'.")
             else:
                 speak("No light name provided. Aborting.")
 
@@ -2389,11 +6565,11 @@ def control_smart_device(action_type, user_command_raw, target_value=None):
         # Extract light name from the rest of the command
         light_name_query = user_command_raw.replace("turn on the", "").strip()
         if light_name_query:
-            light_id = _hue_find_light_id(light_name_query)
-            if light_id:
-                _hue_set_light(light_id, on=True)
+            target = _hue_find_target(light_name_query)
+            if target:
+                _hue_set_target(target, on=True)
             else:
-                speak(f"I couldn't find a light named '{light_name_query}'.")
+                speak(f"I couldn't find a light or room named '{light_name_query}'.")
         else:
             speak("Please tell me which light to turn on.")
 
@@ -2401,11 +6577,11 @@ def control_smart_device(action_type, user_command_raw, target_value=None):
         # Extract light name from the rest of the command
         light_name_query = user_command_raw.replace("turn off the", "").strip()
         if light_name_query:
-            light_id = _hue_find_light_id(light_name_query)
-            if light_id:
-                _hue_set_light(light_id, on=False)
+            target = _hue_find_target(light_name_query)
+            if target:
+                _hue_set_target(target, on=False)
             else:
-                speak(f"I couldn't find a light named '{light_name_query}'.")
+                speak(f"I couldn't find a light or room named '{light_name_query}'.")
         else:
             speak("Please tell me which light to turn off.")
 
@@ -2439,11 +6615,11 @@ def control_smart_device(action_type, user_command_raw, target_value=None):
             if num_part: brightness_percent = int(num_part)
 
         if light_name and brightness_percent is not None:
-            light_id = _hue_find_light_id(light_name)
-            if light_id:
-                _hue_set_light(light_id, brightness=brightness_percent)
+            target = _hue_find_target(light_name)
+            if target:
+                _hue_set_target(target, brightness=brightness_percent)
             else:
-                speak(f"I couldn't find a light named '{light_name}'.")
+                speak(f"I couldn't find a light or room named '{light_name}'.")
         else:
             speak("I need both the light name and the brightness percentage. Please try again.")
 
@@ -2473,11 +6649,11 @@ def control_smart_device(action_type, user_command_raw, target_value=None):
             if color_name == "cancel_command": return
 
         if light_name and color_name:
-            light_id = _hue_find_light_id(light_name)
-            if light_id:
-                _hue_set_light(light_id, color_name=color_name)
+            target = _hue_find_target(light_name)
+            if target:
+                _hue_set_target(target, color_name=color_name)
             else:
-                speak(f"I couldn't find a light named '{light_name}'.")
+                speak(f"I couldn't find a light or room named '{light_name}'.")
         else:
             speak("I need both the light name and the color. Please try again.")
 
@@ -2510,31 +6686,551 @@ def control_smart_device(action_type, user_command_raw, target_value=None):
             speak("No light name provided. Aborting.")
 
 
-    elif action_type == "set_thermostat":
-        # This remains conceptual as it's not Hue-specific
-        if target_value:
-            speak(f"Setting the thermostat to {target_value} degrees. This remains conceptual and requires knowing your thermostat's device ID and API commands.")
-            print(f"[Smart Home Conceptual] Setting thermostat to {target_value} degrees.")
+    elif action_type == "activate_scene":
+        # Example: "activate scene relax" or "set the scene to concentrate"
+        scene_query = user_command_raw
+        for phrase in ("activate scene", "set the scene to", "set scene to"):
+            scene_query = scene_query.replace(phrase, "")
+        scene_query = scene_query.strip()
+        if not scene_query:
+            speak("Which scene would you like? Say 'cancel' to abort.")
+            scene_query = listen_command("Listening for scene name...")
+            if scene_query == "cancel_command": return
+        if scene_query:
+            scene = _hue_find_scene(scene_query)
+            if scene:
+                scene_id, scene_data = scene
+                group_id = scene_data.get("group", "0")
+                _hue_set_group(group_id, group_name=_hue_group_name(group_id), scene_id=scene_id, scene_name=scene_data["name"])
+            else:
+                speak(f"I couldn't find a scene named '{scene_query}'.")
         else:
+            speak("No scene name provided. Aborting.")
+
+    elif action_type == "set_thermostat":
+        temperature = target_value or _parse_temperature(user_command_raw)
+        if temperature is None:
             speak("What temperature should I set the thermostat to? Say 'cancel' to abort.")
             temp_str = listen_command("Listening for temperature...")
             if temp_str == "cancel_command": return
-            cleaned_temp_str = ''.join(filter(str.isdigit, temp_str))
-            if cleaned_temp_str:
-                speak(f"Setting thermostat to {cleaned_temp_str} degrees. (Conceptual)")
-                print(f"[Smart Home Conceptual] Setting thermostat to {cleaned_temp_str} degrees.")
-            else:
+            temperature = _parse_temperature(temp_str)
+            if temperature is None:
                 speak("I didn't get a valid temperature.")
+                return
+        _set_devices("thermostat", {"target": temperature})
     elif action_type == "lock_doors":
-        speak("Locking the doors. This remains conceptual and requires integration with a smart lock system.")
-        print("[Smart Home Conceptual] Locking doors.")
+        _set_devices("lock", {"locked": True}) # Every lock at once; one confirmation
     elif action_type == "unlock_doors":
-        speak("Unlocking the doors. This remains conceptual and requires integration with a smart lock system.")
-        print("[Smart Home Conceptual] Unlocking doors.")
+        _set_devices("lock", {"locked": False})
     else:
         speak("I'm not sure how to perform that smart home action.")
 
 
+# --- Fake Hue Bridge and Client Benchmark ---
+class FakeHueBridge:
+    """
+    Local HTTP/1.1 stand-in for a Hue Bridge, speaking the v1 API and the v2 light, grouped_light,
+    room and scene resources, for exercising HueBridgeClient without hardware. State lives in a
+    SimulatedHueClient, so both APIs see the same lights. `latency_seconds` is added to every answer
+    to mimic the bridge's processing time. Counts requests and the TCP connections they arrived on.
+    """
+    def __init__(self, light_count=4, latency_seconds=0.0, username="jarvis-test"):
+        self.username = username
+        self.latency_seconds = latency_seconds
+        lights = {}
+        for number in range(1, light_count + 1):
+            light_id = str(number)
+            template = SIMULATED_HUE_LIGHTS.get(light_id, {"name": f"Light {number}", "state": {"on": False, "bri": 254, "hue": 0, "sat": 0}})
+            lights[light_id] = {"name": template["name"], "state": dict(template["state"])}
+        groups = {group_id: dict(group) for group_id, group in SIMULATED_HUE_GROUPS.items()}
+        scenes = {scene_id: dict(scene) for scene_id, scene in SIMULATED_HUE_SCENES.items()}
+        self.backend = SimulatedHueClient(lights, groups, scenes, verbose=False)
+        self.lights = self.backend.lights
+        self.request_count = 0
+        self.connection_count = 0
+        self._lock = threading.Lock()
+        self._server = None
+
+    @staticmethod
+    def _v2_id(rtype, v1_id):
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{rtype}/{v1_id}"))
+
+    def _v2_collection(self, rtype):
+        """The v1 id -> v1 object map that a v2 resource type is served from."""
+        if rtype == "light":
+            return self.backend.lights
+        if rtype == "grouped_light":
+            return dict(self.backend.groups, **{"0": {"name": "All lights"}})
+        if rtype == "room":
+            return self.backend.groups
+        if rtype == "scene":
+            return self.backend.scenes
+        return {}
+
+    def _v2_resource(self, rtype, v1_id, item):
+        prefix = {"light": "lights", "scene": "scenes"}.get(rtype, "groups")
+        resource = {"id": self._v2_id(rtype, v1_id), "id_v1": f"/{prefix}/{v1_id}", "type": rtype}
+        if rtype != "grouped_light":
+            resource["metadata"] = {"name": item["name"]}
+        if rtype == "light":
+            state = item["state"]
+            resource["on"] = {"on": state["on"]}
+            resource["dimming"] = {"brightness": round(state["bri"] / 2.54, 1)}
+            if "xy" in state:
+                resource["color"] = {"xy": {"x": state["xy"][0], "y": state["xy"][1]}}
+        return resource
+
+    def _v2(self, method, parts, body):
+        rtype = parts[0] if parts else ""
+        collection = self._v2_collection(rtype)
+        if method == "GET" and len(parts) == 1:
+            return 200, {"errors": [], "data": [self._v2_resource(rtype, v1_id, item) for v1_id, item in collection.items()]}
+        v1_id = next((v1_id for v1_id in collection if len(parts) == 2 and self._v2_id(rtype, v1_id) == parts[1]), None)
+        if method != "PUT" or v1_id is None:
+            return 404, {"errors": [{"description": "Not Found"}], "data": []}
+        if rtype == "scene":
+            self.backend.request("PUT", f"/groups/{self.backend.scenes[v1_id].get('group', '0')}/action", {"scene": v1_id})
+        else:
+            state = {}
+            if "on" in body:
+                state["on"] = body["on"]["on"]
+            if "dimming" in body:
+                state["bri"] = int(round(body["dimming"]["brightness"] * 2.54))
+            if "color" in body:
+                state["xy"] = [body["color"]["xy"]["x"], body["color"]["xy"]["y"]]
+            endpoint = f"/lights/{v1_id}/state" if rtype == "light" else f"/groups/{v1_id}/action"
+            self.backend.request("PUT", endpoint, state)
+        return 200, {"errors": [], "data": [{"rid": parts[1], "rtype": rtype}]}
+
+    def _make_handler(self):
+        bridge = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1" # Keep-alive, like the real bridge
+            disable_nagle_algorithm = True # Headers and body are separate writes; avoid delayed-ACK stalls
+
+            def setup(self):
+                super().setup()
+                with bridge._lock:
+                    bridge.connection_count += 1
+
+            def _handle(self, method):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length)) if length else {}
+                with bridge._lock:
+                    bridge.request_count += 1
+                    parts = [part for part in self.path.split("/") if part]
+                    if parts[:3] == ["clip", "v2", "resource"]:
+                        if self.headers.get("hue-application-key") == bridge.username:
+                            status, result = bridge._v2(method, parts[3:], body)
+                        else:
+                            status, result = 403, {"errors": [{"description": "unauthorized user"}], "data": []}
+                    elif parts[:1] == ["api"] and parts[1:2] == [bridge.username]:
+                        status, result = 200, bridge.backend.request(method, "/" + "/".join(parts[2:]), body)
+                    else:
+                        status, result = 200, [{"error": {"type": 1, "address": self.path, "description": "unauthorized user"}}]
+                    payload = json.dumps(result).encode("utf-8")
+                if bridge.latency_seconds:
+                    time.sleep(bridge.latency_seconds)
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                self._handle("GET")
+
+            def do_PUT(self):
+                self._handle("PUT")
+
+            def log_message(self, format, *args):
+                pass # Keep benchmark output readable
+
+        return Handler
+
+    def start(self):
+        """Starts serving on a free localhost port in a background thread and returns the base URL."""
+        self._server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="fake-hue-bridge", daemon=True).start()
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+def benchmark_hue_client(request_count=300, latency_ms=2.0):
+    """
+    Compares per-call requests.put() (a new TCP connection each time) with HueBridgeClient's pooled
+    keep-alive session against the fake bridge, then checks the v2 translation round-trips.
+    """
+    bridge = FakeHueBridge(latency_seconds=latency_ms / 1000.0)
+    base_url = bridge.start()
+    try:
+        light_ids = list(bridge.lights)
+        results = {}
+        for label in ("per-call", "pooled"):
+            client = HueBridgeClient(base_url, bridge.username, timeout=GLOBAL_CONFIG["HUE_REQUEST_TIMEOUT_SECONDS"])
+            connections_before = bridge.connection_count
+            samples = []
+            started = time.perf_counter()
+            for i in range(request_count):
+                endpoint = f"/lights/{light_ids[i % len(light_ids)]}/state"
+                data = {"on": i % 2 == 0, "bri": i % 255}
+                call_started = time.perf_counter()
+                if label == "per-call":
+                    requests.put(f"{base_url}/api/{bridge.username}{endpoint}", json=data, timeout=client.timeout).json()
+                else:
+                    client.request("PUT", endpoint, data)
+                samples.append(time.perf_counter() - call_started)
+            elapsed = time.perf_counter() - started
+            mean_ms, p95_ms = _latency_summary(samples)
+            results[label] = elapsed
+            print(f"[Hue Benchmark] {label:>8}: {request_count} requests in {elapsed:.2f}s ({request_count / elapsed:,.0f}/s), "
+                  f"mean {mean_ms:.2f} ms, p95 {p95_ms:.2f} ms, {bridge.connection_count - connections_before} TCP connections.")
+            client.session.close()
+        print(f"[Hue Benchmark] Connection reuse speed-up: {results['per-call'] / results['pooled']:.2f}x.")
+
+        v2_client = HueBridgeClient(base_url, bridge.username, api_version=2)
+        v2_client.request("PUT", f"/lights/{light_ids[0]}/state", {"on": True, "bri": 127, "hue": 46920, "sat": 254})
+        v2_state = v2_client.request("GET", f"/lights/{light_ids[0]}")["state"]
+        v2_client.session.close()
+        v2_ok = v2_state["on"] is True and abs(v2_state["bri"] - 127) <= 1 and 40000 < v2_state["hue"] < 50000
+        print(f"[Hue Benchmark] v2 round trip (on, 50% brightness, blue): {v2_state} -> {'OK' if v2_ok else 'MISMATCH'}.")
+        return results["pooled"] < results["per-call"] and v2_ok
+    finally:
+        bridge.stop()
+
+def benchmark_hue_executor(light_count=20, latency_ms=150.0):
+    """
+    Gives every light of a fake bridge its own brightness and colour, then corrects half of them,
+    first one request at a time and then through HueCommandExecutor, both held to the bridge's
+    command rate. Reports requests sent, batch time, per-request latency and the busiest second.
+    """
+    bridge = FakeHueBridge(light_count=light_count, latency_seconds=latency_ms / 1000.0)
+    base_url = bridge.start()
+    client = HueBridgeClient(base_url, bridge.username)
+    rate = GLOBAL_CONFIG["HUE_COMMANDS_PER_SECOND"]
+    colors = ["red", "blue", "green", "yellow", "purple", "orange"]
+    commands = [("PUT", f"/lights/{light_id}/state", _hue_build_state(True, 10 + (index * 7) % 90, colors[index % len(colors)]))
+                for index, light_id in enumerate(bridge.lights)]
+    commands += [("PUT", f"/lights/{light_id}/state", {"bri": 200}) for light_id in list(bridge.lights)[::2]]
+    try:
+        results = {}
+        for label in ("sequential", "executor"):
+            sent_at = []
+            def send(method, endpoint, data):
+                sent_at.append(time.perf_counter())
+                return client.request(method, endpoint, data)
+            if label == "sequential":
+                bucket = TokenBucket(rate, GLOBAL_CONFIG["HUE_COMMAND_BURST"])
+                started = time.perf_counter()
+                latencies = []
+                for method, endpoint, data in commands:
+                    call_started = time.perf_counter()
+                    bucket.acquire()
+                    send(method, endpoint, data)
+                    latencies.append(time.perf_counter() - call_started)
+                seconds = time.perf_counter() - started
+            else:
+                executor = HueCommandExecutor(send=send, commands_per_second=rate, burst=GLOBAL_CONFIG["HUE_COMMAND_BURST"],
+                                              max_workers=GLOBAL_CONFIG["HUE_MAX_PARALLEL_REQUESTS"])
+                batch = executor.run_batch(commands)
+                executor.close()
+                latencies, seconds = batch["latencies"], batch["seconds"]
+            busiest_second = max(bisect.bisect_left(sent_at, t + 1.0) - i for i, t in enumerate(sent_at))
+            mean_ms, p95_ms = _latency_summary(latencies)
+            results[label] = (seconds, busiest_second)
+            print(f"[Hue Benchmark] {label:>10}: {len(commands)} commands as {len(sent_at)} requests in {seconds:.2f}s, "
+                  f"latency incl. queueing mean {mean_ms:.0f} ms, p95 {p95_ms:.0f} ms, busiest second {busiest_second} requests.")
+        expected = {light_id: 200 if index % 2 == 0 else 0 for index, light_id in enumerate(bridge.lights)}
+        final_ok = all(light["state"]["bri"] == expected[light_id] for light_id, light in bridge.lights.items() if expected[light_id])
+        print(f"[Hue Benchmark] Fan-out speed-up: {results['sequential'][0] / results['executor'][0]:.1f}x; "
+              f"final brightness {'correct' if final_ok else 'WRONG'}.")
+        return final_ok and results["executor"][1] <= rate + GLOBAL_CONFIG["HUE_COMMAND_BURST"]
+    finally:
+        client.session.close()
+        bridge.stop()
+
+def benchmark_hue_state_cache(latency_ms=2.0):
+    """
+    Runs a scripted evening of light commands (status checks, repeated "turn on all lights", rooms,
+    a scene, lights out) against a fake bridge twice, with the state cache disabled and enabled,
+    and reports how many bridge requests the cache and delta-only writes saved.
+    """
+    evening = [
+        lambda: _hue_get_light_status(None),
+        lambda: control_smart_device("lights_on", "turn on all lights", "all"),
+        lambda: control_smart_device("lights_on", "turn on all lights", "all"),
+        lambda: control_smart_device("set_brightness", "set living room brightness to 60"),
+        lambda: control_smart_device("set_brightness", "set living room brightness to 60"),
+        lambda: control_smart_device("set_color", "set bedroom color to orange"),
+        lambda: control_smart_device("lights_on_specific", "turn on the kitchen"),
+        lambda: _hue_get_light_status("4"),
+        lambda: control_smart_device("activate_scene", "activate scene relax"),
+        lambda: _hue_get_light_status(None),
+        lambda: control_smart_device("lights_off_specific", "turn off the office"),
+        lambda: control_smart_device("lights_off", "turn off all lights", "all"),
+        lambda: control_smart_device("lights_off", "turn off all lights", "all"),
+    ]
+    saved_ttls = (hue_state_cache.ttl_seconds, hue_state_cache.catalog_ttl_seconds)
+    was_muted = getattr(_speech_local, "muted", False)
+    _speech_local.muted = True
+    counts = {}
+    try:
+        for label, ttls in (("no cache", (0, 0)), ("cache", saved_ttls)):
+            bridge = FakeHueBridge(latency_seconds=latency_ms / 1000.0)
+            client = HueBridgeClient(bridge.start(), bridge.username)
+            previous_client = use_hue_client(client)
+            hue_state_cache.ttl_seconds, hue_state_cache.catalog_ttl_seconds = ttls
+            try:
+                started = time.perf_counter()
+                for step in evening:
+                    step()
+                elapsed = time.perf_counter() - started
+                counts[label] = (bridge.request_count, {light_id: dict(light["state"]) for light_id, light in bridge.lights.items()})
+                print(f"[Hue Benchmark] {label:>8}: {len(evening)} commands -> {bridge.request_count} bridge requests in {elapsed * 1000:.0f} ms.")
+            finally:
+                use_hue_client(previous_client)
+                client.session.close()
+                bridge.stop()
+    finally:
+        hue_state_cache.ttl_seconds, hue_state_cache.catalog_ttl_seconds = saved_ttls
+        _speech_local.muted = was_muted
+    uncached, cached = counts["no cache"][0], counts["cache"][0]
+    same_result = counts["no cache"][1] == counts["cache"][1]
+    print(f"[Hue Benchmark] The cache saved {uncached - cached} of {uncached} requests ({(uncached - cached) / uncached:.0%}); "
+          f"final light state {'identical' if same_result else 'DIFFERENT'}.")
+    return same_result and cached < uncached
+
+def benchmark_hue_lookup(light_count=200, lookup_count=5000):
+    """
+    Times spoken light-name resolution for `light_count` lights, rebuilding a name map and fuzzy
+    matching on every call (the old way) against the prebuilt name index, for exact and mis-heard
+    names, then times resolving every named color.
+    """
+    rooms = ["living room", "kitchen", "bedroom", "office", "hallway", "bathroom", "garage", "porch", "nursery", "study"]
+    fixtures = ["lamp", "spotlight", "ceiling light", "strip", "floor lamp", "pendant", "sconce", "bulb", "downlight", "lantern"]
+    lights = {}
+    for number in range(1, light_count + 1):
+        name = f"{rooms[number % len(rooms)]} {fixtures[(number // len(rooms)) % len(fixtures)]} {number // 100 or ''}".strip().title()
+        lights[str(number)] = {"name": name, "state": {"on": False, "bri": 254, "hue": 0, "sat": 0}}
+    misheard = {"living": "leaving", "kitchen": "kitchin", "bedroom": "bedrum", "lamp": "lamb", "strip": "stripe", "porch": "porche"}
+    random_source = random.Random(11)
+    names = [random_source.choice(list(lights.values()))["name"] for _ in range(lookup_count)]
+    queries = {"exact": names, "mis-heard": [" ".join(misheard.get(word.lower(), word) for word in name.split()) for name in names]}
+
+    def legacy_find(light_name):
+        light_names_map = {light_data["name"].lower(): light_id for light_id, light_data in lights.items()}
+        best_match_name, score = process.extractOne(light_name.lower(), list(light_names_map.keys()))
+        return light_names_map[best_match_name] if score > GLOBAL_CONFIG["FUZZY_MATCH_THRESHOLD"] else None
+
+    previous_client = use_hue_client(SimulatedHueClient(lights, {}, {}, verbose=False))
+    try:
+        index = HueNameIndex(("lights",))
+        started = time.perf_counter()
+        index.lookup(names[0])
+        print(f"[Lookup Benchmark] Built the index for {light_count} lights in {(time.perf_counter() - started) * 1000:.1f} ms.")
+        accurate = True
+        for label, batch in queries.items():
+            legacy_count = max(1, len(batch) // 20) # The old way is slow; time a sample of it
+            started = time.perf_counter()
+            legacy_found = [legacy_find(query) for query in batch[:legacy_count]]
+            legacy_us = (time.perf_counter() - started) / legacy_count * 1e6
+            legacy_correct = sum(light_id is not None and lights[light_id]["name"] == name for light_id, name in zip(legacy_found, names))
+            started = time.perf_counter()
+            found = [index.lookup(query) for query in batch]
+            index_us = (time.perf_counter() - started) / len(batch) * 1e6
+            correct = sum(target is not None and target[2] == name for target, name in zip(found, names))
+            sampled_correct = sum(target is not None and target[2] == name for target, name in zip(found[:legacy_count], names))
+            accurate = accurate and sampled_correct >= legacy_correct
+            print(f"[Lookup Benchmark] {label:>9} names: fuzzy scan {legacy_us:,.0f} us/lookup, index {index_us:,.1f} us/lookup "
+                  f"({legacy_us / index_us:,.0f}x); intended light found by the fuzzy scan for {legacy_correct / legacy_count:.1%} "
+                  f"({legacy_correct}/{legacy_count} sampled), by the index for {correct / len(batch):.1%} ({correct}/{len(batch)}; "
+                  f"{sampled_correct}/{legacy_count} of the sample).")
+    finally:
+        use_hue_client(previous_client)
+    spoken_colors = [re.sub(r"(dark|light|medium|pale|deep|hot|lawn|sea|sky|slate|royal|steel|navajo)", r"\1 ", name).strip() for name in CSS_COLOR_HEX]
+    started = time.perf_counter()
+    resolved = sum(_hue_color_state(color) is not None for _ in range(20) for color in spoken_colors)
+    color_us = (time.perf_counter() - started) / (20 * len(spoken_colors)) * 1e6
+    print(f"[Lookup Benchmark] Colors: {resolved // 20}/{len(spoken_colors)} spoken color names resolved, {color_us:.2f} us each.")
+    if not accurate:
+        print("[Lookup Benchmark] The index found the intended light less often than the fuzzy scan.")
+    return accurate and resolved == 20 * len(spoken_colors)
+
+def benchmark_hue_group_action(light_count=50, latency_ms=2.0):
+    """
+    Switches every light of a fake bridge with `light_count` lights off and on again, once with a
+    per-light /lights/<id>/state loop and once with a single /groups/0/action, and compares the
+    number of requests and the wall-clock time each takes.
+    """
+    bridge = FakeHueBridge(light_count=light_count, latency_seconds=latency_ms / 1000.0)
+    base_url = bridge.start()
+    client = HueBridgeClient(base_url, bridge.username)
+    try:
+        results = {}
+        for label in ("per-light", "group"):
+            for on in (False, True):
+                requests_before = bridge.request_count
+                started = time.perf_counter()
+                if label == "per-light":
+                    for light_id in client.request("GET", "/lights"):
+                        client.request("PUT", f"/lights/{light_id}/state", {"on": on})
+                else:
+                    client.request("PUT", "/groups/0/action", {"on": on})
+                elapsed = time.perf_counter() - started
+                switched = all(light["state"]["on"] == on for light in bridge.lights.values())
+                results[label] = (bridge.request_count - requests_before, elapsed, switched)
+            request_count, elapsed, switched = results[label]
+            print(f"[Hue Benchmark] {label:>9}: {light_count} lights switched with {request_count} requests in {elapsed * 1000:.1f} ms "
+                  f"({'all switched' if switched else 'SOME LIGHTS MISSED'}).")
+        print(f"[Hue Benchmark] Group action speed-up: {results['per-light'][1] / results['group'][1]:.1f}x.")
+        return results["group"][0] == 1 and results["group"][2] and results["per-light"][2]
+    finally:
+        client.session.close()
+        bridge.stop()
+
+
+# --- Fake Device Hub and Load Test ---
+class FakeDeviceHub:
+    """
+    Local HTTP/1.1 stand-in for a device hub, for load-testing DeviceHubClient without hardware.
+    POST /commands takes a batch and answers 202 straight away; the devices (a SimulatedDeviceHub)
+    act after `latency_seconds`; GET /acks?client=...&wait=... long-polls for that client's
+    acknowledgements; GET /devices lists devices. Counts requests.
+    """
+    def __init__(self, devices=None, latency_seconds=0.0):
+        self.backend = SimulatedDeviceHub(devices, latency_seconds, verbose=False)
+        self.devices = self.backend.devices
+        self.request_count = 0
+        self._acks = {} # client id -> acknowledgements not yet collected
+        self._cond = threading.Condition()
+        self._server = None
+
+    def _post_ack(self, client_id, command_id, future):
+        with self._cond:
+            self._acks.setdefault(client_id, []).append(dict(future.result(), id=command_id))
+            self._cond.notify_all()
+
+    def _take_acks(self, client_id, wait_seconds):
+        deadline = time.monotonic() + wait_seconds
+        with self._cond:
+            while not self._acks.get(client_id) and time.monotonic() < deadline:
+                self._cond.wait(deadline - time.monotonic())
+            return self._acks.pop(client_id, [])
+
+    def _make_handler(self):
+        hub = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def _reply(self, status, result):
+                payload = json.dumps(result).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                with hub._cond:
+                    hub.request_count += 1
+                url = urllib.parse.urlsplit(self.path)
+                query = urllib.parse.parse_qs(url.query)
+                if url.path == "/acks":
+                    self._reply(200, {"acks": hub._take_acks(query.get("client", [""])[0], min(float(query.get("wait", ["0"])[0]), 30.0))})
+                elif url.path == "/devices":
+                    self._reply(200, hub.backend.list_devices())
+                else:
+                    self._reply(404, {"error": f"no resource {url.path}"})
+
+            def do_POST(self):
+                with hub._cond:
+                    hub.request_count += 1
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length)) if length else {}
+                if self.path != "/commands":
+                    self._reply(404, {"error": f"no resource {self.path}"})
+                    return
+                for command in body.get("commands", []):
+                    future = hub.backend.submit(command["device"], command["state"])
+                    future.add_done_callback(lambda future, client_id=body.get("client", ""), command_id=command["id"]: hub._post_ack(client_id, command_id, future))
+                self._reply(202, {"accepted": len(body.get("commands", []))})
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        """Starts serving on a free localhost port in a background thread and returns the base URL."""
+        self._server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="fake-device-hub", daemon=True).start()
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        self.backend.close()
+
+def benchmark_device_hub(command_count=2000, device_count=100, latency_ms=50.0):
+    """
+    Sends `command_count` thermostat and lock commands across `device_count` devices to a fake hub
+    whose devices take `latency_ms` to act, first one command per request and then batched. Reports
+    throughput and acknowledgement latency, and checks every command was acknowledged and each
+    device ended in the state of its last command.
+    """
+    devices = {}
+    for number in range(device_count):
+        if number % 2:
+            devices[f"lock_{number}"] = {"type": "lock", "name": f"Lock {number}", "state": {"locked": False}}
+        else:
+            devices[f"thermostat_{number}"] = {"type": "thermostat", "name": f"Thermostat {number}", "state": {"target": 20.0, "mode": "heat"}}
+    device_ids = list(devices)
+    commands = []
+    for i in range(command_count):
+        device_id = device_ids[i % device_count]
+        commands.append((device_id, {"locked": i % 3 != 0} if device_id.startswith("lock") else {"target": 16.0 + i % 10}))
+    expected = {device_id: state for device_id, state in commands} # Last command per device wins
+
+    results = {}
+    for label, window_seconds, max_batch in (("one per request", 0.0, 1), ("batched", GLOBAL_CONFIG["DEVICE_BATCH_WINDOW_MS"] / 1000.0, 200)):
+        hub = FakeDeviceHub(devices, latency_seconds=latency_ms / 1000.0)
+        client = DeviceHubClient(hub.start(), batch_window_seconds=window_seconds, max_batch=max_batch)
+        latencies = []
+        try:
+            started = time.perf_counter()
+            futures = []
+            for device_id, state in commands:
+                submitted = time.perf_counter()
+                future = client.submit(device_id, state)
+                future.add_done_callback(lambda _, submitted=submitted: latencies.append(time.perf_counter() - submitted))
+                futures.append(future)
+            done, not_done = concurrent.futures.wait(futures, timeout=60)
+            elapsed = time.perf_counter() - started
+            acked = sum(1 for future in done if future.result()["ok"])
+            final_ok = all(all(hub.devices[device_id]["state"][field] == value for field, value in state.items()) for device_id, state in expected.items())
+        finally:
+            client.close()
+            hub.stop()
+        mean_ms, p95_ms = _latency_summary(latencies) if latencies else (float("nan"), float("nan"))
+        results[label] = (elapsed, acked == command_count and not not_done and final_ok)
+        print(f"[Device Hub Benchmark] {label:>15}: {command_count} commands in {elapsed:.2f}s ({command_count / elapsed:,.0f}/s) as "
+              f"{client.batch_count} requests; ack latency mean {mean_ms:.0f} ms, p95 {p95_ms:.0f} ms "
+              f"(device {latency_ms:.0f} ms); {acked} acknowledged, final state {'OK' if final_ok else 'MISMATCH'}.")
+    print(f"[Device Hub Benchmark] Batching speed-up: {results['one per request'][0] / results['batched'][0]:.1f}x.")
+    return all(ok for _, ok in results.values()) and results["batched"][0] < results["one per request"][0]
+
+
 # 7. Music Playback Control (General - beyond Spotify) (Enhanced with basic local playback)
 current_music_thread = None # To manage playsound in a non-blocking way
 
@@ -2546,6 +7242,7 @@ def _play_music_blocking(file_path):
         print(f"[Error] Error playing local music in thread: {e}")
 
 def control_general_music_player(action_type, song_name=None):
+    """Plays local music or opens a music player. Returns True if the action was carried out."""
     global current_music_thread
     speak(f"Initiating general music playback control.")
     print(f"[General Music] Action: {action_type}, Song: {song_name}")
@@ -2554,19 +7251,19 @@ def control_general_music_player(action_type, song_name=None):
         if not PLAYSOUND_AVAILABLE:
             speak("The 'playsound' library is not installed, so I cannot play local music.")
             print("[Error] playsound not available.")
-            return
+            return False
 
         music_dir = GLOBAL_CONFIG["LOCAL_MUSIC_DIRECTORY"]
         if not os.path.isdir(music_dir):
             speak(f"My local music directory '{music_dir}' is not found. Please configure it in the GLOBAL_CONFIG.")
             print(f"[Config Error] Local music directory not found: {music_dir}")
-            return
+            return False
 
         music_files = [f for f in os.listdir(music_dir) if f.lower().endswith(('.mp3', '.wav', '.ogg'))]
         if not music_files:
             speak(f"No music files found in your configured directory: {music_dir}.")
             print(f"[Info] No music files found in {music_dir}")
-            return
+            return False
 
         # Stop any currently playing music
         if current_music_thread and current_music_thread.is_alive():
@@ -2586,6 +7283,7 @@ def control_general_music_player(action_type, song_name=None):
         current_music_thread = threading.Thread(target=_play_music_blocking, args=(file_to_play,))
         current_music_thread.start()
         speak("Music started.")
+        return True
 
     elif action_type == "open_player":
         speak("Opening your default music player. (Conceptual)")
@@ -2599,26 +7297,28 @@ def control_general_music_player(action_type, song_name=None):
             open_application("rhythmbox", "Rhythmbox", fallback_exe="vlc") # Common Linux player
         else:
             speak("I don't know how to open a music player on your operating system.")
+            return False
+        return True
 
     elif action_type == "play_specific":
         if not PLAYSOUND_AVAILABLE:
             speak("The 'playsound' library is not installed, so I cannot play specific local music.")
             print("[Error] playsound not available.")
-            return
+            return False
 
         music_dir = GLOBAL_CONFIG["LOCAL_MUSIC_DIRECTORY"]
         if not os.path.isdir(music_dir):
             speak(f"My local music directory '{music_dir}' is not found. Please configure it in the GLOBAL_CONFIG.")
             print(f"[Config Error] Local music directory not found: {music_dir}")
-            return
+            return False
 
         if not song_name:
             speak("What song would you like me to play? Say 'cancel' to abort.")
             requested_song = listen_command("Listening for song name...")
-            if requested_song == "cancel_command": return
+            if requested_song == "cancel_command": return False
             if not requested_song:
                 speak("No song name provided. Aborting.")
-                return
+                return False
             song_name = requested_song
 
         found_song_path = None
@@ -2642,12 +7342,15 @@ def control_general_music_player(action_type, song_name=None):
                 current_music_thread = threading.Thread(target=_play_music_blocking, args=(found_song_path,))
                 current_music_thread.start()
                 speak("Music started.")
+                return True
             except Exception as e:
                 speak(f"Could not play '{os.path.basename(found_song_path)}': {e}. Ensure the file is valid and playsound is correctly installed.")
                 print(f"[Error] Error playing specific local music: {e}")
+                return False
         else:
             speak(f"Sorry, I could not find a song named '{song_name}' in your music directory.")
             print(f"[Info] Song '{song_name}' not found in {music_dir}.")
+            return False
 
     elif action_type == "stop_playback":
         # playsound doesn't offer a direct stop via its API.
@@ -2657,6 +7360,520 @@ def control_general_music_player(action_type, song_name=None):
         print("[Info] Stopping local music playback (conceptual for playsound).")
         # If current_music_thread was a subprocess, you could do current_music_process.terminate() here.
         # For playsound, it's more complex.
+        return True
+    return False # Unknown action
+
+
+# --- Routines (named multi-device actions, independent steps run in parallel) ---
+def _routine_lights(step):
+    target = _hue_find_target(step["target"])
+    if target is None:
+        raise ValueError(f"no light or room named '{step['target']}'")
+    on = step.get("on", True if step.get("brightness") is not None or step.get("color") else None) # The bridge ignores brightness on a light that's off
+    return _hue_set_target(target, on, step.get("brightness"), step.get("color"))
+
+def _routine_scene(step):
+    scene = _hue_find_scene(step["scene"])
+    if scene is None:
+        raise ValueError(f"no scene named '{step['scene']}'")
+    scene_id, scene_data = scene
+    group_id = scene_data.get("group", "0")
+    return _hue_set_group(group_id, group_name=_hue_group_name(group_id), scene_id=scene_id, scene_name=scene_data["name"])
+
+def _routine_volume(step):
+    return set_cross_platform_volume(level=step.get("level"), mute=step.get("mute", False), unmute=step.get("unmute", False))
+
+def _routine_spotify(step):
+    if not sp:
+        raise RuntimeError("Spotify is not authenticated")
+    return {"play": play_spotify_music, "pause": pause_spotify_music, "next": next_spotify_song, "previous": previous_spotify_song}[step["command"]]()
+
+def _routine_music(step):
+    return control_general_music_player(step["command"])
+
+def _routine_thermostat(step):
+    return _set_devices("thermostat", {"target": step["temperature"]})
+
+def _routine_locks(step):
+    return _set_devices("lock", {"locked": step.get("locked", True)})
+
+def _routine_wait(step):
+    time.sleep(step["seconds"])
+
+# Step "action" -> function(step). A step fails if its function raises or returns False.
+ROUTINE_STEP_RUNNERS = {
+    "lights": _routine_lights,
+    "scene": _routine_scene,
+    "volume": _routine_volume,
+    "spotify": _routine_spotify,
+    "music": _routine_music,
+    "thermostat": _routine_thermostat,
+    "locks": _routine_locks,
+    "wait": _routine_wait,
+}
+
+def _routine_plan(steps, runners):
+    """Checks a routine's steps and returns them by id. Raises ValueError for unknown actions or dependencies and for cycles."""
+    plan = {}
+    for index, step in enumerate(steps):
+        step_id = step.get("id", str(index + 1))
+        if step.get("action") not in runners:
+            raise ValueError(f"step '{step_id}' has unknown action '{step.get('action')}'")
+        plan[step_id] = step
+    for step_id, step in plan.items():
+        unknown = [dependency for dependency in step.get("after", []) if dependency not in plan]
+        if unknown:
+            raise ValueError(f"step '{step_id}' waits for unknown step(s) {unknown}")
+    remaining = {step_id: set(step.get("after", [])) for step_id, step in plan.items()}
+    while remaining:
+        ready = [step_id for step_id, dependencies in remaining.items() if not dependencies & remaining.keys()]
+        if not ready:
+            raise ValueError(f"steps {sorted(remaining)} wait for each other")
+        for step_id in ready:
+            del remaining[step_id]
+    return plan
+
+def run_routine(name, steps=None, runners=None, max_workers=None):
+    """
+    Runs a routine from GLOBAL_CONFIG["ROUTINES"] (or the given steps). Steps start as soon as the
+    steps listed in their "after" have finished, so independent steps across lights, volume and
+    Spotify run at the same time and the routine takes about as long as its slowest chain. Steps
+    report to the console only; the routine speaks once at the end. A failed step's dependents are
+    skipped. Returns {step_id: (status, seconds, detail)} plus "_total" seconds.
+    """
+    runners = runners or ROUTINE_STEP_RUNNERS
+    steps = GLOBAL_CONFIG["ROUTINES"][name] if steps is None else steps
+    try:
+        plan = _routine_plan(steps, runners)
+    except ValueError as e:
+        speak(f"The {name} routine isn't set up correctly: {e}.")
+        print(f"[Routine Error] {name}: {e}")
+        return None
+
+    def run_step(step):
+        _speech_local.muted = True # Per-step confirmations go to the console only
+        step_started = time.perf_counter()
+        try:
+            ok, detail = runners[step["action"]](step) is not False, ""
+        except Exception as e:
+            ok, detail = False, str(e)
+        return ok, time.perf_counter() - step_started, detail
+
+    results = {}
+    waiting = {step_id: set(step.get("after", [])) for step_id, step in plan.items()}
+    started = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers or len(plan) or 1, thread_name_prefix="routine") as pool:
+        running = {}
+
+        def launch_ready():
+            changed = True
+            while changed:
+                changed = False
+                for step_id, dependencies in list(waiting.items()):
+                    blocked = [dependency for dependency in dependencies if dependency in results and results[dependency][0] != "ok"]
+                    if blocked:
+                        results[step_id] = ("skipped", 0.0, f"'{blocked[0]}' did not succeed")
+                    elif dependencies <= results.keys():
+                        running[pool.submit(run_step, plan[step_id])] = step_id
+                    else:
+                        continue
+                    del waiting[step_id]
+                    changed = True
+
+        launch_ready()
+        while running:
+            done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                ok, seconds, detail = future.result()
+                results[running.pop(future)] = ("ok" if ok else "failed", seconds, detail)
+            launch_ready()
+    total = time.perf_counter() - started
+
+    for step_id, (status, seconds, detail) in results.items():
+        print(f"[Routine] {name} / {step_id}: {status} in {seconds:.2f}s{f' ({detail})' if detail else ''}")
+    step_seconds = sum(seconds for _, seconds, _ in results.values())
+    print(f"[Routine] {name}: {len(results)} steps in {total:.2f}s (steps add up to {step_seconds:.2f}s).")
+    problems = [step_id for step_id, (status, _, _) in results.items() if status != "ok"]
+    if problems:
+        speak(f"{name.capitalize()} finished, but {', '.join(problems)} didn't work.")
+    else:
+        speak(f"{name.capitalize()} is set.")
+    results["_total"] = total
+    return results
+
+def handle_routine_command(action, user_command_raw):
+    """Voice entry point: runs a routine by name ("movie mode", "run routine good night") or lists them."""
+    routines = GLOBAL_CONFIG["ROUTINES"]
+    if action["action"] == "list":
+        if routines:
+            speak(f"Your routines are: {', '.join(routines)}.")
+        else:
+            speak("You don't have any routines yet. Add them to ROUTINES in GLOBAL_CONFIG.")
+        return
+    routine_name = action.get("routine") or user_command_raw.replace("run routine", "").replace("start routine", "").strip()
+    if not routine_name:
+        speak("Which routine should I run? Say 'cancel' to abort.")
+        routine_name = listen_command("Listening for routine name...")
+        if routine_name == "cancel_command" or not routine_name: return
+    if routine_name not in routines:
+        match = process.extractOne(routine_name, list(routines)) if routines else None
+        if not match or match[1] <= GLOBAL_CONFIG["FUZZY_MATCH_THRESHOLD"]:
+            speak(f"I don't have a routine called '{routine_name}'.")
+            return
+        routine_name = match[0]
+    run_routine(routine_name)
+
+# Each routine can be started by just saying its name
+for _routine_name in GLOBAL_CONFIG["ROUTINES"]:
+    COMMANDS.setdefault(_routine_name, {"type": "routine", "action": "run", "routine": _routine_name})
+
+def benchmark_routine(latency_ms=150.0, volume_seconds=0.1, spotify_seconds=0.3):
+    """
+    Runs "movie mode" one step at a time and then with independent steps in parallel, against a fake
+    Hue Bridge with `latency_ms` per request. Volume and Spotify are stood in for by sleeps of
+    typical duration (a pactl call, a Web API round trip), since neither is available headless.
+    """
+    runners = dict(ROUTINE_STEP_RUNNERS, volume=lambda step: time.sleep(volume_seconds), spotify=lambda step: time.sleep(spotify_seconds))
+    steps = GLOBAL_CONFIG["ROUTINES"]["movie mode"]
+    was_muted = getattr(_speech_local, "muted", False)
+    _speech_local.muted = True
+    timings = {}
+    try:
+        for label, workers in (("one at a time", 1), ("parallel", None)):
+            bridge = FakeHueBridge(latency_seconds=latency_ms / 1000.0)
+            client = HueBridgeClient(bridge.start(), bridge.username)
+            previous_client = use_hue_client(client)
+            try:
+                hue_state_cache.get("groups"), hue_state_cache.get("lights") # Warm lookups so both runs time only the actions
+                results = run_routine("movie mode", steps=steps, runners=runners, max_workers=workers)
+                kitchen_off = all(not bridge.lights[light_id]["state"]["on"] for light_id in SIMULATED_HUE_GROUPS["2"]["lights"])
+            finally:
+                use_hue_client(previous_client)
+                client.session.close()
+                bridge.stop()
+            slowest = max(result[1] for step_id, result in results.items() if step_id != "_total")
+            timings[label] = results["_total"]
+            print(f"[Routine Benchmark] {label:>13}: {results['_total']:.2f}s (slowest step {slowest:.2f}s).")
+    finally:
+        _speech_local.muted = was_muted
+    print(f"[Routine Benchmark] Speed-up from running steps in parallel: {timings['one at a time'] / timings['parallel']:.1f}x.")
+    return kitchen_off and timings["parallel"] < timings["one at a time"]
+
+
+# --- Automation Rules (event-driven, on the alarm scheduler) ---
+def _sun_event_time(day, event, latitude=None, longitude=None):
+    """
+    Local time of sunrise or sunset on `day` (NOAA sunrise equation, good to a few minutes),
+    or None when the sun doesn't rise or set that day.
+    """
+    latitude = GLOBAL_CONFIG["LATITUDE"] if latitude is None else latitude
+    longitude = GLOBAL_CONFIG["LONGITUDE"] if longitude is None else longitude
+    j2000 = datetime.datetime(2000, 1, 1, 12) # UTC
+    mean_noon = (datetime.datetime(day.year, day.month, day.day, 12) - j2000).days - longitude / 360.0
+    anomaly = math.radians((357.5291 + 0.98560028 * mean_noon) % 360)
+    center = 1.9148 * math.sin(anomaly) + 0.02 * math.sin(2 * anomaly) + 0.0003 * math.sin(3 * anomaly)
+    ecliptic_longitude = math.radians((math.degrees(anomaly) + center + 180 + 102.9372) % 360)
+    transit = mean_noon + 0.0053 * math.sin(anomaly) - 0.0069 * math.sin(2 * ecliptic_longitude)
+    declination = math.asin(math.sin(ecliptic_longitude) * math.sin(math.radians(23.4397)))
+    lat = math.radians(latitude)
+    cos_hour_angle = (math.sin(math.radians(-0.833)) - math.sin(lat) * math.sin(declination)) / (math.cos(lat) * math.cos(declination))
+    if not -1.0 <= cos_hour_angle <= 1.0:
+        return None # Midnight sun or polar night
+    hour_angle = math.degrees(math.acos(cos_hour_angle))
+    moment = j2000 + datetime.timedelta(days=transit + (hour_angle if event == "sunset" else -hour_angle) / 360.0)
+    return moment.replace(tzinfo=datetime.timezone.utc).astimezone().replace(tzinfo=None)
+
+# Metric name -> reader. CPU is measured since the previous sample, so reading it never blocks.
+SYSTEM_METRIC_READERS = {
+    "cpu_percent": lambda: psutil.cpu_percent(interval=None),
+    "memory_percent": lambda: psutil.virtual_memory().percent,
+    "disk_percent": lambda: psutil.disk_usage(os.getcwd()).percent,
+}
+
+def _sample_system_metrics(metrics):
+    """Reads only the given metrics. Returns {metric: value}."""
+    return {metric: SYSTEM_METRIC_READERS[metric]() for metric in metrics}
+
+def _rule_say(step):
+    speak(step["text"])
+
+def _rule_routine(step):
+    return run_routine(step["routine"]) is not None
+
+def _rule_command(step):
+    """Runs a smart-home voice command, e.g. "turn on the desk light", as if it had been spoken."""
+    phrase = step["command"].lower()
+    prefixes = [command for command in COMMANDS if phrase.startswith(command)] # "turn on the" + a light name
+    command = max(prefixes, key=len) if prefixes else find_best_command(phrase)
+    if command is None or COMMANDS[command]["type"] != "smart_home_control":
+        raise ValueError(f"'{step['command']}' is not a smart home command")
+    control_smart_device(COMMANDS[command]["action"], phrase, COMMANDS[command].get("target"))
+
+# Rule "do" step action -> function(step): every routine action, plus say, routine and command.
+RULE_ACTION_RUNNERS = dict(ROUTINE_STEP_RUNNERS, say=_rule_say, routine=_rule_routine, command=_rule_command)
+
+def _compile_rule(spec, now):
+    """Checks a rule from AUTOMATION_RULES and returns it with its trigger kind and state. Raises ValueError (or KeyError) when it's malformed."""
+    when, steps = spec["when"], spec["do"]
+    unknown = [step.get("action") for step in steps if step.get("action") not in RULE_ACTION_RUNNERS]
+    if unknown:
+        raise ValueError(f"unknown action(s) {unknown}")
+    rule = {"name": spec["name"], "do": steps}
+    if "at" in when:
+        hour, minute = (int(part) for part in when["at"].split(":"))
+        recurrence = when.get("recurrence", "FREQ=DAILY")
+        _parse_rrule(recurrence)
+        rule.update(kind="at", entry={"datetime": now.replace(hour=hour, minute=minute, second=0, microsecond=0), "recurrence": recurrence})
+    elif "sun" in when:
+        if when["sun"] not in ("sunrise", "sunset"):
+            raise ValueError(f"'sun' must be sunrise or sunset, not '{when['sun']}'")
+        rule.update(kind="sun", event=when["sun"], offset=datetime.timedelta(minutes=when.get("offset_minutes", 0)))
+    elif "metric" in when:
+        if when["metric"] not in SYSTEM_METRIC_READERS:
+            raise ValueError(f"unknown metric '{when['metric']}'")
+        if ("above" in when) == ("below" in when):
+            raise ValueError("a metric trigger needs exactly one of 'above' or 'below'")
+        rule.update(kind="metric", metric=when["metric"], above=when.get("above"), below=when.get("below"),
+                    hold=datetime.timedelta(seconds=when.get("for_seconds", 0)), since=None, fired=False)
+    elif "calendar" in when:
+        if when["calendar"] not in ("alarm", "timer", "any"):
+            raise ValueError(f"'calendar' must be alarm, timer or any, not '{when['calendar']}'")
+        rule.update(kind="calendar", entry_type=when["calendar"], text=when.get("text", "").lower())
+    else:
+        raise ValueError("'when' needs one of at, sun, metric or calendar")
+    return rule
+
+def _next_rule_time(rule, after):
+    """Next firing time of an "at" or "sun" rule strictly after `after`, or None when there is none."""
+    if rule["kind"] == "at":
+        return next_occurrence(rule["entry"], after)
+    day = after.date() - datetime.timedelta(days=1) # A negative offset can bring tomorrow's event into today
+    for _ in range(370): # Polar night can last months
+        moment = _sun_event_time(day, rule["event"])
+        if moment is not None and moment + rule["offset"] > after:
+            return moment + rule["offset"]
+        day += datetime.timedelta(days=1)
+    return None
+
+def run_rule_actions(rule, event, runners=None):
+    """
+    Runs a rule's "do" steps in order; a failed step stops the rest. Text can use the event's
+    fields ("{value:.0f}" for a metric, "{text}" for a calendar entry). Only say steps speak; other
+    steps report to the console, so a rule firing at sunset doesn't announce every light.
+    """
+    runners = runners or RULE_ACTION_RUNNERS
+    print(f"[Automation] Rule '{rule['name']}' triggered at {event['time']:%Y-%m-%d %H:%M:%S}.")
+    was_muted = getattr(_speech_local, "muted", False)
+    try:
+        for step in rule["do"]:
+            _speech_local.muted = was_muted or step["action"] != "say"
+            try:
+                if "text" in step:
+                    step = dict(step, text=step["text"].format(**event))
+                ok, detail = runners[step["action"]](step) is not False, ""
+            except Exception as e:
+                ok, detail = False, str(e)
+            if not ok:
+                print(f"[Automation Error] Rule '{rule['name']}' step '{step['action']}' failed{f': {detail}' if detail else ''}.")
+                return False
+    finally:
+        _speech_local.muted = was_muted
+    return True
+
+class RuleEngine:
+    """
+    Runs AUTOMATION_RULES off the alarm scheduler rather than polling loops. Each time or sun rule
+    holds one scheduler trigger for its next firing; metric rules share one sampling trigger that
+    reads only the metrics they use (and isn't scheduled when none do); calendar rules are looked up
+    by entry type and by one word of their text filter when an alarm or timer fires. Work per event is
+    the rules listening for it, however many rules there are. Actions go to a small worker pool so they never hold up the scheduler.
+    """
+    def __init__(self, scheduler=None, metric_source=None, dispatch=None, sample_seconds=None):
+        self.scheduler = scheduler # None: the global alarm_scheduler when started
+        self.metric_source = metric_source or _sample_system_metrics
+        self.dispatch = dispatch or self._dispatch_to_pool # dispatch(rule, event)
+        self.sample_seconds = sample_seconds or GLOBAL_CONFIG["AUTOMATION_METRIC_SAMPLE_SECONDS"]
+        self.evaluations = 0 # Rule checks made, for the simulation
+        self._scheduler = None
+        self._rules = {} # name -> rule
+        self._metric_rules = {} # metric -> [rule]
+        self._calendar_rules = {} # "alarm"/"timer"/"any" -> {key word of the text filter ("" for none) -> [rule]}
+        self._pool = None
+
+    def start(self, rules=None):
+        """Checks and indexes the rules (GLOBAL_CONFIG["AUTOMATION_RULES"] by default) and registers their first triggers."""
+        self.stop()
+        self._scheduler = self.scheduler or alarm_scheduler
+        now = self._scheduler.clock.now()
+        for spec in GLOBAL_CONFIG["AUTOMATION_RULES"] if rules is None else rules:
+            try:
+                rule = _compile_rule(spec, now)
+            except KeyError as e:
+                print(f"[Automation Error] Skipping rule '{spec.get('name', '?')}': missing '{e.args[0]}'")
+                continue
+            except (ValueError, TypeError) as e:
+                print(f"[Automation Error] Skipping rule '{spec.get('name', '?')}': {e}")
+                continue
+            self._rules[rule["name"]] = rule
+            if rule["kind"] in ("at", "sun"):
+                self._schedule_next(rule, now)
+            elif rule["kind"] == "metric":
+                self._metric_rules.setdefault(rule["metric"], []).append(rule)
+        self._index_calendar_rules([rule for rule in self._rules.values() if rule["kind"] == "calendar"])
+        if self._metric_rules:
+            self._scheduler.schedule(("rule_metrics",), now + datetime.timedelta(seconds=self.sample_seconds), self._on_sample)
+        print(f"[Automation] {len(self._rules)} rules armed.")
+
+    def _index_calendar_rules(self, rules):
+        """
+        Files each calendar rule under one word of its text filter, the one fewest other rules use, so a
+        firing alarm or timer only checks the rules keyed by words of its own text (plus unfiltered ones).
+        """
+        word_counts = collections.Counter(word for rule in rules for word in set(re.findall(r"\w+", rule["text"])))
+        for rule in rules:
+            words = re.findall(r"\w+", rule["text"])
+            key = min(words, key=lambda word: (word_counts[word], -len(word))) if words else ""
+            self._calendar_rules.setdefault(rule["entry_type"], {}).setdefault(key, []).append(rule)
+
+    def stop(self):
+        """Cancels the engine's scheduler triggers and forgets its rules. Actions already running finish."""
+        if self._scheduler is not None:
+            self._scheduler.cancel_where(lambda key: key[0] in ("rule", "rule_metrics"))
+        self._rules, self._metric_rules, self._calendar_rules = {}, {}, {}
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
+
+    def _dispatch_to_pool(self, rule, event):
+        if self._pool is None:
+            self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=2, thread_name_prefix="rule")
+        self._pool.submit(run_rule_actions, rule, event)
+
+    def _schedule_next(self, rule, after):
+        due = _next_rule_time(rule, after)
+        if due is not None:
+            self._scheduler.schedule(("rule", rule["name"]), due, self._on_timed, rule)
+
+    def _on_timed(self, key, rule):
+        if self._rules.get(rule["name"]) is not rule:
+            return # Stopped or restarted meanwhile
+        self.evaluations += 1
+        now = self._scheduler.clock.now()
+        self.dispatch(rule, {"time": now})
+        self._schedule_next(rule, now)
+
+    def _on_sample(self, key, payload):
+        metric_rules = self._metric_rules
+        if not metric_rules:
+            return
+        now = self._scheduler.clock.now()
+        try:
+            values = self.metric_source(list(metric_rules))
+        except Exception as e:
+            print(f"[Automation Error] Could not read system metrics: {e}")
+            values = {}
+        for metric, rules in metric_rules.items():
+            value = values.get(metric)
+            if value is None:
+                continue
+            for rule in rules:
+                self.evaluations += 1
+                if (rule["above"] is not None and value > rule["above"]) or (rule["below"] is not None and value < rule["below"]):
+                    if rule["since"] is None:
+                        rule["since"] = now
+                    if not rule["fired"] and now - rule["since"] >= rule["hold"]:
+                        rule["fired"] = True # Once per excursion; re-armed when the value comes back
+                        self.dispatch(rule, {"time": now, "metric": metric, "value": value})
+                else:
+                    rule["since"], rule["fired"] = None, False
+        if metric_rules is self._metric_rules:
+            self._scheduler.schedule(("rule_metrics",), now + datetime.timedelta(seconds=self.sample_seconds), self._on_sample)
+
+    def publish_calendar(self, entry, occurrence):
+        """Called when a timer or alarm fires; runs the calendar rules for its type whose text filter it matches."""
+        text = entry['text'].lower()
+        keys = [""] + list(dict.fromkeys(re.findall(r"\w+", text)))
+        for entry_type in (entry['type'], "any"):
+            by_word = self._calendar_rules.get(entry_type)
+            if not by_word:
+                continue
+            for key in keys:
+                for rule in by_word.get(key, ()):
+                    self.evaluations += 1
+                    if rule["text"] in text:
+                        self.dispatch(rule, {"time": occurrence, "type": entry['type'], "text": entry['text']})
+
+rule_engine = RuleEngine()
+
+def simulate_automation_rules(days=3, idle_rules=1000, sample_seconds=10):
+    """
+    Runs `days` of automation rules on a simulated clock: a sunset rule, a weekday 07:00 rule, a CPU
+    rule fed a synthetic load trace (a 5-minute spike and a 30-second blip), a wake-up alarm rule,
+    and `idle_rules` timer rules, each waiting for its own timer ("idle 7"). Every day an alarm and
+    two timers fire: one that a single idle rule is waiting for, and one no rule mentions. Checks
+    that each rule fired exactly when expected and that rule evaluations track the events fired,
+    not the number of rules.
+    """
+    start = datetime.datetime(2025, 6, 2, 0, 0) # A Monday
+    until = start + datetime.timedelta(days=days)
+    spike = start + datetime.timedelta(days=1, hours=10)
+    blip = start + datetime.timedelta(days=2, hours=15)
+    clock = SimulatedClock(start)
+    scheduler = AlarmScheduler(clock)
+
+    def cpu_trace(metrics):
+        now = clock.now()
+        busy = spike <= now < spike + datetime.timedelta(minutes=5) or blip <= now < blip + datetime.timedelta(seconds=30)
+        return {"cpu_percent": 95.0 if busy else 20.0}
+
+    say = [{"action": "say", "text": "rule fired"}]
+    rules = [
+        {"name": "lamp at sunset", "when": {"sun": "sunset"}, "do": say},
+        {"name": "weekday lights", "when": {"at": "07:00", "recurrence": "FREQ=WEEKLY;BYDAY=MO,TU,WE,TH,FR"}, "do": say},
+        {"name": "high cpu", "when": {"metric": "cpu_percent", "above": 90, "for_seconds": 60}, "do": say},
+        {"name": "wake-up light", "when": {"calendar": "alarm", "text": "wake"}, "do": say},
+    ] + [{"name": f"idle {i}", "when": {"calendar": "timer", "text": f"idle {i}"}, "do": say} for i in range(idle_rules)]
+
+    expected = [(start + datetime.timedelta(days=d, hours=7), "weekday lights") for d in range(days) if (start + datetime.timedelta(days=d)).weekday() < 5]
+    expected += [(start + datetime.timedelta(days=d, hours=6, minutes=30), "wake-up light") for d in range(days)]
+    expected += [(start + datetime.timedelta(days=d, hours=12), f"idle {d}") for d in range(days)]
+    expected.append((spike + datetime.timedelta(seconds=60), "high cpu"))
+    for d in range(-1, days + 1):
+        sunset = _sun_event_time(start.date() + datetime.timedelta(days=d), "sunset")
+        if sunset is not None and start < sunset < until:
+            expected.append((sunset, "lamp at sunset"))
+    expected.sort()
+
+    fired, events = [], collections.Counter()
+    engine = RuleEngine(scheduler, metric_source=cpu_trace, dispatch=lambda rule, event: fired.append((clock.now(), rule["name"])), sample_seconds=sample_seconds)
+    scheduler.trace = lambda key, due, fired_at: events.update([key[0]])
+    calendar_entries = [(datetime.timedelta(hours=6, minutes=30), "alarm", "Wake up"), (datetime.timedelta(hours=12), "timer", "Idle {day}"),
+                        (datetime.timedelta(hours=16), "timer", "Tea")]
+    for d in range(days):
+        for offset, entry_type, text in calendar_entries:
+            due = start + datetime.timedelta(days=d) + offset
+            entry = {"type": entry_type, "text": text.format(day=d)}
+            scheduler.schedule(("calendar", d, text), due, lambda key, payload: engine.publish_calendar(*payload), (entry, due))
+    engine.start(rules)
+    wall_seconds = _run_scheduler_simulation(scheduler, until, scheduler.run)
+    engine.stop()
+
+    # One check per timed firing and per sample for the single CPU rule; each alarm and "idle" timer
+    # checks only the one rule filed under a word of its text, and the "Tea" timer checks none
+    expected_evaluations = events["rule"] + events["rule_metrics"] + 2 * days
+    polling_evaluations = len(rules) * events["rule_metrics"]
+    problems = []
+    if sorted(fired) != expected:
+        problems.append(f"rules fired {sorted(fired)}, expected {expected}")
+    if engine.evaluations != expected_evaluations:
+        problems.append(f"{engine.evaluations} rule evaluations, expected {expected_evaluations}")
+    print(f"[Automation Simulation] {days} simulated days, {len(rules)} rules, {sum(events.values()) - 1} scheduler events in {wall_seconds:.2f}s of wall time.")
+    print(f"[Automation Simulation] {engine.evaluations:,} rule evaluations; checking every rule on every {sample_seconds}s tick would take {polling_evaluations:,}.")
+    for problem in problems:
+        print(f"[Automation Simulation] FAILED: {problem}")
+    if not problems:
+        print(f"[Automation Simulation] All {len(fired)} rule firings happened once, at their due time.")
+    return not problems
 
 
 # --- Main Logic ---
@@ -2677,6 +7894,12 @@ def main():
     # Start the alarm/timer checking thread
     alarm_check_thread = threading.Thread(target=check_alarms_and_timers, daemon=True)
     alarm_check_thread.start()
+    rule_engine.start() # Automation rules run on the same scheduler thread
+
+    # Pick up notes and calendar changes made by other processes (a second instance, the CLI tools) right away
+    store_watcher.watch(GLOBAL_CONFIG["MEMORY_FILE"], _on_memory_file_changed)
+    store_watcher.watch(GLOBAL_CONFIG["CALENDAR_FILE"], _on_calendar_file_changed)
+    store_watcher.start()
 
     try:
         while True:
@@ -2878,6 +8101,14 @@ def main():
                         read_memory()
                     elif memory_action == "summarize":
                         read_memory(summarize=True)
+                    elif memory_action == "summarize_category":
+                        speak(f"Which category of notes would you like {GLOBAL_CONFIG['JARVIS_NAME']} to summarize? Say 'cancel' to abort.")
+                        category_to_summarize = listen_command(prompt="Listening for category...")
+                        if category_to_summarize == "cancel_command": continue
+                        if category_to_summarize:
+                            read_memory(category=category_to_summarize, summarize=True)
+                        else:
+                            speak(f"No category provided. {GLOBAL_CONFIG['JARVIS_NAME']} cannot summarize notes without a category.")
                     elif memory_action == "delete":
                         forget_note() # Will prompt for ID/keyword
                     elif memory_action == "clear_all":
@@ -2944,6 +8175,9 @@ def main():
                     # Pass the raw command for more complex parsing within the smart home function
                     control_smart_device(smart_home_action, user_command_raw, action.get("target"))
                 
+                elif action_type == "routine":
+                    handle_routine_command(action, user_command_raw)
+
                 elif action_type == "general_music_control":
                     music_action = action["action"]
                     if music_action == "play_specific":
@@ -2961,10 +8195,88 @@ def main():
                 speak(f"I didn't recognize '{user_command_raw}' specifically. Let {GLOBAL_CONFIG['JARVIS_NAME']} try asking Gemini.")
                 ask_gemini(user_command_raw)
     finally:
+        rule_engine.stop()
         stop_alarm_timer_thread() # Ensure the background thread is stopped on exit
+        store_watcher.stop()
+        persistence_writer.close() # Write out any changes still waiting in the write-behind queue
+
+def parse_command_line_args():
+    """Command-line entry points for maintenance tasks. With no arguments, Jarvis starts normally."""
+    parser = argparse.ArgumentParser(description=f"{GLOBAL_CONFIG['JARVIS_NAME']} voice assistant")
+    parser.add_argument("--import-notes", metavar="PATH", help="Bulk import notes from a .jsonl, .csv or legacy .txt file")
+    parser.add_argument("--export-notes", metavar="PATH", help="Export all notes to a .jsonl or .csv file")
+    parser.add_argument("--notes-format", choices=["jsonl", "csv", "legacy"], help="Override the format detected from the file extension")
+    parser.add_argument("--benchmark-import", type=int, metavar="N", help="Time a bulk import of N generated notes")
+    parser.add_argument("--benchmark-memory-index", type=int, metavar="N", help="Measure memory use and category-listing latency for N notes")
+    parser.add_argument("--import-ics", metavar="PATH", help="Import events from an iCalendar (.ics) file into the calendar")
+    parser.add_argument("--export-ics", metavar="PATH", help="Export the calendar to an iCalendar (.ics) file")
+    parser.add_argument("--benchmark-ics", type=int, metavar="N", help="Measure .ics import/export throughput on N generated events")
+    parser.add_argument("--simulate-week", action="store_true", help="Run a week of alarms and timers on a simulated clock and check when they fire")
+    parser.add_argument("--simulate-calendar-merge", action="store_true", help="Check that two processes saving the calendar at once both keep their entries")
+    parser.add_argument("--load-test-scheduler", type=int, metavar="N", help="Schedule N timers on a simulated clock and check firing order and latency")
+    parser.add_argument("--benchmark-datetime-parser", type=int, metavar="N", help="Measure date/time parser accuracy and speed on N generated phrases")
+    parser.add_argument("--benchmark-hue", type=int, metavar="N", help="Compare pooled and per-call Hue Bridge requests over N calls to a local fake bridge")
+    parser.add_argument("--benchmark-hue-groups", type=int, metavar="N", help="Compare switching N lights one by one with a single group action on a local fake bridge")
+    parser.add_argument("--benchmark-hue-executor", type=int, metavar="N", help="Compare sequential and fanned-out, rate-limited per-light updates for N lights on a local fake bridge")
+    parser.add_argument("--benchmark-hue-cache", action="store_true", help="Count the Hue Bridge requests a scripted evening makes with and without the state cache")
+    parser.add_argument("--benchmark-hue-lookup", type=int, metavar="N", help="Time light-name and color resolution for N lights, fuzzy scan vs prebuilt index")
+    parser.add_argument("--benchmark-routine", action="store_true", help="Time the movie mode routine with steps one at a time and in parallel")
+    parser.add_argument("--benchmark-device-hub", type=int, metavar="N", help="Load-test N thermostat and lock commands against a local fake device hub, unbatched vs batched")
+    parser.add_argument("--benchmark-volume", type=int, metavar="N", help="Time N relative volume changes against a fake sound server, pactl per change vs the cached backend")
+    parser.add_argument("--benchmark-close", type=int, metavar="N", help="Time closing an app with N helper processes, one at a time vs all at once")
+    parser.add_argument("--benchmark-volume-ramp", type=int, metavar="N", help="Time N volume fades and a duck/restore of a music stream against a fake sound server")
+    parser.add_argument("--simulate-automation", action="store_true", help="Run three days of automation rules on a simulated clock and count rule evaluations")
+    return parser.parse_args()
 
 # Entry point of the script
 if __name__ == "__main__":
-    main()
+    cli_args = parse_command_line_args()
+    if cli_args.import_notes:
+        import_memory_notes(cli_args.import_notes, fmt=cli_args.notes_format)
+    elif cli_args.export_notes:
+        export_memory_notes(cli_args.export_notes, fmt=cli_args.notes_format)
+    elif cli_args.benchmark_import:
+        benchmark_memory_import(cli_args.benchmark_import)
+    elif cli_args.benchmark_memory_index:
+        benchmark_memory_index(cli_args.benchmark_memory_index)
+    elif cli_args.import_ics:
+        import_calendar_ics(cli_args.import_ics)
+    elif cli_args.export_ics:
+        export_calendar_ics(cli_args.export_ics)
+    elif cli_args.benchmark_ics:
+        benchmark_calendar_ics(cli_args.benchmark_ics)
+    elif cli_args.simulate_week:
+        simulate_calendar_week()
+    elif cli_args.simulate_calendar_merge:
+        simulate_calendar_merge()
+    elif cli_args.load_test_scheduler:
+        load_test_scheduler(cli_args.load_test_scheduler)
+    elif cli_args.benchmark_datetime_parser:
+        benchmark_datetime_parser(cli_args.benchmark_datetime_parser)
+    elif cli_args.benchmark_hue:
+        benchmark_hue_client(cli_args.benchmark_hue)
+    elif cli_args.benchmark_hue_groups:
+        benchmark_hue_group_action(cli_args.benchmark_hue_groups)
+    elif cli_args.benchmark_hue_executor:
+        benchmark_hue_executor(cli_args.benchmark_hue_executor)
+    elif cli_args.benchmark_hue_cache:
+        benchmark_hue_state_cache()
+    elif cli_args.benchmark_hue_lookup:
+        benchmark_hue_lookup(cli_args.benchmark_hue_lookup)
+    elif cli_args.benchmark_routine:
+        benchmark_routine()
+    elif cli_args.benchmark_device_hub:
+        benchmark_device_hub(cli_args.benchmark_device_hub)
+    elif cli_args.benchmark_volume:
+        benchmark_volume_backend(cli_args.benchmark_volume)
+    elif cli_args.benchmark_volume_ramp:
+        benchmark_volume_ramp(cli_args.benchmark_volume_ramp)
+    elif cli_args.benchmark_close:
+        benchmark_close_application(cli_args.benchmark_close)
+    elif cli_args.simulate_automation:
+        simulate_automation_rules()
+    else:
+        main()
+    persistence_writer.close()
 
 # This script is designed to be run as a standalone application.
\ No newline at end of file